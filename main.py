@@ -8,7 +8,7 @@
 import logging
 import sys
 from datetime import datetime, timedelta, time
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Iterator, Tuple
 from pathlib import Path
 import sqlite3
 import json
@@ -18,20 +18,48 @@ import zipfile
 import shutil
 import hashlib
 import asyncio
+import base64
+import zlib
 import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 from fastapi import FastAPI, HTTPException, status, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field, field_validator
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, HTMLResponse, Response
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, field_validator, ValidationError
 import uvicorn
 
 # v1.4.5新增: 緊急功能相關套件
 import qrcode
 from io import BytesIO
 
+from services.backup_service import SQLiteBackupEngine, apply_retention
+from services.zip_stream import ZipStreamWriter
+from services.backup_verify import verify_archive
+from services.backup_chain import BackupChain, BackupChainError
+from services.backup_cache import BackupArtifactCache, DataVersionMonitor
+from services.columnar_export import export_columnar, ColumnarExportError, NUMPY_AVAILABLE
+from services.export_worker import ExportWorkerPool, ExportJobError, ExportQueueFull
+from services.read_cache import TableVersions, TrackingConnection, ReadCache
+from services.event_bus import EventBus, EventBusFull, TOPICS as EVENT_TOPICS
+from services.idempotency import (
+    IdempotencyStore, IdempotencyMiddleware, request_fingerprint,
+    NEW as IDEMPOTENCY_NEW, REPLAY as IDEMPOTENCY_REPLAY, IN_PROGRESS as IDEMPOTENCY_IN_PROGRESS,
+    UNKNOWN as IDEMPOTENCY_UNKNOWN
+)
+from services.static_assets import StaticAssetStore, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from services.admission import (
+    AdmissionController, AdmissionMiddleware, PriorityClass, CRITICAL, INTERACTIVE, BULK
+)
+from services.fountain_code import (
+    FountainEncoder, FountainDecoder, FountainError, estimate_throughput, parse_frame
+)
+
 
 # ============================================================================
 # 日誌配置
@@ -90,6 +118,25 @@ class Config:
     DATABASE_PATH = "medical_inventory.db"
     TEMPLATES_PATH = "templates"
 
+    # 緊急備份產物快取目錄 (依資料版本重用)
+    BACKUP_CACHE_DIR: str = os.getenv("MIRS_BACKUP_CACHE_DIR", "exports/cache")
+
+    # ========== 排程備份 / 增量備份鏈 ==========
+    # 備份目標目錄 (可指向掛載的 USB 隨身碟，例如 /media/usb/mirs-backups)
+    BACKUP_TARGET_DIR: str = os.getenv("MIRS_BACKUP_TARGET", "backups")
+    BACKUP_CHAIN_DIR: str = os.getenv("MIRS_BACKUP_CHAIN_DIR", os.path.join(BACKUP_TARGET_DIR, "chain"))
+    # 同一基底之後累積超過此數量的差異即重建基底
+    BACKUP_CHAIN_MAX_DELTAS: int = int(os.getenv("MIRS_BACKUP_CHAIN_MAX_DELTAS", "24"))
+    # 增量備份間隔 (分鐘) 與每日完整備份時間
+    BACKUP_INCREMENTAL_INTERVAL_MINUTES: int = int(os.getenv("MIRS_BACKUP_INTERVAL_MINUTES", "60"))
+    BACKUP_FULL_TIME = time(3, 0)
+    # 排程備份 I/O 節流：每段複製頁數與每段之後暫停秒數
+    BACKUP_THROTTLE_PAGES: int = int(os.getenv("MIRS_BACKUP_THROTTLE_PAGES", "64"))
+    BACKUP_THROTTLE_SLEEP: float = float(os.getenv("MIRS_BACKUP_THROTTLE_SLEEP", "0.02"))
+    # 輪替：保留的完整備份 (基底) 數量與備份總大小上限
+    BACKUP_KEEP_FULL: int = int(os.getenv("MIRS_BACKUP_KEEP_FULL", "7"))
+    BACKUP_MAX_BYTES: int = int(os.getenv("MIRS_BACKUP_MAX_BYTES", str(2 * 1024 ** 3)))
+
     # ========== 站點配置 (三層結構) ==========
     # TYPE: 決定載入的資料庫 Template
     STATION_TYPE: str = os.getenv("MIRS_STATION_TYPE", "BORP")
@@ -134,6 +181,82 @@ class Config:
     # 血型列表
     BLOOD_TYPES = ['A+', 'A-', 'B+', 'B-', 'O+', 'O-', 'AB+', 'AB-']
 
+    # ========== 同步封包優先序 (數字越小越先送出) ==========
+    # 頻寬受限時 (衛星、無人機中繼) 血袋、管制藥與緊急領用優先，設備檢查最後
+    SYNC_TABLE_PRIORITY = {
+        'blood_events': 0,
+        'emergency_blood_bags': 0,
+        'dispense_records': 1,
+        'inventory_events': 2,
+        'surgery_records': 3,
+        'items': 4,
+        'equipment_checks': 9
+    }
+    # 管制藥品的庫存事件視同領用記錄的優先序
+    SYNC_CONTROLLED_DRUG_PRIORITY = 1
+
+    # 資料列版本來源 (差異查詢): (資料表, 實體, 鍵運算式, 是否為主檔)
+    # 主檔刪除時標記實體已刪除；明細 (庫存事件) 只更新所屬實體的版本
+    ROW_VERSION_SOURCES = [
+        ('items', 'item', '{row}.item_code', True),
+        ('inventory_events', 'item', '{row}.item_code', False),
+        ('medicines', 'medicine', '{row}.medicine_code', True),
+        ('blood_inventory', 'blood', "{row}.blood_type || '|' || {row}.station_id", True),
+        ('equipment', 'equipment', '{row}.id', True),
+        ('dispense_records', 'dispense', 'CAST({row}.id AS TEXT)', True),
+        # 保留量變動影響可用庫存 (代碼可能為物品或藥品)
+        ('stock_reservations', 'item', '{row}.item_code', False),
+    ]
+
+    # CSV 匯出每頁筆數 (串流匯出記憶體用量只與此值有關)
+    EXPORT_PAGE_SIZE: int = 500
+    # 匯出壓縮執行緒數
+    EXPORT_WORKERS: int = int(os.getenv("MIRS_EXPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+    # 匯出工作子行程數 (0 = 在執行緒中執行) 與排隊上限
+    EXPORT_PROCESS_WORKERS: int = int(os.getenv("MIRS_EXPORT_PROCESS_WORKERS", str(min(2, os.cpu_count() or 1))))
+    EXPORT_QUEUE_MAX: int = int(os.getenv("MIRS_EXPORT_QUEUE_MAX", "16"))
+    # 讀取快取記憶體上限 (高頻查詢端點的回應快取)
+    READ_CACHE_MAX_BYTES: int = int(os.getenv("MIRS_READ_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    # 即時推播 (SSE)：每個連線的緩衝訊息上限、連線數上限、keepalive 間隔
+    EVENT_STREAM_BUFFER: int = int(os.getenv("MIRS_EVENT_STREAM_BUFFER", "100"))
+    EVENT_STREAM_MAX_CLIENTS: int = int(os.getenv("MIRS_EVENT_STREAM_MAX_CLIENTS", "50"))
+    EVENT_STREAM_KEEPALIVE_SECONDS: float = float(os.getenv("MIRS_EVENT_STREAM_KEEPALIVE_SECONDS", "15"))
+    # 准入控制：各優先等級同時執行上限 (critical 臨床寫入 / interactive 一般 / bulk 匯出備份同步)
+    ADMISSION_CRITICAL_CONCURRENCY: int = int(os.getenv("MIRS_ADMISSION_CRITICAL_CONCURRENCY", "16"))
+    ADMISSION_INTERACTIVE_CONCURRENCY: int = int(os.getenv("MIRS_ADMISSION_INTERACTIVE_CONCURRENCY", "8"))
+    ADMISSION_BULK_CONCURRENCY: int = int(os.getenv("MIRS_ADMISSION_BULK_CONCURRENCY", "2"))
+    ADMISSION_BULK_QUEUE: int = int(os.getenv("MIRS_ADMISSION_BULK_QUEUE", "4"))
+    # critical p99 延遲預算 (毫秒)；超過時 bulk 請求延後，延後逾時則拒絕
+    ADMISSION_CRITICAL_BUDGET_MS: float = float(os.getenv("MIRS_ADMISSION_CRITICAL_BUDGET_MS", "500"))
+    ADMISSION_BULK_DEFER_SECONDS: float = float(os.getenv("MIRS_ADMISSION_BULK_DEFER_SECONDS", "10"))
+    # Idempotency-Key 保存期限 (小時)
+    IDEMPOTENCY_TTL_HOURS: float = float(os.getenv("MIRS_IDEMPOTENCY_TTL_HOURS", "24"))
+    # 離線 QR 同步：封包壓縮後大小上限 (編碼時超過則拒絕，解碼時據此檢查幀標頭) 與解壓縮後上限
+    QR_SYNC_MAX_PAYLOAD_BYTES: int = int(os.getenv("MIRS_QR_SYNC_MAX_PAYLOAD_BYTES", str(2 * 1024 * 1024)))
+    QR_SYNC_MAX_PACKAGE_BYTES: int = int(os.getenv("MIRS_QR_SYNC_MAX_PACKAGE_BYTES", str(64 * 1024 * 1024)))
+    # 待審核領用保留庫存的期限 (小時)，逾期釋放保留量；檢查逾期保留的間隔 (秒)
+    DISPENSE_RESERVATION_TTL_HOURS: float = float(os.getenv("MIRS_DISPENSE_RESERVATION_TTL_HOURS", "12"))
+    DISPENSE_RESERVATION_CHECK_SECONDS: float = float(os.getenv("MIRS_DISPENSE_RESERVATION_CHECK_SECONDS", "300"))
+    # 靜態資源：超過此大小以 mmap 映射、檢查來源檔案變更的間隔 (秒)
+    STATIC_ASSET_MMAP_THRESHOLD: int = int(os.getenv("MIRS_STATIC_ASSET_MMAP_THRESHOLD", str(1024 * 1024)))
+    STATIC_ASSET_CHECK_SECONDS: float = float(os.getenv("MIRS_STATIC_ASSET_CHECK_SECONDS", "2"))
+    # exports/ 保留政策：只清理執行期間產生的暫存檔 (目錄, 檔名樣式)，不動 exports/ 下的範例與版控檔案
+    EXPORTS_RETENTION_TARGETS: tuple = (
+        ("exports/temp", "verify_*.zip"),
+        ("exports/temp", "restore_*.db"),
+        ("exports/temp", "*.csv"),
+    )
+    EXPORTS_MAX_FILES: int = int(os.getenv("MIRS_EXPORTS_MAX_FILES", "20"))
+    EXPORTS_MAX_AGE_DAYS: float = float(os.getenv("MIRS_EXPORTS_MAX_AGE_DAYS", "7"))
+
+    # 設備警戒狀態 (醫院層彙總計數用)
+    EQUIPMENT_ALERT_STATUSES = ('UNCHECKED', 'WARNING', 'ERROR', 'CRITICAL')
+
+    # 醫院日報：血品低於此單位數列為嚴重短缺
+    BLOOD_SHORTAGE_THRESHOLD: int = int(os.getenv("MIRS_BLOOD_SHORTAGE_THRESHOLD", "5"))
+    # 醫院日報：每日結算時間 (結算前一日報告)
+    DAILY_REPORT_CLOSE_TIME = time(0, 5)
+
     # ========== Template 對應表 ==========
     TEMPLATE_MAP = {
         "HC": "template_hc.sql",
@@ -387,6 +510,27 @@ class NormalDispenseRequest(BaseModel):
     stationCode: str = Field(default="HC-000000", description="站點代碼")
 
 
+class BatchEquipmentCheckRequest(EquipmentCheckRequest):
+    """批次中的設備檢查 (含設備ID)"""
+    equipmentId: str = Field(..., description="設備ID", min_length=1)
+
+
+class BatchOperation(BaseModel):
+    """批次中的單一操作"""
+    op: str = Field(..., description="操作類型 (見 BATCH_OPERATIONS)")
+    data: Dict[str, Any] = Field(..., description="與對應單一端點相同的請求內容")
+    idempotencyKey: Optional[str] = Field(
+        None, min_length=1, max_length=200,
+        description="與單一端點共用的 Idempotency-Key；已以此鍵執行過的操作不再執行，直接回傳原結果"
+    )
+
+
+class BatchRequest(BaseModel):
+    """批次寫入請求"""
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=100, description="依序執行的操作")
+    atomic: bool = Field(True, description="true: 任一操作失敗則全部回滾; false: 只回滾失敗的操作")
+
+
 class DispenseApprovalRequest(BaseModel):
     """藥師審核請求 (用於審核 PENDING 或確認 EMERGENCY 記錄)"""
     dispenseId: int = Field(..., description="領用記錄ID", gt=0)
@@ -441,6 +585,8 @@ class SyncPackageGenerate(BaseModel):
     hospitalId: str = Field(..., description="所屬醫院ID")
     syncType: str = Field(default="DELTA", description="同步類型: DELTA (增量) / FULL (全量)")
     sinceTimestamp: Optional[str] = Field(None, description="增量同步起始時間 (ISO 8601 格式)")
+    maxBytes: Optional[int] = Field(None, ge=1024, description="單一封包大小上限 (bytes)，超過時拆成後續封包")
+    priorities: Optional[Dict[str, int]] = Field(None, description="各資料表優先序覆寫 (數字越小越優先)")
 
 
 class SyncPackageUpload(BaseModel):
@@ -465,6 +611,23 @@ class HospitalTransferCoordinate(BaseModel):
     reason: Optional[str] = Field(None, description="調撥原因")
 
 
+class QRSyncEncodeRequest(BaseModel):
+    """離線 QR Code 同步 - 編碼請求"""
+    stationId: str = Field(..., description="站點ID")
+    hospitalId: str = Field(..., description="所屬醫院ID")
+    sinceTimestamp: Optional[str] = Field(None, description="增量同步起始時間 (ISO 8601 格式)")
+    blockSize: int = Field(default=400, ge=64, le=1024, description="每幀承載的區塊大小 (bytes)")
+    redundancy: float = Field(default=2.0, ge=1.2, le=5.0, description="產生幀數相對區塊數的倍率")
+    fps: float = Field(default=5.0, gt=0, le=30, description="動畫每秒幀數")
+    format: str = Field(default="json", description="輸出格式: json (幀清單) / html (動畫播放頁)")
+
+
+class QRSyncDecodeRequest(BaseModel):
+    """離線 QR Code 同步 - 解碼請求 (可分批送入掃到的幀)"""
+    frames: List[str] = Field(..., description="掃描到的幀內容 (任意順序)", min_length=1)
+    apply: bool = Field(default=False, description="還原完成後是否直接匯入")
+
+
 # ============================================================================
 # 資料庫管理器
 # ============================================================================
@@ -474,12 +637,15 @@ class DatabaseManager:
     
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # 各資料表資料版本 (經由本管理器連線的寫入，提交時自動遞增)
+        self.table_versions = TableVersions()
         logger.info(f"初始化資料庫: {db_path}")
         self.init_database()
     
     def get_connection(self) -> sqlite3.Connection:
-        """取得資料庫連接"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        """取得資料庫連接 (提交時遞增所寫入資料表的版本)"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=TrackingConnection)
+        conn.track(self.table_versions)
         conn.row_factory = sqlite3.Row
         return conn
     
@@ -717,6 +883,27 @@ class DatabaseManager:
                 ON dispense_records(medicine_code, created_at DESC)
             """)
 
+            # 待審核領用的庫存保留 (每筆 PENDING 領用一列；審核時轉為消耗，逾期釋放)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS stock_reservations (
+                    dispense_id INTEGER PRIMARY KEY,
+                    item_code TEXT NOT NULL,
+                    quantity INTEGER NOT NULL CHECK(quantity > 0),
+                    status TEXT NOT NULL DEFAULT 'ACTIVE',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP NOT NULL,
+                    closed_at TIMESTAMP,
+                    FOREIGN KEY (dispense_id) REFERENCES dispense_records(id),
+                    CHECK (status IN ('ACTIVE', 'CONSUMED', 'EXPIRED'))
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_stock_reservations_expiry
+                ON stock_reservations(expires_at)
+                WHERE status = 'ACTIVE'
+            """)
+            self._init_reserved_stock(cursor)
+
             # 站點合併歷史 (v1.4.5新增 - 合併功能)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS station_merge_history (
@@ -851,6 +1038,10 @@ class DatabaseManager:
                 CREATE INDEX IF NOT EXISTS idx_surgery_records_status
                 ON surgery_records(status, record_date DESC)
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_surgery_records_export
+                ON surgery_records(record_date DESC, surgery_sequence DESC, id DESC)
+            """)
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_surgery_records_outcome
                 ON surgery_records(patient_outcome)
@@ -946,6 +1137,23 @@ class DatabaseManager:
                 )
             """)
 
+            # 同步封包游標：記錄每個封包實際送出的各表範圍 (依優先序拆包時使用)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sync_package_cursors (
+                    package_id TEXT NOT NULL,
+                    batch_id TEXT NOT NULL,
+                    batch_sequence INTEGER NOT NULL,
+                    table_name TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    first_key TEXT,
+                    last_key TEXT,
+                    rows_shipped INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (package_id, table_name),
+                    FOREIGN KEY (package_id) REFERENCES sync_packages(package_id)
+                )
+            """)
+
             # 醫院日報表(谷盺公司向中央回報用)
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS hospital_daily_reports (
@@ -971,6 +1179,131 @@ class DatabaseManager:
                 )
             """)
 
+            # ========== 醫院層跨站點彙總表 (上傳同步時增量維護) ==========
+            # 物品 × 站點 庫存
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_item_balances (
+                    station_id TEXT NOT NULL,
+                    item_code TEXT NOT NULL,
+                    quantity INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (station_id, item_code)
+                )
+            """)
+
+            # 血型 × 站點 庫存
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_blood_balances (
+                    station_id TEXT NOT NULL,
+                    blood_type TEXT NOT NULL,
+                    quantity INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (station_id, blood_type)
+                )
+            """)
+
+            # 各站點設備最新狀態 (計算警戒數增減用)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_equipment_status (
+                    station_id TEXT NOT NULL,
+                    equipment_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    last_check TIMESTAMP,
+                    PRIMARY KEY (station_id, equipment_id)
+                )
+            """)
+
+            # 站點彙總
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_station_rollups (
+                    station_id TEXT PRIMARY KEY,
+                    hospital_id TEXT NOT NULL,
+                    item_units INTEGER DEFAULT 0,
+                    blood_units INTEGER DEFAULT 0,
+                    equipment_alerts INTEGER DEFAULT 0,
+                    events_applied INTEGER DEFAULT 0,
+                    last_event_at TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # 醫院總計 (metric, key) -> value，總覽查詢固定列數
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_rollup_totals (
+                    hospital_id TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    metric_key TEXT NOT NULL DEFAULT '',
+                    value INTEGER DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (hospital_id, metric, metric_key)
+                )
+            """)
+
+            # 已計入彙總的站點事件 (避免重傳封包重複計算)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_rollup_applied (
+                    station_id TEXT NOT NULL,
+                    table_name TEXT NOT NULL,
+                    row_id TEXT NOT NULL,
+                    PRIMARY KEY (station_id, table_name, row_id)
+                ) WITHOUT ROWID
+            """)
+
+            # 醫院日報計數 (事件到達時累加，日報直接讀取)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hospital_report_counters (
+                    hospital_id TEXT NOT NULL,
+                    report_date DATE NOT NULL,
+                    metric TEXT NOT NULL,
+                    metric_key TEXT NOT NULL DEFAULT '',
+                    value INTEGER DEFAULT 0,
+                    PRIMARY KEY (hospital_id, report_date, metric, metric_key)
+                )
+            """)
+
+            # 排程備份執行記錄
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS backup_runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_type TEXT NOT NULL,
+                    trigger_type TEXT NOT NULL DEFAULT 'SCHEDULED',
+                    status TEXT NOT NULL DEFAULT 'RUNNING',
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    duration_seconds REAL,
+                    bytes INTEGER,
+                    link_seq INTEGER,
+                    target_dir TEXT,
+                    rotated_files INTEGER DEFAULT 0,
+                    error_message TEXT,
+                    CHECK(run_type IN ('FULL', 'INCREMENTAL')),
+                    CHECK(trigger_type IN ('SCHEDULED', 'MANUAL')),
+                    CHECK(status IN ('RUNNING', 'SUCCESS', 'SKIPPED', 'FAILED'))
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_backup_runs_started
+                ON backup_runs(started_at DESC)
+            """)
+
+            # 寫入請求的冪等鍵與原回應 (body 為 zlib 壓縮，created_at 為 epoch 秒)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    idempotency_key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'IN_PROGRESS',
+                    status_code INTEGER,
+                    content_type TEXT,
+                    body BLOB,
+                    created_at REAL NOT NULL,
+                    CHECK(status IN ('IN_PROGRESS', 'COMPLETED'))
+                ) WITHOUT ROWID
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created
+                ON idempotency_keys(created_at)
+            """)
+
             # 聯邦架構索引
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_stations_hospital
@@ -988,6 +1321,10 @@ class DatabaseManager:
                 CREATE INDEX IF NOT EXISTS idx_sync_packages_date
                 ON sync_packages(created_at DESC)
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_sync_cursors_batch
+                ON sync_package_cursors(batch_id, batch_sequence)
+            """)
             cursor.execute("""
                 CREATE INDEX IF NOT EXISTS idx_hospital_reports_date
                 ON hospital_daily_reports(report_date DESC)
@@ -996,8 +1333,19 @@ class DatabaseManager:
                 CREATE INDEX IF NOT EXISTS idx_hospital_reports_hospital
                 ON hospital_daily_reports(hospital_id)
             """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_hospital_item_balances_item
+                ON hospital_item_balances(item_code)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_hospital_blood_balances_type
+                ON hospital_blood_balances(blood_type)
+            """)
             # ========== 聯邦式架構結束 ==========
 
+            # 資料列版本 (差異查詢)
+            self._init_row_versions(cursor)
+
             # v2.0: 載入站點資訊到資料庫
             self._init_hospitals_and_stations(cursor)
 
@@ -1021,6 +1369,116 @@ class DatabaseManager:
         finally:
             conn.close()
     
+    def _init_row_versions(self, cursor):
+        """
+        建立全域變更序號與資料列版本表，並以觸發器維護
+
+        每次寫入 (含庫存事件) 遞增 change_seq，並將所屬實體的版本設為新序號，
+        客戶端以 since_version 查詢之後變更的資料列
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS change_seq (
+                id INTEGER PRIMARY KEY CHECK(id = 1),
+                value INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO change_seq (id, value) VALUES (1, 0)")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS row_versions (
+                entity TEXT NOT NULL,
+                entity_key TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (entity, entity_key)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_row_versions_version
+            ON row_versions(entity, version)
+        """)
+
+        next_version = "(SELECT value FROM change_seq WHERE id = 1)"
+        for table, entity, key_expr, is_master in config.ROW_VERSION_SOURCES:
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                row = 'OLD' if operation == 'DELETE' else 'NEW'
+                deleted = 1 if operation == 'DELETE' and is_master else 0
+                on_conflict = "version = excluded.version" + (", deleted = excluded.deleted" if is_master else "")
+
+                statements = [
+                    "UPDATE change_seq SET value = value + 1 WHERE id = 1;",
+                    f"""INSERT INTO row_versions (entity, entity_key, version, deleted)
+                    VALUES ('{entity}', {key_expr.format(row=row)}, {next_version}, {deleted})
+                    ON CONFLICT(entity, entity_key) DO UPDATE SET {on_conflict};"""
+                ]
+                if operation == 'UPDATE' and is_master:
+                    # 主鍵變更：舊鍵視為刪除
+                    old_key, new_key = key_expr.format(row='OLD'), key_expr.format(row='NEW')
+                    statements.append(f"""INSERT INTO row_versions (entity, entity_key, version, deleted)
+                    SELECT '{entity}', {old_key}, {next_version}, 1 WHERE {old_key} IS NOT {new_key}
+                    ON CONFLICT(entity, entity_key) DO UPDATE SET version = excluded.version, deleted = 1;""")
+
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_row_version_{table}_{operation.lower()}
+                    AFTER {operation} ON {table}
+                    BEGIN
+                        {' '.join(statements)}
+                    END
+                """)
+
+    def _init_reserved_stock(self, cursor):
+        """
+        建立各代碼保留量彙總表 (reserved_stock)，以觸發器隨 stock_reservations 維護
+
+        可用庫存 = 目前庫存 - 保留量，查詢保留量只需一次主鍵查詢；
+        升級前已存在的 PENDING 領用在此補建保留
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS reserved_stock (
+                item_code TEXT PRIMARY KEY,
+                quantity INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_reserved_stock_insert
+            AFTER INSERT ON stock_reservations
+            WHEN NEW.status = 'ACTIVE'
+            BEGIN
+                INSERT INTO reserved_stock (item_code, quantity) VALUES (NEW.item_code, NEW.quantity)
+                ON CONFLICT(item_code) DO UPDATE SET quantity = quantity + excluded.quantity;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_reserved_stock_close
+            AFTER UPDATE OF status ON stock_reservations
+            WHEN OLD.status = 'ACTIVE' AND NEW.status != 'ACTIVE'
+            BEGIN
+                UPDATE reserved_stock SET quantity = quantity - OLD.quantity WHERE item_code = OLD.item_code;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_reserved_stock_delete
+            AFTER DELETE ON stock_reservations
+            WHEN OLD.status = 'ACTIVE'
+            BEGIN
+                UPDATE reserved_stock SET quantity = quantity - OLD.quantity WHERE item_code = OLD.item_code;
+            END
+        """)
+
+        cursor.execute("""
+            INSERT INTO stock_reservations (dispense_id, item_code, quantity, expires_at)
+            SELECT dr.id, dr.medicine_code, dr.quantity, datetime('now', ?)
+            FROM dispense_records dr
+            WHERE dr.status = 'PENDING'
+              AND NOT EXISTS (SELECT 1 FROM stock_reservations sr WHERE sr.dispense_id = dr.id)
+        """, (self._reservation_ttl_modifier(),))
+        if cursor.rowcount > 0:
+            logger.info(f"✓ 已為 {cursor.rowcount} 筆待審核領用補建庫存保留")
+
+    @staticmethod
+    def _reservation_ttl_modifier() -> str:
+        """SQLite datetime() 的保留期限修飾字"""
+        return f"+{int(config.DISPENSE_RESERVATION_TTL_HOURS * 3600)} seconds"
+
     def _init_default_equipment(self, cursor):
         """初始化預設設備"""
         default_equipment = [
@@ -1205,109 +1663,100 @@ class DatabaseManager:
     def get_daily_surgery_sequence(self, record_date: str, station_id: str) -> int:
         """取得當日手術序號"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute("""
-                SELECT MAX(surgery_sequence) as max_seq
-                FROM surgery_records
-                WHERE record_date = ? AND station_id = ?
-            """, (record_date, station_id))
-            
-            result = cursor.fetchone()
-            max_seq = result['max_seq'] if result['max_seq'] else 0
-            return max_seq + 1
-            
+            return self._next_surgery_sequence(conn.cursor(), record_date, station_id)
         finally:
             conn.close()
-    
+
+    def _next_surgery_sequence(self, cursor, record_date: str, station_id: str) -> int:
+        cursor.execute("""
+            SELECT MAX(surgery_sequence) as max_seq
+            FROM surgery_records
+            WHERE record_date = ? AND station_id = ?
+        """, (record_date, station_id))
+
+        result = cursor.fetchone()
+        max_seq = result['max_seq'] if result['max_seq'] else 0
+        return max_seq + 1
+
     def create_surgery_record(self, request: SurgeryRecordRequest) -> dict:
         """建立手術記錄"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # 取得今天日期
-            record_date = datetime.now().strftime('%Y-%m-%d')
-            
-            # 取得當日手術序號
-            sequence = self.get_daily_surgery_sequence(record_date, request.stationId)
-            
-            # 生成記錄編號
-            record_number = self.generate_surgery_record_number(
-                record_date, 
-                request.patientName, 
-                sequence
+        result = self._execute_write(self._create_surgery_record, request, error_message="建立手術記錄失敗")
+        logger.info(f"手術記錄建立成功: {result['recordNumber']}")
+        return result
+
+    def _create_surgery_record(self, cursor, request: SurgeryRecordRequest) -> dict:
+        # 取得今天日期
+        record_date = datetime.now().strftime('%Y-%m-%d')
+
+        # 取得當日手術序號 (同一交易中查詢，批次內的多筆手術序號不重複)
+        sequence = self._next_surgery_sequence(cursor, record_date, request.stationId)
+
+        # 生成記錄編號
+        record_number = self.generate_surgery_record_number(
+            record_date, 
+            request.patientName, 
+            sequence
+        )
+
+        # 插入手術記錄
+        cursor.execute("""
+            INSERT INTO surgery_records (
+                record_number, record_date, patient_name, surgery_sequence,
+                surgery_type, surgeon_name, anesthesia_type, duration_minutes,
+                remarks, station_id
             )
-            
-            # 插入手術記錄
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            record_number,
+            record_date,
+            request.patientName,
+            sequence,
+            request.surgeryType,
+            request.surgeonName,
+            request.anesthesiaType,
+            request.durationMinutes,
+            request.remarks,
+            request.stationId
+        ))
+
+        surgery_id = cursor.lastrowid
+
+        # 插入耗材明細
+        for item in request.consumptions:
             cursor.execute("""
-                INSERT INTO surgery_records (
-                    record_number, record_date, patient_name, surgery_sequence,
-                    surgery_type, surgeon_name, anesthesia_type, duration_minutes,
-                    remarks, station_id
+                INSERT INTO surgery_consumptions (
+                    surgery_id, item_code, item_name, quantity, unit
+                )
+                VALUES (?, ?, ?, ?, ?)
+            """, (
+                surgery_id,
+                item.itemCode,
+                item.itemName,
+                item.quantity,
+                item.unit
+            ))
+
+            # 同時記錄庫存消耗
+            cursor.execute("""
+                INSERT INTO inventory_events (
+                    event_type, item_code, quantity, remarks, station_id
                 )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                VALUES ('CONSUME', ?, ?, ?, ?)
             """, (
-                record_number,
-                record_date,
-                request.patientName,
-                sequence,
-                request.surgeryType,
-                request.surgeonName,
-                request.anesthesiaType,
-                request.durationMinutes,
-                request.remarks,
+                item.itemCode,
+                item.quantity,
+                f"手術使用 - {record_number}",
                 request.stationId
             ))
-            
-            surgery_id = cursor.lastrowid
-            
-            # 插入耗材明細
-            for item in request.consumptions:
-                cursor.execute("""
-                    INSERT INTO surgery_consumptions (
-                        surgery_id, item_code, item_name, quantity, unit
-                    )
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    surgery_id,
-                    item.itemCode,
-                    item.itemName,
-                    item.quantity,
-                    item.unit
-                ))
-                
-                # 同時記錄庫存消耗
-                cursor.execute("""
-                    INSERT INTO inventory_events (
-                        event_type, item_code, quantity, remarks, station_id
-                    )
-                    VALUES ('CONSUME', ?, ?, ?, ?)
-                """, (
-                    item.itemCode,
-                    item.quantity,
-                    f"手術使用 - {record_number}",
-                    request.stationId
-                ))
-            
-            conn.commit()
-            logger.info(f"手術記錄建立成功: {record_number}")
-            
-            return {
-                "success": True,
-                "message": f"手術記錄 {record_number} 建立成功",
-                "recordNumber": record_number,
-                "surgeryId": surgery_id,
-                "sequence": sequence
-            }
-        
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"建立手術記錄失敗: {e}")
-            raise HTTPException(status_code=500, detail=f"建立手術記錄失敗: {str(e)}")
-        finally:
-            conn.close()
+
+        return {
+            "success": True,
+            "message": f"手術記錄 {record_number} 建立成功",
+            "recordNumber": record_number,
+            "surgeryId": surgery_id,
+            "sequence": sequence
+        }
     
     def get_surgery_records(
         self, 
@@ -1375,43 +1824,76 @@ class DatabaseManager:
         self,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None
-    ) -> str:
-        """匯出手術記錄為 CSV"""
-        records = self.get_surgery_records(start_date, end_date, limit=10000)
-        
-        # 建立 CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # 寫入標題
-        writer.writerow([
+    ) -> Iterator[bytes]:
+        """
+        串流匯出手術記錄為 CSV
+
+        以 (record_date, surgery_sequence, id) 鍵集分頁，每頁一次查回該頁耗材，
+        邊查邊輸出，無筆數上限
+        """
+        where_clauses = []
+        params = []
+
+        if start_date:
+            where_clauses.append("record_date >= ?")
+            params.append(start_date)
+
+        if end_date:
+            where_clauses.append("record_date <= ?")
+            params.append(end_date)
+
+        header = [
             '記錄編號', '日期', '病患姓名', '當日第N台',
             '手術類型', '主刀醫師', '麻醉方式', '手術時長(分)',
             '耗材代碼', '耗材名稱', '數量', '單位',
             '備註', '建立時間'
-        ])
-        
-        # 寫入資料
-        for record in records:
-            for consumption in record['consumptions']:
-                writer.writerow([
-                    record['record_number'],
-                    record['record_date'],
-                    record['patient_name'],
-                    record['surgery_sequence'],
-                    record['surgery_type'],
-                    record['surgeon_name'],
-                    record.get('anesthesia_type', ''),
-                    record.get('duration_minutes', ''),
-                    consumption['item_code'],
-                    consumption['item_name'],
-                    consumption['quantity'],
-                    consumption['unit'],
-                    record.get('remarks', ''),
-                    record['created_at']
-                ])
-        
-        return output.getvalue()
+        ]
+
+        def rows(conn: sqlite3.Connection) -> Iterator[list]:
+            cursor = conn.cursor()
+            for page in self._iter_keyset_pages(
+                cursor,
+                """
+                SELECT id, record_number, record_date, patient_name, surgery_sequence,
+                       surgery_type, surgeon_name, anesthesia_type, duration_minutes,
+                       remarks, created_at
+                FROM surgery_records
+                """,
+                where_clauses, params,
+                key_columns=('record_date', 'surgery_sequence', 'id')
+            ):
+                placeholders = ','.join('?' * len(page))
+                cursor.execute(f"""
+                    SELECT surgery_id, item_code, item_name, quantity, unit
+                    FROM surgery_consumptions
+                    WHERE surgery_id IN ({placeholders})
+                    ORDER BY id
+                """, [record['id'] for record in page])
+
+                consumptions: Dict[int, List[sqlite3.Row]] = {}
+                for c in cursor.fetchall():
+                    consumptions.setdefault(c['surgery_id'], []).append(c)
+
+                for record in page:
+                    for consumption in consumptions.get(record['id'], []):
+                        yield [
+                            record['record_number'],
+                            record['record_date'],
+                            record['patient_name'],
+                            record['surgery_sequence'],
+                            record['surgery_type'],
+                            record['surgeon_name'],
+                            record['anesthesia_type'] or '',
+                            record['duration_minutes'] if record['duration_minutes'] is not None else '',
+                            consumption['item_code'],
+                            consumption['item_name'],
+                            consumption['quantity'],
+                            consumption['unit'],
+                            record['remarks'] or '',
+                            record['created_at']
+                        ]
+
+        return self._stream_csv(header, rows)
 
     # ========== 手術記錄封存功能 (v1.4.5新增) ==========
 
@@ -1592,178 +2074,497 @@ class DatabaseManager:
         finally:
             conn.close()
     
-    def receive_item(self, request: ReceiveRequest) -> dict:
-        """進貨處理"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    # ========== 寫入操作 (可組合於同一交易) ==========
+    # _xxx(cursor, request) 只執行 SQL 不提交：單一端點經 _execute_write 各自提交，
+    # /api/batch 則將多個操作放在同一交易中
+
+    def _execute_write(self, operation, *args, error_message: str) -> dict:
+        """
+        在單一交易中執行寫入操作
+
+        Args:
+            operation: 寫入操作 (第一個參數為 cursor)
+            error_message: 非預期錯誤的日誌前綴
 
+        Returns:
+            操作的回傳值 (已提交)
+        """
+        conn = self.get_connection()
         try:
-            cursor.execute("SELECT item_name FROM items WHERE item_code = ?", (request.itemCode,))
-            item = cursor.fetchone()
-            if not item:
-                raise HTTPException(status_code=404, detail=f"物品代碼 {request.itemCode} 不存在")
-            
-            cursor.execute("""
-                INSERT INTO inventory_events 
-                (event_type, item_code, quantity, batch_number, expiry_date, remarks, station_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                'RECEIVE',
-                request.itemCode,
-                request.quantity,
-                request.batchNumber,
-                request.expiryDate,
-                request.remarks,
-                request.stationId
-            ))
-            
+            result = operation(conn.cursor(), *args)
             conn.commit()
-            logger.info(f"進貨記錄成功: {request.itemCode} +{request.quantity}")
-
-            return {
-                "success": True,
-                "message": f"物品 {item['item_name']} 進貨 {request.quantity} 已記錄"
-            }
-        
+            return result
         except HTTPException:
+            conn.rollback()
             raise
         except Exception as e:
             conn.rollback()
-            logger.error(f"進貨處理失敗: {e}")
+            logger.error(f"{error_message}: {e}")
             raise HTTPException(status_code=500, detail=str(e))
         finally:
             conn.close()
-    
-    def consume_item(self, request: ConsumeRequest) -> dict:
-        """消耗處理"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
 
-        try:
-            cursor.execute("SELECT item_name FROM items WHERE item_code = ?", (request.itemCode,))
-            item = cursor.fetchone()
-            if not item:
-                raise HTTPException(status_code=404, detail=f"物品代碼 {request.itemCode} 不存在")
-            
-            cursor.execute("""
-                SELECT SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
-                               WHEN event_type = 'CONSUME' THEN -quantity
-                               ELSE 0 END) as current_stock
-                FROM inventory_events
-                WHERE item_code = ?
-            """, (request.itemCode,))
-            
-            result = cursor.fetchone()
-            current_stock = result['current_stock'] if result['current_stock'] else 0
-            
-            if current_stock < request.quantity:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"庫存不足: 目前庫存 {current_stock},需求 {request.quantity}"
+    def receive_item(self, request: ReceiveRequest) -> dict:
+        """進貨處理"""
+        result = self._execute_write(self._receive_item, request, error_message="進貨處理失敗")
+        logger.info(f"進貨記錄成功: {request.itemCode} +{request.quantity}")
+        return result
+
+    def _receive_item(self, cursor, request: ReceiveRequest) -> dict:
+        cursor.execute("SELECT item_name FROM items WHERE item_code = ?", (request.itemCode,))
+        item = cursor.fetchone()
+        if not item:
+            raise HTTPException(status_code=404, detail=f"物品代碼 {request.itemCode} 不存在")
+
+        cursor.execute("""
+            INSERT INTO inventory_events 
+            (event_type, item_code, quantity, batch_number, expiry_date, remarks, station_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (
+            'RECEIVE',
+            request.itemCode,
+            request.quantity,
+            request.batchNumber,
+            request.expiryDate,
+            request.remarks,
+            request.stationId
+        ))
+
+        return {
+            "success": True,
+            "message": f"物品 {item['item_name']} 進貨 {request.quantity} 已記錄"
+        }
+
+    def consume_item(self, request: ConsumeRequest) -> dict:
+        """消耗處理"""
+        result = self._execute_write(self._consume_item, request, error_message="消耗處理失敗")
+        logger.info(f"消耗記錄成功: {request.itemCode} -{request.quantity}")
+        return result
+
+    def _consume_item(self, cursor, request: ConsumeRequest) -> dict:
+        cursor.execute("SELECT item_name FROM items WHERE item_code = ?", (request.itemCode,))
+        item = cursor.fetchone()
+        if not item:
+            raise HTTPException(status_code=404, detail=f"物品代碼 {request.itemCode} 不存在")
+
+        cursor.execute("""
+            SELECT SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
+                           WHEN event_type = 'CONSUME' THEN -quantity
+                           ELSE 0 END) as current_stock
+            FROM inventory_events
+            WHERE item_code = ?
+        """, (request.itemCode,))
+
+        result = cursor.fetchone()
+        current_stock = result['current_stock'] if result['current_stock'] else 0
+
+        # 依可用庫存檢查：待審核領用保留的數量不可被一般消耗取用
+        self._expire_reservations(cursor, request.itemCode)
+        reserved = self._reserved_quantity(cursor, request.itemCode)
+        if current_stock - reserved < request.quantity:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"庫存不足: 目前庫存 {current_stock},待審核保留 {reserved},"
+                    f"可用 {current_stock - reserved},需求 {request.quantity}"
                 )
-            
-            cursor.execute("""
-                INSERT INTO inventory_events 
-                (event_type, item_code, quantity, remarks, station_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                'CONSUME',
-                request.itemCode,
-                request.quantity,
-                request.purpose,
-                request.stationId
-            ))
-            
-            conn.commit()
-            logger.info(f"消耗記錄成功: {request.itemCode} -{request.quantity}")
+            )
+
+        cursor.execute("""
+            INSERT INTO inventory_events 
+            (event_type, item_code, quantity, remarks, station_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            'CONSUME',
+            request.itemCode,
+            request.quantity,
+            request.purpose,
+            request.stationId
+        ))
+
+        return {
+            "success": True,
+            "message": f"物品 {item['item_name']} 消耗 {request.quantity} 已記錄"
+        }
 
-            return {
-                "success": True,
-                "message": f"物品 {item['item_name']} 消耗 {request.quantity} 已記錄"
-            }
-        
-        except HTTPException:
-            raise
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"消耗處理失敗: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            conn.close()
-    
     def process_blood(self, action: str, request: BloodRequest) -> dict:
         """血袋處理(支援多站點)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        result = self._execute_write(self._process_blood, action, request, error_message="血袋處理失敗")
+        logger.info(f"血袋{action}記錄成功: {request.bloodType} {'+' if action=='receive' else '-'}{request.quantity}U")
+        return result
 
-        try:
-            cursor.execute(
-                "SELECT quantity FROM blood_inventory WHERE blood_type = ? AND station_id = ?",
-                (request.bloodType, request.stationId)
-            )
-            blood = cursor.fetchone()
+    def _process_blood(self, cursor, action: str, request: BloodRequest) -> dict:
+        cursor.execute(
+            "SELECT quantity FROM blood_inventory WHERE blood_type = ? AND station_id = ?",
+            (request.bloodType, request.stationId)
+        )
+        blood = cursor.fetchone()
 
-            if action == 'receive':
-                # 入庫：如果記錄不存在則新增
-                if not blood:
-                    new_quantity = request.quantity
-                    cursor.execute("""
-                        INSERT INTO blood_inventory (blood_type, quantity, station_id)
-                        VALUES (?, ?, ?)
-                    """, (request.bloodType, new_quantity, request.stationId))
-                else:
-                    current_quantity = blood['quantity']
-                    new_quantity = current_quantity + request.quantity
-                    cursor.execute("""
-                        UPDATE blood_inventory
-                        SET quantity = ?, last_updated = CURRENT_TIMESTAMP
-                        WHERE blood_type = ? AND station_id = ?
-                    """, (new_quantity, request.bloodType, request.stationId))
-                event_type = 'RECEIVE'
+        if action == 'receive':
+            # 入庫：如果記錄不存在則新增
+            if not blood:
+                new_quantity = request.quantity
+                cursor.execute("""
+                    INSERT INTO blood_inventory (blood_type, quantity, station_id)
+                    VALUES (?, ?, ?)
+                """, (request.bloodType, new_quantity, request.stationId))
             else:
-                # 出庫：記錄必須存在且庫存足夠
-                if not blood:
-                    raise HTTPException(status_code=404, detail=f"站點 {request.stationId} 無此血型 {request.bloodType}")
-
                 current_quantity = blood['quantity']
-                if current_quantity < request.quantity:
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"血袋庫存不足: 目前 {current_quantity}U,需求 {request.quantity}U"
-                    )
-                new_quantity = current_quantity - request.quantity
+                new_quantity = current_quantity + request.quantity
                 cursor.execute("""
                     UPDATE blood_inventory
                     SET quantity = ?, last_updated = CURRENT_TIMESTAMP
                     WHERE blood_type = ? AND station_id = ?
                 """, (new_quantity, request.bloodType, request.stationId))
-                event_type = 'CONSUME'
-            
+            event_type = 'RECEIVE'
+        else:
+            # 出庫：記錄必須存在且庫存足夠
+            if not blood:
+                raise HTTPException(status_code=404, detail=f"站點 {request.stationId} 無此血型 {request.bloodType}")
+
+            current_quantity = blood['quantity']
+            if current_quantity < request.quantity:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"血袋庫存不足: 目前 {current_quantity}U,需求 {request.quantity}U"
+                )
+            new_quantity = current_quantity - request.quantity
             cursor.execute("""
-                INSERT INTO blood_events 
-                (event_type, blood_type, quantity, station_id)
-                VALUES (?, ?, ?, ?)
-            """, (event_type, request.bloodType, request.quantity, request.stationId))
-            
+                UPDATE blood_inventory
+                SET quantity = ?, last_updated = CURRENT_TIMESTAMP
+                WHERE blood_type = ? AND station_id = ?
+            """, (new_quantity, request.bloodType, request.stationId))
+            event_type = 'CONSUME'
+
+        cursor.execute("""
+            INSERT INTO blood_events 
+            (event_type, blood_type, quantity, station_id)
+            VALUES (?, ?, ?, ?)
+        """, (event_type, request.bloodType, request.quantity, request.stationId))
+
+        action_text = "入庫" if action == "receive" else "出庫"
+        return {
+            "success": True,
+            "message": f"血袋 {request.bloodType} {action_text} {request.quantity}U 已記錄",
+            "newQuantity": new_quantity
+        }
+    
+    # ========== 待審核領用的庫存保留 ==========
+
+    def _reserved_quantity(self, cursor, code: str) -> int:
+        """代碼目前的保留量 (未逾期的 PENDING 領用合計)"""
+        row = cursor.execute("SELECT quantity FROM reserved_stock WHERE item_code = ?", (code,)).fetchone()
+        return row['quantity'] if row else 0
+
+    def _expire_reservations(self, cursor, code: Optional[str] = None) -> List[Dict]:
+        """
+        釋放已逾期的保留 (領用記錄仍為 PENDING，審核時改依可用庫存檢查)
+
+        Args:
+            code: 只處理此代碼；None 表示全部
+
+        Returns:
+            已釋放的保留 [{dispense_id, item_code, quantity}]
+        """
+        code_filter, params = "", []
+        if code is not None:
+            code_filter, params = "AND item_code = ?", [code]
+        cursor.execute(f"""
+            SELECT dispense_id, item_code, quantity FROM stock_reservations
+            WHERE status = 'ACTIVE' AND expires_at <= CURRENT_TIMESTAMP {code_filter}
+        """, params)
+        expired = [dict(row) for row in cursor.fetchall()]
+
+        for ids in self._chunks([r['dispense_id'] for r in expired]):
+            placeholders = ','.join('?' * len(ids))
+            cursor.execute(f"""
+                UPDATE stock_reservations
+                SET status = 'EXPIRED', closed_at = CURRENT_TIMESTAMP
+                WHERE dispense_id IN ({placeholders}) AND status = 'ACTIVE'
+            """, ids)
+            # 更新領用記錄版本，待審核清單的差異查詢可取得保留狀態變更
+            cursor.execute(f"""
+                UPDATE dispense_records SET updated_at = CURRENT_TIMESTAMP
+                WHERE id IN ({placeholders})
+            """, ids)
+        return expired
+
+    def _consume_reservation(self, cursor, dispense_id: int) -> bool:
+        """審核通過：保留轉為消耗，回傳是否有有效保留"""
+        cursor.execute("""
+            UPDATE stock_reservations
+            SET status = 'CONSUMED', closed_at = CURRENT_TIMESTAMP
+            WHERE dispense_id = ? AND status = 'ACTIVE'
+        """, (dispense_id,))
+        return cursor.rowcount == 1
+
+    def expire_dispense_reservations(self) -> List[Dict]:
+        """釋放所有已逾期的保留 (背景任務呼叫)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            expired = self._expire_reservations(cursor)
             conn.commit()
-            logger.info(f"血袋{action}記錄成功: {request.bloodType} {'+' if action=='receive' else '-'}{request.quantity}U")
-            
-            action_text = "入庫" if action == "receive" else "出庫"
-            return {
-                "success": True,
-                "message": f"血袋 {request.bloodType} {action_text} {request.quantity}U 已記錄",
-                "newQuantity": new_quantity
-            }
-        
-        except HTTPException:
+            return expired
+        except Exception:
+            conn.rollback()
             raise
-        except Exception as e:
+        finally:
+            conn.close()
+
+    def _find_dispensable(self, cursor, code: str):
+        """
+        查詢可領用的藥品/物品 (先查 medicines 表，再查 items 表)
+
+        另回傳保留量 reserved_stock 與可用庫存 available_stock (目前庫存 - 保留量)
+        """
+        cursor.execute("""
+            SELECT m.medicine_code, m.generic_name, m.brand_name, m.unit,
+                   COALESCE(m.current_stock, 0) as current_stock,
+                   COALESCE(r.quantity, 0) as reserved_stock,
+                   COALESCE(m.current_stock, 0) - COALESCE(r.quantity, 0) as available_stock
+            FROM medicines m
+            LEFT JOIN reserved_stock r ON r.item_code = m.medicine_code
+            WHERE m.medicine_code = ? AND m.is_active = 1
+        """, (code,))
+        medicine = cursor.fetchone()
+
+        # 如果不在 medicines 表，查 items 表
+        if not medicine:
+            cursor.execute("""
+                SELECT stock.*, stock.current_stock - stock.reserved_stock as available_stock
+                FROM (
+                    SELECT i.item_code as medicine_code, i.item_name as generic_name, i.item_name as brand_name, i.unit,
+                           COALESCE((SELECT SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
+                                                     WHEN event_type = 'CONSUME' THEN -quantity
+                                                     ELSE 0 END)
+                                     FROM inventory_events WHERE item_code = i.item_code), 0) as current_stock,
+                           COALESCE((SELECT quantity FROM reserved_stock WHERE item_code = i.item_code), 0) as reserved_stock
+                    FROM items i
+                    WHERE i.item_code = ?
+                ) stock
+            """, (code,))
+            medicine = cursor.fetchone()
+
+        if not medicine:
+            raise HTTPException(status_code=404, detail=f"藥品/物品代碼 {code} 不存在")
+        return medicine
+
+    def _dispense_emergency(self, cursor, request: EmergencyDispenseRequest) -> dict:
+        """
+        緊急領用：建立 EMERGENCY 記錄並立即扣庫存
+
+        緊急領用只受實際庫存限制，可動用待審核領用的保留量；
+        動用的數量以 reserved_overdrawn 回報 (並發出警示)，相關待審核領用審核時可能庫存不足
+        """
+        # 1. 檢查藥品是否存在
+        self._expire_reservations(cursor, request.medicineCode)
+        medicine = self._find_dispensable(cursor, request.medicineCode)
+        current_stock = medicine['current_stock'] or 0
+        reserved_overdrawn = min(medicine['reserved_stock'], max(0, request.quantity - max(0, medicine['available_stock'])))
+
+        # 2. 檢查庫存是否足夠
+        if current_stock < request.quantity:
+            raise HTTPException(
+                status_code=400,
+                detail=f"庫存不足！當前庫存: {current_stock} {medicine['unit']}, 需要: {request.quantity} {medicine['unit']}"
+            )
+
+        # 3. 建立緊急領用記錄
+        medicine_name = medicine['brand_name'] or medicine['generic_name']
+
+        cursor.execute("""
+            INSERT INTO dispense_records (
+                medicine_code, medicine_name, quantity, unit,
+                dispensed_by, status, emergency_reason,
+                patient_ref_id, patient_name, station_code,
+                created_at
+            ) VALUES (?, ?, ?, ?, ?, 'EMERGENCY', ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (
+            request.medicineCode,
+            medicine_name,
+            request.quantity,
+            medicine['unit'],
+            request.dispensedBy,
+            request.emergencyReason,
+            request.patientRefId,
+            request.patientName,
+            request.stationCode
+        ))
+
+        dispense_id = cursor.lastrowid
+
+        # 4. 立即記錄庫存消耗事件
+        cursor.execute("""
+            INSERT INTO inventory_events (
+                event_type, item_code, quantity, remarks, station_id, operator, timestamp
+            ) VALUES ('CONSUME', ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (
+            request.medicineCode,
+            request.quantity,
+            f"🚨 緊急領用: {request.emergencyReason}",
+            request.stationCode,
+            request.dispensedBy
+        ))
+
+        # 5. 如果是 medicines 表的藥品，更新 current_stock
+        cursor.execute("SELECT medicine_code FROM medicines WHERE medicine_code = ?", (request.medicineCode,))
+        if cursor.fetchone():
+            cursor.execute("""
+                UPDATE medicines
+                SET current_stock = current_stock - ?
+                WHERE medicine_code = ?
+            """, (request.quantity, request.medicineCode))
+
+        return {
+            "success": True,
+            "message": "緊急領用成功，已立即扣除庫存",
+            "dispense_id": dispense_id,
+            "medicine_name": medicine_name,
+            "quantity": request.quantity,
+            "unit": medicine['unit'],
+            "remaining_stock": current_stock - request.quantity,
+            "reserved_overdrawn": reserved_overdrawn,
+            "warning": "⚠️ 此為緊急領用，請藥師上班後盡快確認" + (
+                f"；已動用待審核領用保留的 {reserved_overdrawn} {medicine['unit']}，相關領用審核時可能庫存不足"
+                if reserved_overdrawn else ""
+            )
+        }
+
+    def _dispense_normal(self, cursor, request: NormalDispenseRequest) -> dict:
+        """正常領用：建立 PENDING 記錄並保留庫存 (不扣庫存，待藥師審核)"""
+        self._expire_reservations(cursor, request.medicineCode)
+        medicine = self._find_dispensable(cursor, request.medicineCode)
+        available_stock = medicine['available_stock']
+
+        # 依可用庫存 (扣除其他待審核領用的保留量) 檢查
+        if available_stock < request.quantity:
+            raise HTTPException(
+                status_code=400,
+                detail=(
+                    f"可用庫存不足！當前庫存: {medicine['current_stock']} {medicine['unit']}, "
+                    f"待審核保留: {medicine['reserved_stock']} {medicine['unit']}, "
+                    f"需要: {request.quantity} {medicine['unit']}"
+                )
+            )
+
+        # 建立待審核領用記錄
+        medicine_name = medicine['brand_name'] or medicine['generic_name']
+
+        cursor.execute("""
+            INSERT INTO dispense_records (
+                medicine_code, medicine_name, quantity, unit,
+                dispensed_by, status,
+                patient_ref_id, patient_name, prescription_id,
+                station_code, created_at
+            ) VALUES (?, ?, ?, ?, ?, 'PENDING', ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (
+            request.medicineCode,
+            medicine_name,
+            request.quantity,
+            medicine['unit'],
+            request.dispensedBy,
+            request.patientRefId,
+            request.patientName,
+            request.prescriptionId,
+            request.stationCode
+        ))
+        dispense_id = cursor.lastrowid
+
+        cursor.execute("""
+            INSERT INTO stock_reservations (dispense_id, item_code, quantity, expires_at)
+            VALUES (?, ?, ?, datetime('now', ?))
+        """, (dispense_id, request.medicineCode, request.quantity, self._reservation_ttl_modifier()))
+        reserved_until = cursor.execute(
+            "SELECT expires_at FROM stock_reservations WHERE dispense_id = ?", (dispense_id,)
+        ).fetchone()['expires_at']
+
+        return {
+            "success": True,
+            "message": "領用請求已建立，已保留庫存，等待藥師審核",
+            "dispense_id": dispense_id,
+            "status": "PENDING",
+            "medicine_name": medicine_name,
+            "quantity": request.quantity,
+            "unit": medicine['unit'],
+            "available_stock": available_stock - request.quantity,
+            "reserved_until": reserved_until
+        }
+
+    def dispense_emergency(self, request: EmergencyDispenseRequest) -> dict:
+        """緊急領用 (Break-the-Glass)"""
+        return self._execute_write(self._dispense_emergency, request, error_message="緊急領用失敗")
+
+    def dispense_normal(self, request: NormalDispenseRequest) -> dict:
+        """正常領用 (建立待審核記錄)"""
+        return self._execute_write(self._dispense_normal, request, error_message="建立領用請求失敗")
+
+    def execute_batch(
+        self,
+        operations: List[Tuple[Any, tuple]],
+        atomic: bool = True,
+        before_commit: Optional[Callable[[Any, List[Dict]], None]] = None
+    ) -> Tuple[List[Dict], bool]:
+        """
+        在同一交易中依序執行多個寫入操作，只提交一次
+
+        Args:
+            operations: [(寫入操作, 參數)]，寫入操作的第一個參數為 cursor
+            atomic: True 時任一操作失敗即全部回滾並停止；
+                    False 時失敗的操作個別回滾 (SAVEPOINT)，其餘照常提交
+            before_commit: 提交前以 (cursor, 各操作結果) 呼叫，其寫入與批次同時提交
+
+        Returns:
+            (各操作結果 [{success, status_code, result | error}], 是否已提交)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        outcomes = []
+        aborted = False
+
+        try:
+            # 一開始即取得寫入鎖，批次中途不會因其他寫入者而失敗
+            cursor.execute("BEGIN IMMEDIATE")
+
+            for operation, args in operations:
+                if not atomic:
+                    cursor.execute("SAVEPOINT batch_operation")
+                try:
+                    result = operation(cursor, *args)
+                    outcomes.append({"success": True, "status_code": 200, "result": result})
+                except Exception as e:
+                    status_code = e.status_code if isinstance(e, HTTPException) else 500
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    if status_code >= 500:
+                        logger.error(f"批次操作失敗: {detail}")
+                    outcomes.append({"success": False, "status_code": status_code, "error": detail})
+                    if atomic:
+                        aborted = True
+                        break
+                    cursor.execute("ROLLBACK TO batch_operation")
+                if not atomic:
+                    cursor.execute("RELEASE batch_operation")
+
+            if aborted:
+                conn.rollback()
+                outcomes += [
+                    {"success": False, "status_code": None, "error": "未執行 (先前的操作失敗，批次已回滾)"}
+                    for _ in range(len(operations) - len(outcomes))
+                ]
+                return outcomes, False
+
+            if before_commit is not None:
+                before_commit(cursor, outcomes)
+            conn.commit()
+            return outcomes, True
+        except Exception:
             conn.rollback()
-            logger.error(f"血袋處理失敗: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+            raise
         finally:
             conn.close()
-    
+
     def get_blood_inventory(self, station_id: str = None) -> List[Dict]:
         """取得血袋庫存(支援多站點)"""
         conn = self.get_connection()
@@ -1967,54 +2768,43 @@ class DatabaseManager:
 
     def check_equipment(self, equipment_id: str, request: EquipmentCheckRequest) -> dict:
         """設備檢查"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT name FROM equipment WHERE id = ?", (equipment_id,))
-            equipment = cursor.fetchone()
-            if not equipment:
-                raise HTTPException(status_code=404, detail=f"設備ID {equipment_id} 不存在")
-            
-            cursor.execute("""
-                UPDATE equipment 
-                SET status = ?,
-                    last_check = CURRENT_TIMESTAMP,
-                    power_level = ?,
-                    remarks = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (request.status, request.powerLevel, request.remarks, equipment_id))
-            
-            cursor.execute("""
-                INSERT INTO equipment_checks 
-                (equipment_id, status, power_level, remarks, station_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                equipment_id,
-                request.status,
-                request.powerLevel,
-                request.remarks,
-                request.stationId
-            ))
-            
-            conn.commit()
-            logger.info(f"設備檢查記錄成功: {equipment_id} - {request.status}")
-            
-            return {
-                "success": True,
-                "message": f"設備 {equipment['name']} 檢查完成",
-                "status": request.status
-            }
-        
-        except HTTPException:
-            raise
-        except Exception as e:
-            conn.rollback()
-            logger.error(f"設備檢查失敗: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
-        finally:
-            conn.close()
+        result = self._execute_write(self._check_equipment, equipment_id, request, error_message="設備檢查失敗")
+        logger.info(f"設備檢查記錄成功: {equipment_id} - {request.status}")
+        return result
+
+    def _check_equipment(self, cursor, equipment_id: str, request: EquipmentCheckRequest) -> dict:
+        cursor.execute("SELECT name FROM equipment WHERE id = ?", (equipment_id,))
+        equipment = cursor.fetchone()
+        if not equipment:
+            raise HTTPException(status_code=404, detail=f"設備ID {equipment_id} 不存在")
+
+        cursor.execute("""
+            UPDATE equipment 
+            SET status = ?,
+                last_check = CURRENT_TIMESTAMP,
+                power_level = ?,
+                remarks = ?,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (request.status, request.powerLevel, request.remarks, equipment_id))
+
+        cursor.execute("""
+            INSERT INTO equipment_checks 
+            (equipment_id, status, power_level, remarks, station_id)
+            VALUES (?, ?, ?, ?, ?)
+        """, (
+            equipment_id,
+            request.status,
+            request.powerLevel,
+            request.remarks,
+            request.stationId
+        ))
+
+        return {
+            "success": True,
+            "message": f"設備 {equipment['name']} 檢查完成",
+            "status": request.status
+        }
 
     def reset_equipment_daily(self) -> int:
         """每日重置設備狀態(清空備註、電力、重置為UNCHECKED)"""
@@ -2071,23 +2861,475 @@ class DatabaseManager:
         cursor = conn.cursor()
 
         try:
+            return self._query_inventory_items(cursor)
+        finally:
+            conn.close()
+
+    def _query_inventory_items(self, cursor, item_codes: Optional[List[str]] = None) -> List[Dict]:
+        """查詢物品及庫存 (含待審核領用保留量)，指定 item_codes 時只查詢這些物品"""
+        item_filter, stock_filter, params = "", "", []
+        if item_codes is not None:
+            placeholders = ','.join('?' * len(item_codes))
+            item_filter = f"WHERE i.item_code IN ({placeholders})"
+            stock_filter = f"WHERE item_code IN ({placeholders})"
+            params = list(item_codes) * 2
+
+        cursor.execute(f"""
+            SELECT
+                i.item_code as code, i.item_name as name, i.unit, i.min_stock, i.category,
+                COALESCE(stock.current_stock, 0) as current_stock,
+                COALESCE(r.quantity, 0) as reserved_stock,
+                COALESCE(stock.current_stock, 0) - COALESCE(r.quantity, 0) as available_stock
+            FROM items i
+            LEFT JOIN reserved_stock r ON r.item_code = i.item_code
+            LEFT JOIN (
+                SELECT item_code,
+                       SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
+                                WHEN event_type = 'CONSUME' THEN -quantity
+                                ELSE 0 END) as current_stock
+                FROM inventory_events
+                {stock_filter}
+                GROUP BY item_code
+            ) stock ON i.item_code = stock.item_code
+            {item_filter}
+            ORDER BY i.category, i.item_name
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _query_active_medicines(self, cursor, medicine_codes: Optional[List[str]] = None) -> List[Dict]:
+        """查詢啟用中的藥品 (物品清單格式，含待審核領用保留量)，指定 medicine_codes 時只查詢這些藥品"""
+        code_filter, params = "", []
+        if medicine_codes is not None:
+            code_filter = f"AND m.medicine_code IN ({','.join('?' * len(medicine_codes))})"
+            params = list(medicine_codes)
+
+        cursor.execute(f"""
+            SELECT
+                m.medicine_code as code,
+                COALESCE(m.brand_name, m.generic_name) as name,
+                m.unit,
+                m.current_stock,
+                COALESCE(r.quantity, 0) as reserved_stock,
+                COALESCE(m.current_stock, 0) - COALESCE(r.quantity, 0) as available_stock,
+                m.min_stock,
+                '藥品' as category,
+                m.is_controlled_drug,
+                m.controlled_level
+            FROM medicines m
+            LEFT JOIN reserved_stock r ON r.item_code = m.medicine_code
+            WHERE m.is_active = 1 {code_filter}
+            ORDER BY m.medicine_code
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    # ========== 差異查詢 (資料列版本) ==========
+
+    def get_change_version(self) -> int:
+        """目前的全域變更序號"""
+        conn = self.get_connection()
+        try:
+            return conn.execute("SELECT value FROM change_seq WHERE id = 1").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _begin_delta(self, cursor, entities: Tuple[str, ...], since_version: int) -> Dict:
+        """
+        於同一讀取交易中取得目前序號與 since_version 之後變更的實體鍵
+
+        since_version 不大於 0 或大於目前序號 (例如資料庫自備份還原) 時標記 reset，
+        呼叫端應改回傳完整資料
+        """
+        cursor.execute("BEGIN")
+        version = cursor.execute("SELECT value FROM change_seq WHERE id = 1").fetchone()[0]
+        delta = {"version": version, "since_version": since_version, "changed": {}, "deleted": {}}
+        delta["reset"] = since_version <= 0 or since_version > version
+        if delta["reset"]:
+            return delta
+
+        for entity in entities:
             cursor.execute("""
-                SELECT
-                    i.item_code as code, i.item_name as name, i.unit, i.min_stock, i.category,
-                    COALESCE(stock.current_stock, 0) as current_stock
-                FROM items i
-                LEFT JOIN (
-                    SELECT item_code,
-                           SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
-                                    WHEN event_type = 'CONSUME' THEN -quantity
-                                    ELSE 0 END) as current_stock
-                    FROM inventory_events
-                    GROUP BY item_code
-                ) stock ON i.item_code = stock.item_code
-                ORDER BY i.category, i.item_name
-            """)
-            return [dict(row) for row in cursor.fetchall()]
+                SELECT entity_key, deleted FROM row_versions
+                WHERE entity = ? AND version > ?
+            """, (entity, since_version))
+            rows = cursor.fetchall()
+            delta["changed"][entity] = [row['entity_key'] for row in rows if not row['deleted']]
+            delta["deleted"][entity] = [row['entity_key'] for row in rows if row['deleted']]
+        return delta
+
+    @staticmethod
+    def _chunks(keys: List[str], size: int = 500) -> Iterator[List[str]]:
+        """分批 (避免超過 SQLite 參數數量上限)"""
+        for start in range(0, len(keys), size):
+            yield keys[start:start + size]
+
+    def get_items_delta(self, since_version: int) -> Optional[Dict]:
+        """
+        since_version 之後庫存或主檔有變更的物品與藥品
+
+        Returns:
+            {items, deleted, version, since_version}；需完整重載時回傳 None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            delta = self._begin_delta(cursor, ('item', 'medicine'), since_version)
+            if delta["reset"]:
+                return None
+
+            items, deleted = self._query_changed_items(cursor, delta)
+            return {
+                "items": items,
+                "deleted": deleted,
+                "version": delta["version"],
+                "since_version": since_version
+            }
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def _query_changed_items(self, cursor, delta: Dict) -> Tuple[List[Dict], List[str]]:
+        """差異中變更的物品與藥品 (物品清單格式) 及已刪除的代碼"""
+        items = []
+        for codes in self._chunks(delta["changed"]['item']):
+            items.extend(self._query_inventory_items(cursor, codes))
+
+        # 藥品的庫存事件與保留量變動記錄在 item 實體下
+        medicine_codes = delta["changed"]['medicine']
+        found = {item['code'] for item in items}
+        candidates = list(dict.fromkeys(
+            medicine_codes + [code for code in delta["changed"]['item'] if code not in found]
+        ))
+        medicines = []
+        for codes in self._chunks(candidates):
+            medicines.extend(self._query_active_medicines(cursor, codes))
+
+        # 停用的藥品不在清單中，視同刪除
+        active = {m['code'] for m in medicines}
+        deleted = (
+            delta["deleted"]['item'] + delta["deleted"]['medicine'] +
+            [code for code in medicine_codes if code not in active]
+        )
+        return items + medicines, deleted
+
+    def _query_blood_rows(self, cursor, keys: Optional[List[str]] = None, station_id: Optional[str] = None) -> List[Dict]:
+        """查詢血品庫存，指定 keys ('血型|站點') 時只查詢這些資料列"""
+        conditions, params = [], []
+        if keys is not None:
+            conditions.append(f"blood_type || '|' || station_id IN ({','.join('?' * len(keys))})")
+            params.extend(keys)
+        if station_id:
+            conditions.append("station_id = ?")
+            params.append(station_id)
+
+        cursor.execute(f"""
+            SELECT blood_type, quantity, station_id, last_updated
+            FROM blood_inventory
+            {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+            ORDER BY station_id, blood_type
+        """, params)
+        return [dict(row) for row in cursor.fetchall()]
+
+    def _query_equipment_rows(self, cursor, ids: Optional[List[str]] = None) -> List[Dict]:
+        """查詢設備，指定 ids 時只查詢這些設備"""
+        id_filter = f"WHERE id IN ({','.join('?' * len(ids))})" if ids is not None else ""
+        cursor.execute(f"""
+            SELECT
+                id, name, category, quantity, status,
+                last_check, power_level, remarks
+            FROM equipment
+            {id_filter}
+            ORDER BY name
+        """, list(ids or []))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_blood_inventory_delta(self, since_version: int, station_id: Optional[str] = None) -> Optional[Dict]:
+        """since_version 之後有變更的血品庫存 (鍵為 '血型|站點')；需完整重載時回傳 None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            delta = self._begin_delta(cursor, ('blood',), since_version)
+            if delta["reset"]:
+                return None
+
+            rows = []
+            for keys in self._chunks(delta["changed"]['blood']):
+                rows.extend(self._query_blood_rows(cursor, keys, station_id))
+
+            deleted = delta["deleted"]['blood']
+            if station_id:
+                deleted = [key for key in deleted if key.endswith(f"|{station_id}")]
+
+            return {
+                "bloodInventory": rows,
+                "deleted": deleted,
+                "version": delta["version"],
+                "since_version": since_version
+            }
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def get_equipment_delta(self, since_version: int) -> Optional[Dict]:
+        """since_version 之後有變更的設備；需完整重載時回傳 None"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            delta = self._begin_delta(cursor, ('equipment',), since_version)
+            if delta["reset"]:
+                return None
+
+            equipment = []
+            for ids in self._chunks(delta["changed"]['equipment']):
+                equipment.extend(self._query_equipment_rows(cursor, ids))
+
+            return {
+                "equipment": equipment,
+                "deleted": delta["deleted"]['equipment'],
+                "version": delta["version"],
+                "since_version": since_version
+            }
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def get_pending_dispenses_delta(self, since_version: int, statuses: Tuple[str, ...]) -> Optional[Dict]:
+        """
+        since_version 之後有變更的領用記錄
+
+        仍符合狀態篩選的放在 records，已審核/不再符合或已刪除的 id 放在 removed；
+        需完整重載時回傳 None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            delta = self._begin_delta(cursor, ('dispense',), since_version)
+            if delta["reset"]:
+                return None
+
+            changed_ids = [int(key) for key in delta["changed"]['dispense']]
+            records = []
+            for ids in self._chunks(changed_ids):
+                cursor.execute(f"""
+                    SELECT
+                        dr.*,
+                        CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending,
+                        sr.status AS reservation_status,
+                        sr.expires_at AS reservation_expires_at
+                    FROM dispense_records dr
+                    LEFT JOIN stock_reservations sr ON sr.dispense_id = dr.id
+                    WHERE dr.id IN ({','.join('?' * len(ids))})
+                    ORDER BY dr.created_at ASC
+                """, ids)
+                records.extend(dict(row) for row in cursor.fetchall())
+
+            matching = [r for r in records if r['status'] in statuses]
+            kept = {r['id'] for r in matching}
+            removed = [i for i in changed_ids if i not in kept] + [int(key) for key in delta["deleted"]['dispense']]
+
+            return {
+                "records": matching,
+                "removed": removed,
+                "version": delta["version"],
+                "since_version": since_version
+            }
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def get_sync_changes(self, since_version: int, station_id: Optional[str] = None) -> Dict:
+        """
+        離線鏡像同步：於同一讀取交易中取得 since_version 之後變更的物品、血品與設備
+
+        三類資料對應同一個版本，用戶端寫入本機鏡像後以 version 作為下次的 since_version；
+        since_version 無效 (0、或大於目前序號) 時回傳完整資料並標記 reset，用戶端應先清空鏡像
+
+        Args:
+            since_version: 上次同步的版本
+            station_id: 血品只回傳此站點
+
+        Returns:
+            {version, since_version, reset, items, bloodInventory, equipment, deleted: {items, blood, equipment}}
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            delta = self._begin_delta(cursor, ('item', 'medicine', 'blood', 'equipment'), since_version)
+            result = {"version": delta["version"], "since_version": since_version, "reset": delta["reset"]}
+
+            if delta["reset"]:
+                result.update(
+                    items=self._query_inventory_items(cursor) + self._query_active_medicines(cursor),
+                    bloodInventory=self._query_blood_rows(cursor, station_id=station_id),
+                    equipment=self._query_equipment_rows(cursor),
+                    deleted={"items": [], "blood": [], "equipment": []}
+                )
+                return result
+
+            items, deleted_items = self._query_changed_items(cursor, delta)
+            blood = []
+            for keys in self._chunks(delta["changed"]['blood']):
+                blood.extend(self._query_blood_rows(cursor, keys, station_id))
+            equipment = []
+            for ids in self._chunks(delta["changed"]['equipment']):
+                equipment.extend(self._query_equipment_rows(cursor, ids))
+
+            deleted_blood = delta["deleted"]['blood']
+            if station_id:
+                deleted_blood = [key for key in deleted_blood if key.endswith(f"|{station_id}")]
+
+            result.update(
+                items=items,
+                bloodInventory=blood,
+                equipment=equipment,
+                deleted={"items": deleted_items, "blood": deleted_blood, "equipment": delta["deleted"]['equipment']}
+            )
+            return result
+        finally:
+            conn.rollback()
+            conn.close()
+
+    # ========== 儀表板 (單一快照) ==========
+
+    DASHBOARD_FIELDS = ('stats', 'items', 'blood', 'equipment', 'dispenses')
+
+    def get_dashboard(
+        self,
+        station_id: Optional[str] = None,
+        fields: Optional[Tuple[str, ...]] = None,
+        dispense_limit: int = 50
+    ) -> Dict:
+        """
+        於同一讀取交易中取得儀表板的統計與清單，各區塊的數字彼此一致
+
+        庫存只彙總一次：同一次掃描 inventory_events 同時得到全部庫存 (物品清單)
+        與本站庫存 (警戒數)；統計直接由同一份資料列計算
+
+        Args:
+            station_id: 站點ID (統計與血袋依站點過濾，與 /api/stats 相同)
+            fields: 要回傳的區塊 (DASHBOARD_FIELDS 子集)，None 表示全部
+            dispense_limit: 待處理領用最大筆數
+
+        Returns:
+            {version, station_id, generated_at, 及所選區塊}
+        """
+        fields = set(fields or self.DASHBOARD_FIELDS)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("BEGIN")
+            result = {
+                "version": cursor.execute("SELECT value FROM change_seq WHERE id = 1").fetchone()[0],
+                "station_id": station_id,
+                "generated_at": datetime.now().isoformat()
+            }
+            stats = {}
+
+            if 'stats' in fields or 'items' in fields:
+                cursor.execute("""
+                    SELECT
+                        i.item_code as code, i.item_name as name, i.unit, i.min_stock, i.category,
+                        COALESCE(stock.current_stock, 0) as current_stock,
+                        COALESCE(r.quantity, 0) as reserved_stock,
+                        COALESCE(stock.current_stock, 0) - COALESCE(r.quantity, 0) as available_stock,
+                        stock.station_stock
+                    FROM items i
+                    LEFT JOIN reserved_stock r ON r.item_code = i.item_code
+                    LEFT JOIN (
+                        SELECT item_code,
+                               SUM(delta) as current_stock,
+                               SUM(CASE WHEN station_id = ? THEN delta END) as station_stock
+                        FROM (
+                            SELECT item_code, station_id,
+                                   CASE WHEN event_type = 'RECEIVE' THEN quantity
+                                        WHEN event_type = 'CONSUME' THEN -quantity
+                                        ELSE 0 END as delta
+                            FROM inventory_events
+                        )
+                        GROUP BY item_code
+                    ) stock ON i.item_code = stock.item_code
+                    ORDER BY i.category, i.item_name
+                """, (station_id,))
+                items = [dict(row) for row in cursor.fetchall()]
+
+                # 警戒數與 get_stats 相同：指定站點時只統計本站有進貨記錄的品項
+                low_stock = 0
+                for item in items:
+                    station_stock = item.pop('station_stock')
+                    stock = station_stock if station_id else item['current_stock']
+                    if stock is not None and item['min_stock'] is not None and stock < item['min_stock']:
+                        low_stock += 1
+                stats.update(totalItems=len(items), lowStockItems=low_stock)
+
+                if 'items' in fields:
+                    result["items"] = items + self._query_active_medicines(cursor)
+
+            if 'stats' in fields or 'blood' in fields:
+                if station_id:
+                    cursor.execute("""
+                        SELECT blood_type, quantity, station_id, last_updated
+                        FROM blood_inventory
+                        WHERE station_id = ?
+                        ORDER BY blood_type
+                    """, (station_id,))
+                else:
+                    cursor.execute("""
+                        SELECT blood_type, quantity, station_id, last_updated
+                        FROM blood_inventory
+                        ORDER BY station_id, blood_type
+                    """)
+                blood = [dict(row) for row in cursor.fetchall()]
+                stats["totalBlood"] = sum(row['quantity'] or 0 for row in blood)
+                if 'blood' in fields:
+                    result["bloodInventory"] = blood
+
+            if 'stats' in fields or 'equipment' in fields:
+                # v1.4.5 單站版本：equipment 表無 station_id 欄位
+                cursor.execute("""
+                    SELECT
+                        id, name, category, quantity, status,
+                        last_check, power_level, remarks
+                    FROM equipment
+                    ORDER BY name
+                """)
+                equipment = [dict(row) for row in cursor.fetchall()]
+                stats["equipmentAlerts"] = sum(1 for e in equipment if e['status'] in ('UNCHECKED', 'WARNING', 'ERROR'))
+                if 'equipment' in fields:
+                    result["equipment"] = equipment
+
+            if 'dispenses' in fields:
+                cursor.execute("""
+                    SELECT
+                        dr.*,
+                        CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending,
+                        sr.status AS reservation_status,
+                        sr.expires_at AS reservation_expires_at
+                    FROM dispense_records dr
+                    LEFT JOIN stock_reservations sr ON sr.dispense_id = dr.id
+                    WHERE dr.status IN ('PENDING', 'EMERGENCY')
+                    ORDER BY dr.created_at ASC
+                    LIMIT ?
+                """, (dispense_limit,))
+                records = [dict(row) for row in cursor.fetchall()]
+                result["pendingDispenses"] = {
+                    "records": records,
+                    "count": len(records),
+                    "emergency_count": sum(1 for r in records if r['status'] == 'EMERGENCY'),
+                    "pending_count": sum(1 for r in records if r['status'] == 'PENDING')
+                }
+
+            if 'stats' in fields:
+                result["stats"] = {
+                    key: stats[key] for key in ("totalItems", "lowStockItems", "totalBlood", "equipmentAlerts")
+                }
+            return result
         finally:
+            conn.rollback()
             conn.close()
 
     def get_inventory_events(
@@ -2141,74 +3383,230 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def export_inventory_csv(self) -> str:
-        """匯出庫存資料為 CSV"""
-        items = self.get_inventory_items()
+    # ========== 串流 CSV 匯出 ==========
+
+    def _iter_keyset_pages(
+        self,
+        cursor,
+        select_sql: str,
+        where_clauses: List[str],
+        params: list,
+        key_columns: tuple,
+        page_size: Optional[int] = None,
+        descending: bool = True
+    ) -> Iterator[List[sqlite3.Row]]:
+        """
+        鍵集分頁
+
+        每頁以上一頁最後一筆的鍵值 seek，不使用 OFFSET，
+        深頁與首頁成本相同；key_columns 最後一欄須唯一。
+
+        Args:
+            cursor: 資料庫游標
+            select_sql: SELECT ... FROM ... (不含 WHERE / ORDER BY)，需選出 key_columns
+            where_clauses: 篩選條件
+            params: 篩選參數
+            key_columns: 排序鍵欄位
+            page_size: 每頁筆數
+            descending: 是否由大到小 (預設由新到舊)
+
+        Returns:
+            逐頁的資料列
+        """
+        page_size = page_size or config.EXPORT_PAGE_SIZE
+        key_names = [column.split('.')[-1] for column in key_columns]
+        direction, seek = ("DESC", "<") if descending else ("ASC", ">")
+        order_sql = ", ".join(f"{column} {direction}" for column in key_columns)
+        last_key = None
+
+        while True:
+            clauses = list(where_clauses)
+            page_params = list(params)
+            if last_key is not None:
+                clauses.append(f"({', '.join(key_columns)}) {seek} ({', '.join('?' * len(key_columns))})")
+                page_params.extend(last_key)
+
+            where_sql = " AND ".join(clauses) if clauses else "1=1"
+            cursor.execute(f"""
+                {select_sql}
+                WHERE {where_sql}
+                ORDER BY {order_sql}
+                LIMIT ?
+            """, page_params + [page_size])
+
+            page = cursor.fetchall()
+            if not page:
+                return
+
+            yield page
+
+            if len(page) < page_size:
+                return
+            last_key = [page[-1][name] for name in key_names]
+
+    def _stream_csv(self, header: List[str], rows) -> Iterator[bytes]:
+        """
+        逐頁輸出 UTF-8 CSV 位元組
+
+        rows 為 callable(conn) -> 資料列迭代器；連線在串流結束或客戶端中斷時關閉
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush() -> bytes:
+            chunk = buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
 
-        output = io.StringIO()
-        writer = csv.writer(output)
+        writer.writerow(header)
+        yield flush()
+
+        conn = self.get_connection()
+        try:
+            pending = 0
+            for row in rows(conn):
+                writer.writerow(row)
+                pending += 1
+                if pending >= config.EXPORT_PAGE_SIZE:
+                    yield flush()
+                    pending = 0
+            if pending:
+                yield flush()
+        except Exception as e:
+            # 標頭已送出，無法再回傳錯誤狀態碼，只能記錄並中止串流
+            logger.error(f"CSV 串流匯出中斷: {e}")
+            raise
+        finally:
+            conn.close()
 
-        writer.writerow([
+    def export_inventory_csv(self) -> Iterator[bytes]:
+        """串流匯出庫存資料為 CSV (每頁只彙總該頁物品的庫存)"""
+        header = [
             '物品代碼', '物品名稱', '分類', '單位',
             '當前庫存', '最小庫存', '庫存狀態'
-        ])
-
-        for item in items:
-            status = '正常' if item['current_stock'] >= item['min_stock'] else '警戒'
-            writer.writerow([
-                item['code'],
-                item['name'],
-                item['category'],
-                item['unit'],
-                item['current_stock'],
-                item['min_stock'],
-                status
-            ])
-
-        return output.getvalue()
+        ]
+
+        def rows(conn: sqlite3.Connection) -> Iterator[list]:
+            cursor = conn.cursor()
+            for page in self._iter_keyset_pages(
+                cursor,
+                "SELECT item_code, item_name, category, unit, min_stock FROM items",
+                [], [],
+                key_columns=('item_code',),
+                descending=False
+            ):
+                codes = [item['item_code'] for item in page]
+                cursor.execute(f"""
+                    SELECT item_code,
+                           SUM(CASE WHEN event_type = 'RECEIVE' THEN quantity
+                                    WHEN event_type = 'CONSUME' THEN -quantity
+                                    ELSE 0 END) as current_stock
+                    FROM inventory_events
+                    WHERE item_code IN ({','.join('?' * len(codes))})
+                    GROUP BY item_code
+                """, codes)
+                stock = {row['item_code']: row['current_stock'] or 0 for row in cursor.fetchall()}
+
+                for item in page:
+                    current_stock = stock.get(item['item_code'], 0)
+                    status = '正常' if current_stock >= (item['min_stock'] or 0) else '警戒'
+                    yield [
+                        item['item_code'],
+                        item['item_name'],
+                        item['category'],
+                        item['unit'],
+                        current_stock,
+                        item['min_stock'],
+                        status
+                    ]
+
+        return self._stream_csv(header, rows)
 
     def export_inventory_events_csv(
         self,
         event_type: Optional[str] = None,
         start_date: Optional[str] = None,
         end_date: Optional[str] = None
-    ) -> str:
-        """匯出庫存事件記錄為 CSV"""
-        events = self.get_inventory_events(event_type, start_date, end_date, limit=10000)
+    ) -> Iterator[bytes]:
+        """串流匯出庫存事件記錄為 CSV (依 timestamp 索引鍵集分頁，無筆數上限)"""
+        where_clauses = []
+        params = []
+
+        if event_type:
+            where_clauses.append("e.event_type = ?")
+            params.append(event_type)
+
+        # 以範圍條件取代 DATE(e.timestamp)，才能走 timestamp 索引
+        if start_date:
+            where_clauses.append("e.timestamp >= ?")
+            params.append(start_date)
 
-        output = io.StringIO()
-        writer = csv.writer(output)
+        if end_date:
+            where_clauses.append("e.timestamp < DATE(?, '+1 day')")
+            params.append(end_date)
 
-        writer.writerow([
+        header = [
             '事件ID', '事件類型', '物品代碼', '物品名稱', '數量', '單位',
             '批號', '效期', '備註', '站點', '操作員', '時間'
-        ])
-
-        for event in events:
-            event_type_text = '進貨' if event['event_type'] == 'RECEIVE' else '消耗'
-            writer.writerow([
-                event['id'],
-                event_type_text,
-                event['item_code'],
-                event['item_name'],
-                event['quantity'],
-                event['unit'],
-                event.get('batch_number', ''),
-                event.get('expiry_date', ''),
-                event.get('remarks', ''),
-                event['station_id'],
-                event['operator'],
-                event['timestamp']
-            ])
-
-        return output.getvalue()
+        ]
+
+        def rows(conn: sqlite3.Connection) -> Iterator[list]:
+            cursor = conn.cursor()
+            for page in self._iter_keyset_pages(
+                cursor,
+                """
+                SELECT
+                    e.id, e.event_type, e.item_code, i.item_name,
+                    e.quantity, i.unit, e.batch_number, e.expiry_date,
+                    e.remarks, e.station_id, e.operator, e.timestamp
+                FROM inventory_events e
+                LEFT JOIN items i ON e.item_code = i.item_code
+                """,
+                where_clauses, params,
+                key_columns=('e.timestamp', 'e.id')
+            ):
+                for event in page:
+                    yield [
+                        event['id'],
+                        '進貨' if event['event_type'] == 'RECEIVE' else '消耗',
+                        event['item_code'],
+                        event['item_name'],
+                        event['quantity'],
+                        event['unit'],
+                        event['batch_number'] or '',
+                        event['expiry_date'] or '',
+                        event['remarks'] or '',
+                        event['station_id'],
+                        event['operator'],
+                        event['timestamp']
+                    ]
+
+        return self._stream_csv(header, rows)
 
     # ========== 聯邦架構 - 同步封包方法 (Phase 1) ==========
 
-    def generate_sync_package(self, station_id: str, hospital_id: str, sync_type: str = "DELTA", since_timestamp: str = None) -> dict:
-        """產生同步封包"""
+    def generate_sync_package(
+        self,
+        station_id: str,
+        hospital_id: str,
+        sync_type: str = "DELTA",
+        since_timestamp: str = None,
+        max_bytes: Optional[int] = None,
+        priorities: Optional[Dict[str, int]] = None,
+        record: bool = True
+    ) -> dict:
+        """
+        產生同步封包
+
+        變更依資料表優先序排列 (見 Config.SYNC_TABLE_PRIORITY)，同優先序內依時間排序。
+        指定 max_bytes 時，超出預算的變更會拆成後續封包，每個封包在
+        sync_package_cursors 記錄實際送出的各表範圍。
+        record=False 時只產生內容，不寫入 sync_packages / sync_package_cursors (例如 QR 幀預覽)。
+        """
         import hashlib
         import json
+        import uuid
         from datetime import datetime
 
         conn = self.get_connection()
@@ -2217,123 +3615,145 @@ class DatabaseManager:
         try:
             # 產生封包ID
             now = datetime.now()
-            package_id = f"PKG-{now.strftime('%Y%m%d-%H%M%S')}-{station_id}"
+            # 同一秒內可能產生多個封包，加上隨機尾碼確保唯一
+            package_id = f"PKG-{now.strftime('%Y%m%d-%H%M%S')}-{station_id}-{uuid.uuid4().hex[:8]}"
 
-            # 收集變更記錄
-            changes = []
+            schedule = dict(config.SYNC_TABLE_PRIORITY)
+            if priorities:
+                schedule.update(priorities)
 
-            if sync_type == "DELTA" and since_timestamp:
-                # 增量同步：收集自 since_timestamp 以來的變更
-                tables_to_sync = {
-                    'inventory_events': 'timestamp',
-                    'blood_events': 'timestamp',
-                    'equipment_checks': 'timestamp',
-                    'surgery_records': 'created_at',
-                    'emergency_blood_bags': 'created_at'
-                }
+            # 管制藥品代碼 (其庫存事件提升優先序)
+            cursor.execute("SELECT medicine_code FROM medicines WHERE is_controlled_drug = 1")
+            controlled_codes = {row['medicine_code'] for row in cursor.fetchall()}
 
-                for table, timestamp_col in tables_to_sync.items():
-                    try:
-                        cursor.execute(f"""
-                            SELECT * FROM {table}
-                            WHERE station_id = ? AND {timestamp_col} > ?
-                            ORDER BY {timestamp_col}
-                        """, (station_id, since_timestamp))
-
-                        rows = cursor.fetchall()
-                        logger.info(f"查詢表 {table}: 找到 {len(rows)} 筆變更記錄")
-
-                        for idx, row in enumerate(rows):
-                            try:
-                                row_dict = dict(row)
-                                change_dict = {
-                                    'table': table,
-                                    'operation': 'INSERT',
-                                    'data': row_dict,
-                                    'timestamp': row[timestamp_col]
-                                }
-                                changes.append(change_dict)
-                            except Exception as e:
-                                logger.error(f"無法序列化記錄 {table}[{idx}]: {str(e)}")
-                                logger.error(f"Record type: {type(row)}")
-                                logger.error(f"Record keys: {row.keys() if hasattr(row, 'keys') else 'N/A'}")
-                                raise
-                    except Exception as e:
-                        logger.error(f"查詢表 {table} 失敗: {str(e)}")
-                        raise
+            # 收集變更記錄: (priority, timestamp, change, row_key)
+            entries = []
 
+            if sync_type == "DELTA" and since_timestamp:
+                # 增量同步：收集自 since_timestamp 以來的變更
+                sync_tables = [
+                    # (table, filter_col, timestamp_col, key_col)
+                    ('inventory_events', 'station_id', 'timestamp', 'id'),
+                    ('blood_events', 'station_id', 'timestamp', 'id'),
+                    ('equipment_checks', 'station_id', 'timestamp', 'id'),
+                    ('surgery_records', 'station_id', 'created_at', 'id'),
+                    ('emergency_blood_bags', 'station_id', 'created_at', 'id'),
+                    ('dispense_records', 'station_code', 'updated_at', 'id'),
+                ]
             else:
                 # 全量同步：收集所有資料
                 logger.info(f"開始全量同步: station_id={station_id}")
-
-                # 定義需要同步的表及其時間戳欄位
-                full_sync_tables = [
-                    ('items', None, 'updated_at'),  # (table, filter_col, timestamp_col)
-                    ('inventory_events', 'station_id', 'timestamp'),
-                    ('blood_events', 'station_id', 'timestamp'),
-                    ('equipment_checks', 'station_id', 'timestamp'),
-                    ('surgery_records', 'station_id', 'created_at'),
+                since_timestamp = None
+                sync_tables = [
+                    ('items', None, 'updated_at', 'item_code'),
+                    ('inventory_events', 'station_id', 'timestamp', 'id'),
+                    ('blood_events', 'station_id', 'timestamp', 'id'),
+                    ('equipment_checks', 'station_id', 'timestamp', 'id'),
+                    ('surgery_records', 'station_id', 'created_at', 'id'),
+                    ('dispense_records', 'station_code', 'updated_at', 'id'),
                 ]
 
-                for table, filter_col, timestamp_col in full_sync_tables:
-                    try:
-                        # 建立查詢
-                        if filter_col:
-                            query = f"SELECT * FROM {table} WHERE {filter_col} = ?"
-                            cursor.execute(query, (station_id,))
-                        else:
-                            query = f"SELECT * FROM {table}"
-                            cursor.execute(query)
-
-                        rows = cursor.fetchall()
-                        logger.info(f"查詢表 {table}: 找到 {len(rows)} 筆記錄")
-
-                        for idx, row in enumerate(rows):
-                            try:
-                                row_dict = dict(row)
-                                # 獲取時間戳
-                                timestamp = row[timestamp_col] if timestamp_col in row.keys() else now.isoformat()
-
-                                change_dict = {
-                                    'table': table,
-                                    'operation': 'INSERT',
-                                    'data': row_dict,
-                                    'timestamp': timestamp
-                                }
-                                changes.append(change_dict)
-                            except Exception as e:
-                                logger.error(f"無法序列化記錄 {table}[{idx}]: {str(e)}")
-                                logger.error(f"Record type: {type(row)}")
-                                logger.error(f"Record keys: {row.keys() if hasattr(row, 'keys') else 'N/A'}")
-                                raise
-                    except Exception as e:
-                        logger.error(f"查詢表 {table} 失敗: {str(e)}")
-                        raise
-
-            # 計算校驗碼
-            logger.info(f"成功收集 {len(changes)} 筆變更記錄")
-
-            try:
-                logger.debug("開始 JSON 序列化...")
-                package_content = json.dumps(changes, ensure_ascii=False, sort_keys=True)
-                logger.info(f"JSON 序列化成功，封包大小: {len(package_content)} bytes")
-            except TypeError as e:
-                logger.error(f"JSON 序列化失敗: {str(e)}")
-                logger.error(f"Changes count: {len(changes)}")
-                # 找出無法序列化的變更
-                for idx, change in enumerate(changes):
-                    try:
-                        json.dumps(change)
-                    except TypeError:
-                        logger.error(f"無法序列化的變更 [{idx}]: table={change.get('table')}, data_type={type(change.get('data'))}")
-                raise
+            for table, filter_col, timestamp_col, key_col in sync_tables:
+                where_clauses = []
+                params = []
+                if filter_col:
+                    where_clauses.append(f"{filter_col} = ?")
+                    params.append(station_id)
+                if since_timestamp:
+                    where_clauses.append(f"{timestamp_col} > ?")
+                    params.append(since_timestamp)
+                where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
 
-            checksum = hashlib.sha256(package_content.encode('utf-8')).hexdigest()
-            package_size = len(package_content.encode('utf-8'))
-            logger.debug(f"校驗碼: {checksum}")
+                try:
+                    cursor.execute(f"""
+                        SELECT * FROM {table}
+                        WHERE {where_sql}
+                        ORDER BY {timestamp_col}, {key_col}
+                    """, params)
+
+                    rows = cursor.fetchall()
+                    logger.info(f"查詢表 {table}: 找到 {len(rows)} 筆變更記錄")
+                except Exception as e:
+                    logger.error(f"查詢表 {table} 失敗: {str(e)}")
+                    raise
+
+                table_priority = schedule.get(table, max(schedule.values()) + 1)
+
+                for row in rows:
+                    row_dict = dict(row)
+                    timestamp = row_dict.get(timestamp_col) or now.isoformat()
+                    priority = table_priority
+                    if table == 'inventory_events' and row_dict.get('item_code') in controlled_codes:
+                        priority = min(priority, config.SYNC_CONTROLLED_DRUG_PRIORITY)
+
+                    entries.append((
+                        priority,
+                        str(timestamp),
+                        {
+                            'table': table,
+                            'operation': 'INSERT',
+                            'data': row_dict,
+                            'timestamp': timestamp
+                        },
+                        f"{timestamp}|{row_dict.get(key_col)}"
+                    ))
+
+            # 依優先序排序 (sorted 為穩定排序，同表內維持查詢順序)
+            entries.sort(key=lambda entry: (entry[0], entry[1]))
+            logger.info(f"成功收集 {len(entries)} 筆變更記錄")
+
+            # 依位元組預算拆包
+            batches = [[]]
+            batch_size = 2  # JSON 陣列的 "[]"
+            for entry in entries:
+                try:
+                    entry_size = len(json.dumps(entry[2], ensure_ascii=False, sort_keys=True).encode('utf-8')) + 2
+                except TypeError as e:
+                    logger.error(f"無法序列化的變更: table={entry[2]['table']}, key={entry[3]}: {str(e)}")
+                    raise
+
+                if max_bytes and batches[-1] and batch_size + entry_size > max_bytes:
+                    batches.append([])
+                    batch_size = 2
+                batches[-1].append(entry)
+                batch_size += entry_size
+
+            packages = []
+            for sequence, batch in enumerate(batches, start=1):
+                batch_package_id = package_id if sequence == 1 else f"{package_id}-P{sequence}"
+                changes = [entry[2] for entry in batch]
 
-            # 記錄封包到資料庫
-            try:
+                package_content = json.dumps(changes, ensure_ascii=False, sort_keys=True)
+                checksum = hashlib.sha256(package_content.encode('utf-8')).hexdigest()
+                package_size = len(package_content.encode('utf-8'))
+                logger.debug(f"校驗碼: {checksum}")
+
+                # 記錄游標：每個表實際送出的第一筆與最後一筆
+                package_cursor = {}
+                for priority, _, change, row_key in batch:
+                    table_cursor = package_cursor.setdefault(change['table'], {
+                        'priority': priority,
+                        'first_key': row_key,
+                        'last_key': row_key,
+                        'rows_shipped': 0
+                    })
+                    table_cursor['priority'] = min(table_cursor['priority'], priority)
+                    table_cursor['last_key'] = row_key
+                    table_cursor['rows_shipped'] += 1
+
+                packages.append({
+                    "package_id": batch_package_id,
+                    "sequence": sequence,
+                    "package_size": package_size,
+                    "checksum": checksum,
+                    "changes_count": len(changes),
+                    "changes": changes,
+                    "cursor": package_cursor
+                })
+                if not record:
+                    continue
+
+                # 記錄封包到資料庫
                 cursor.execute("""
                     INSERT INTO sync_packages (
                         package_id, package_type, source_type, source_id,
@@ -2342,28 +3762,50 @@ class DatabaseManager:
                     )
                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """, (
-                    package_id, sync_type, 'STATION', station_id,
+                    batch_package_id, sync_type, 'STATION', station_id,
                     'HOSPITAL', hospital_id, hospital_id,
                     'MANUAL', package_size, checksum, len(changes), 'PENDING'  # transfer_method 改為 'MANUAL'
                 ))
-                logger.info(f"封包記錄已保存到資料庫: {package_id}")
-            except Exception as e:
-                logger.error(f"保存封包記錄失敗: {str(e)}")
-                raise
+
+                for table, table_cursor in package_cursor.items():
+                    cursor.execute("""
+                        INSERT INTO sync_package_cursors (
+                            package_id, batch_id, batch_sequence, table_name,
+                            priority, first_key, last_key, rows_shipped
+                        )
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (
+                        batch_package_id, package_id, sequence, table,
+                        table_cursor['priority'], table_cursor['first_key'],
+                        table_cursor['last_key'], table_cursor['rows_shipped']
+                    ))
 
             conn.commit()
 
-            logger.info(f"同步封包產生完成: {package_id} ({len(changes)} 項變更, {package_size} bytes)")
+            first = packages[0]
+            total_changes = sum(p['changes_count'] for p in packages)
+            logger.info(
+                f"同步封包產生完成: {package_id} ({total_changes} 項變更, "
+                f"{len(packages)} 個封包, 首包 {first['package_size']} bytes)"
+            )
+
+            message = f"同步封包已產生，包含 {first['changes_count']} 項變更"
+            if len(packages) > 1:
+                message += f"，另有 {len(packages) - 1} 個後續封包"
 
             return {
                 "success": True,
-                "package_id": package_id,
+                "package_id": first['package_id'],
                 "package_type": sync_type,
-                "package_size": package_size,
-                "checksum": checksum,
-                "changes_count": len(changes),
-                "changes": changes,
-                "message": f"同步封包已產生，包含 {len(changes)} 項變更"
+                "package_size": first['package_size'],
+                "checksum": first['checksum'],
+                "changes_count": first['changes_count'],
+                "changes": first['changes'],
+                "cursor": first['cursor'],
+                "batch_id": package_id,
+                "total_packages": len(packages),
+                "follow_up_packages": packages[1:],
+                "message": message
             }
 
         except Exception as e:
@@ -2373,8 +3815,19 @@ class DatabaseManager:
         finally:
             conn.close()
 
-    def import_sync_package(self, package_id: str, changes: List[dict], checksum: str, package_type: str = "FULL") -> dict:
-        """匯入同步封包"""
+    def import_sync_package(
+        self,
+        package_id: str,
+        changes: List[dict],
+        checksum: str,
+        package_type: str = "FULL",
+        rollup_station_id: Optional[str] = None
+    ) -> dict:
+        """
+        匯入同步封包
+
+        rollup_station_id 有值時 (醫院層接收站點上傳)，每筆變更套用後同步更新跨站點彙總表
+        """
         import hashlib
         import json
 
@@ -2412,6 +3865,9 @@ class DatabaseManager:
                         cursor.execute(query, list(data.values()))
                         changes_applied += 1
 
+                        if rollup_station_id:
+                            self._apply_hospital_rollup(cursor, rollup_station_id, table, data)
+
                     elif operation == 'UPDATE':
                         # 建立 UPDATE 語句(暫時簡化實作)
                         set_clause = ', '.join([f"{k} = ?" for k in data.keys() if k != 'id'])
@@ -2443,7 +3899,7 @@ class DatabaseManager:
                 )
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
             """, (
-                package_id, package_type, 'STATION', 'UNKNOWN',
+                package_id, package_type, 'STATION', rollup_station_id or 'UNKNOWN',
                 'HOSPITAL', 'LOCAL', 'HOSP-001',
                 'USB', checksum, len(changes), 'APPLIED'
             ))
@@ -2475,39 +3931,536 @@ class DatabaseManager:
         package_content = json.dumps(changes, ensure_ascii=False, sort_keys=True)
         calculated_checksum = hashlib.sha256(package_content.encode('utf-8')).hexdigest()
 
-        if calculated_checksum != checksum:
-            return {
-                "success": False,
-                "error": "校驗碼不符",
-                "expected": checksum,
-                "actual": calculated_checksum
-            }
+        if calculated_checksum != checksum:
+            return {
+                "success": False,
+                "error": "校驗碼不符",
+                "expected": checksum,
+                "actual": calculated_checksum
+            }
+
+        # 匯入變更(複用 import_sync_package 邏輯)，並增量更新跨站點彙總
+        result = self.import_sync_package(package_id, changes, checksum, package_type, rollup_station_id=station_id)
+
+        if result['success']:
+            # 更新站點同步狀態
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE stations
+                    SET last_sync_at = CURRENT_TIMESTAMP,
+                        sync_status = 'SYNCED'
+                    WHERE station_id = ?
+                """, (station_id,))
+                conn.commit()
+            except Exception as e:
+                logger.warning(f"更新站點同步狀態失敗: {e}")
+            finally:
+                conn.close()
+
+        return {
+            **result,
+            "station_id": station_id,
+            "response_package_id": f"PKG-RESPONSE-{package_id}"
+        }
+
+
+    # ========== 醫院層跨站點彙總 (增量維護) ==========
+
+    def _apply_hospital_rollup(self, cursor, station_id: str, table: str, data: dict):
+        """依單筆站點事件增量更新彙總表 (與匯入在同一交易內)"""
+        if table not in ('inventory_events', 'blood_events', 'equipment_checks', 'surgery_records'):
+            return
+
+        # 同一站點的同一筆事件只計入一次 (封包可能重傳)
+        row_id = data.get('id')
+        if row_id is not None:
+            cursor.execute("""
+                INSERT OR IGNORE INTO hospital_rollup_applied (station_id, table_name, row_id)
+                VALUES (?, ?, ?)
+            """, (station_id, table, str(row_id)))
+            if cursor.rowcount == 0:
+                return
+
+        cursor.execute("SELECT hospital_id FROM stations WHERE station_id = ?", (station_id,))
+        station = cursor.fetchone()
+        hospital_id = station['hospital_id'] if station else 'HOSP-001'
+
+        cursor.execute("""
+            INSERT INTO hospital_station_rollups (station_id, hospital_id)
+            VALUES (?, ?)
+            ON CONFLICT(station_id) DO NOTHING
+        """, (station_id, hospital_id))
+        if cursor.rowcount > 0:
+            self._bump_hospital_total(cursor, hospital_id, 'stations_reporting', '', 1)
+
+        event_time = data.get('timestamp')
+        quantity = data.get('quantity') or 0
+        event_type = data.get('event_type')
+
+        # 依事件發生日期累加日報計數
+        report_date = self._report_date_of(data.get('record_date') or event_time)
+        self._bump_report_counter(cursor, hospital_id, report_date, 'station_events', station_id, 1)
+
+        if table == 'surgery_records':
+            self._bump_report_counter(cursor, hospital_id, report_date, 'surgeries_performed', '', 1)
+
+        elif table == 'inventory_events':
+            delta = {'RECEIVE': quantity, 'CONSUME': -quantity}.get(event_type, 0)
+            if delta:
+                cursor.execute("""
+                    INSERT INTO hospital_item_balances (station_id, item_code, quantity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(station_id, item_code) DO UPDATE SET
+                        quantity = quantity + excluded.quantity,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (station_id, data.get('item_code'), delta))
+                cursor.execute("""
+                    UPDATE hospital_station_rollups SET item_units = item_units + ? WHERE station_id = ?
+                """, (delta, station_id))
+                self._bump_hospital_total(cursor, hospital_id, 'item_units', '', delta)
+
+        elif table == 'blood_events':
+            delta = {
+                'RECEIVE': quantity, 'TRANSFER_IN': quantity,
+                'CONSUME': -quantity, 'TRANSFER_OUT': -quantity
+            }.get(event_type, 0)
+            if delta:
+                cursor.execute("""
+                    INSERT INTO hospital_blood_balances (station_id, blood_type, quantity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(station_id, blood_type) DO UPDATE SET
+                        quantity = quantity + excluded.quantity,
+                        updated_at = CURRENT_TIMESTAMP
+                """, (station_id, data.get('blood_type'), delta))
+                cursor.execute("""
+                    UPDATE hospital_station_rollups SET blood_units = blood_units + ? WHERE station_id = ?
+                """, (delta, station_id))
+                self._bump_hospital_total(cursor, hospital_id, 'blood', data.get('blood_type'), delta)
+                self._bump_report_counter(
+                    cursor, hospital_id, report_date,
+                    'blood_in' if delta > 0 else 'blood_out', data.get('blood_type'), abs(delta)
+                )
+
+        elif table == 'equipment_checks':
+            cursor.execute("""
+                SELECT status, last_check FROM hospital_equipment_status
+                WHERE station_id = ? AND equipment_id = ?
+            """, (station_id, data.get('equipment_id')))
+            previous = cursor.fetchone()
+
+            # 較舊的檢查記錄晚到時不覆蓋最新狀態
+            if previous is None or not previous['last_check'] or (event_time or '') >= previous['last_check']:
+                was_alert = previous is not None and previous['status'] in config.EQUIPMENT_ALERT_STATUSES
+                is_alert = data.get('status') in config.EQUIPMENT_ALERT_STATUSES
+
+                cursor.execute("""
+                    INSERT OR REPLACE INTO hospital_equipment_status (station_id, equipment_id, status, last_check)
+                    VALUES (?, ?, ?, ?)
+                """, (station_id, data.get('equipment_id'), data.get('status'), event_time))
+
+                if is_alert and not was_alert:
+                    self._bump_report_counter(cursor, hospital_id, report_date, 'equipment_alerts_raised', '', 1)
+
+                delta = int(is_alert) - int(was_alert)
+                if delta:
+                    cursor.execute("""
+                        UPDATE hospital_station_rollups SET equipment_alerts = equipment_alerts + ? WHERE station_id = ?
+                    """, (delta, station_id))
+                    self._bump_hospital_total(cursor, hospital_id, 'equipment_alerts', '', delta)
+
+        cursor.execute("""
+            UPDATE hospital_station_rollups
+            SET events_applied = events_applied + 1,
+                last_event_at = MAX(COALESCE(last_event_at, ''), COALESCE(?, '')),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE station_id = ?
+        """, (event_time, station_id))
+
+    def _bump_hospital_total(self, cursor, hospital_id: str, metric: str, metric_key: str, delta: int):
+        """累加醫院總計"""
+        cursor.execute("""
+            INSERT INTO hospital_rollup_totals (hospital_id, metric, metric_key, value)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(hospital_id, metric, metric_key) DO UPDATE SET
+                value = value + excluded.value,
+                updated_at = CURRENT_TIMESTAMP
+        """, (hospital_id, metric, metric_key or '', delta))
+
+    @staticmethod
+    def _report_date_of(value) -> str:
+        """取事件時間的日期部分，無法解析時歸入今日"""
+        if value:
+            try:
+                return datetime.strptime(str(value)[:10], '%Y-%m-%d').strftime('%Y-%m-%d')
+            except ValueError:
+                pass
+        return datetime.now().strftime('%Y-%m-%d')
+
+    def _bump_report_counter(self, cursor, hospital_id: str, report_date: str, metric: str, metric_key: str, delta: int):
+        """累加醫院日報計數"""
+        cursor.execute("""
+            INSERT INTO hospital_report_counters (hospital_id, report_date, metric, metric_key, value)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(hospital_id, report_date, metric, metric_key) DO UPDATE SET
+                value = value + excluded.value
+        """, (hospital_id, report_date, metric, metric_key or '', delta))
+
+    def _build_daily_report(self, cursor, hospital_id: str, report_date: str) -> dict:
+        """
+        由日報計數與彙總表組出日報 (不掃描事件表)
+
+        讀取量只與站點數、血型數有關，與當日事件筆數無關
+        """
+        cursor.execute("""
+            SELECT metric, metric_key, value FROM hospital_report_counters
+            WHERE hospital_id = ? AND report_date = ?
+        """, (hospital_id, report_date))
+        counters: Dict[str, Dict[str, int]] = {}
+        for row in cursor.fetchall():
+            counters.setdefault(row['metric'], {})[row['metric_key']] = row['value']
+
+        cursor.execute("SELECT COUNT(*) FROM stations WHERE hospital_id = ?", (hospital_id,))
+        registered = cursor.fetchone()[0]
+        active_stations = counters.get('station_events', {})
+        total_stations = max(registered, len(active_stations))
+
+        cursor.execute("""
+            SELECT metric_key, value FROM hospital_rollup_totals
+            WHERE hospital_id = ? AND metric = 'blood'
+        """, (hospital_id,))
+        blood_on_hand = {blood_type: 0 for blood_type in config.BLOOD_TYPES}
+        for row in cursor.fetchall():
+            blood_on_hand[row['metric_key']] = row['value']
+
+        blood_inventory = {
+            blood_type: {
+                "on_hand": blood_on_hand[blood_type],
+                "received": counters.get('blood_in', {}).get(blood_type, 0),
+                "consumed": counters.get('blood_out', {}).get(blood_type, 0)
+            }
+            for blood_type in blood_on_hand
+        }
+        critical_shortages = [
+            {"blood_type": blood_type, "on_hand": units, "threshold": config.BLOOD_SHORTAGE_THRESHOLD}
+            for blood_type, units in blood_on_hand.items()
+            if units < config.BLOOD_SHORTAGE_THRESHOLD
+        ]
+
+        cursor.execute("""
+            SELECT station_id, equipment_alerts FROM hospital_station_rollups
+            WHERE hospital_id = ? AND equipment_alerts > 0
+        """, (hospital_id,))
+        alerts_by_station = {row['station_id']: row['equipment_alerts'] for row in cursor.fetchall()}
+        equipment_status = {
+            "open_alerts": sum(alerts_by_station.values()),
+            "alerts_raised_today": counters.get('equipment_alerts_raised', {}).get('', 0),
+            "stations_with_alerts": alerts_by_station
+        }
+
+        alerts = [f"血型 {s['blood_type']} 庫存不足: {s['on_hand']} U" for s in critical_shortages]
+        alerts += [f"站點 {sid} 有 {n} 項設備待處理" for sid, n in alerts_by_station.items()]
+
+        return {
+            "hospital_id": hospital_id,
+            "report_date": report_date,
+            "total_stations": total_stations,
+            "operational_stations": len(active_stations),
+            "offline_stations": total_stations - len(active_stations),
+            "surgeries_performed": counters.get('surgeries_performed', {}).get('', 0),
+            "station_events": active_stations,
+            "blood_inventory": blood_inventory,
+            "critical_shortages": critical_shortages,
+            "equipment_status": equipment_status,
+            "alerts": alerts
+        }
+
+    def get_daily_report(self, hospital_id: str = 'HOSP-001', report_date: Optional[str] = None) -> dict:
+        """取得醫院日報 (已結算則回傳凍結版本，否則回傳即時版本)"""
+        report_date = report_date or datetime.now().strftime('%Y-%m-%d')
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT * FROM hospital_daily_reports
+                WHERE hospital_id = ? AND report_date = ?
+            """, (hospital_id, report_date))
+            frozen = cursor.fetchone()
+            if frozen:
+                return {
+                    "report_id": frozen['report_id'],
+                    "hospital_id": hospital_id,
+                    "report_date": report_date,
+                    "total_stations": frozen['total_stations'],
+                    "operational_stations": frozen['operational_stations'],
+                    "offline_stations": frozen['offline_stations'],
+                    "surgeries_performed": frozen['surgeries_performed'],
+                    "blood_inventory": json.loads(frozen['blood_inventory_json'] or '{}'),
+                    "critical_shortages": json.loads(frozen['critical_shortages_json'] or '[]'),
+                    "equipment_status": json.loads(frozen['equipment_status_json'] or '{}'),
+                    "alerts": json.loads(frozen['alerts_json'] or '[]'),
+                    "submitted_by": frozen['submitted_by'],
+                    "submitted_at": frozen['submitted_at'],
+                    "frozen": True
+                }
+
+            report = self._build_daily_report(cursor, hospital_id, report_date)
+            report["frozen"] = False
+            return report
+        finally:
+            conn.close()
+
+    def close_daily_report(self, hospital_id: str, report_date: str, submitted_by: str = 'SYSTEM') -> dict:
+        """
+        結算並凍結醫院日報
+
+        Args:
+            hospital_id: 醫院ID
+            report_date: 報告日期 (YYYY-MM-DD)
+            submitted_by: 結算人員
+
+        Returns:
+            凍結後的日報與 REPORT 同步封包資訊 (重複結算時回傳既有結果)
+
+        Raises:
+            HTTPException 400: 日期格式錯誤，或為今日/未來日期 (當日尚未結束，不可凍結)
+        """
+        try:
+            parsed_date = datetime.strptime(report_date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            parsed_date = None
+        if parsed_date is None or parsed_date.strftime('%Y-%m-%d') != report_date:
+            raise HTTPException(status_code=400, detail=f"報告日期格式錯誤: {report_date} (應為 YYYY-MM-DD)")
+        if parsed_date >= datetime.now().date():
+            raise HTTPException(status_code=400, detail=f"只能結算已結束的日期: {report_date} 尚未結束")
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("SELECT 1 FROM hospitals WHERE hospital_id = ?", (hospital_id,))
+            if not cursor.fetchone():
+                raise HTTPException(status_code=404, detail=f"醫院 {hospital_id} 不存在")
+
+            report_id = f"RPT-{hospital_id}-{report_date.replace('-', '')}"
+            cursor.execute("SELECT 1 FROM hospital_daily_reports WHERE report_id = ?", (report_id,))
+            if cursor.fetchone():
+                return {**self.get_report_package(hospital_id, report_date), "already_closed": True}
+
+            report = self._build_daily_report(cursor, hospital_id, report_date)
+
+            cursor.execute("""
+                INSERT INTO hospital_daily_reports (
+                    report_id, hospital_id, report_date,
+                    total_stations, operational_stations, offline_stations,
+                    surgeries_performed, blood_inventory_json, critical_shortages_json,
+                    equipment_status_json, alerts_json, submitted_by
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                report_id, hospital_id, report_date,
+                report['total_stations'], report['operational_stations'], report['offline_stations'],
+                report['surgeries_performed'],
+                json.dumps(report['blood_inventory'], ensure_ascii=False),
+                json.dumps(report['critical_shortages'], ensure_ascii=False),
+                json.dumps(report['equipment_status'], ensure_ascii=False),
+                json.dumps(report['alerts'], ensure_ascii=False),
+                submitted_by
+            ))
+
+            package = self._compact_report(report_id, report)
+            package_json = json.dumps(package, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+            cursor.execute("""
+                INSERT OR REPLACE INTO sync_packages (
+                    package_id, package_type, source_type, source_id,
+                    destination_type, destination_id, hospital_id,
+                    transfer_method, package_size, checksum, changes_count, status
+                ) VALUES (?, 'REPORT', 'HOSPITAL', ?, 'CENTRAL', 'CENTRAL', ?, 'NETWORK', ?, ?, 1, 'PENDING')
+            """, (
+                report_id, hospital_id, hospital_id,
+                len(package_json.encode('utf-8')),
+                hashlib.sha256(package_json.encode('utf-8')).hexdigest()
+            ))
+
+            conn.commit()
+            logger.info(f"✓ 醫院日報已結算: {report_id} (手術 {report['surgeries_performed']} 台, 回報站點 {report['operational_stations']})")
+
+            return {
+                "report_id": report_id,
+                "report": {**report, "frozen": True, "submitted_by": submitted_by},
+                "package": package,
+                "package_size": len(package_json.encode('utf-8')),
+                "checksum": hashlib.sha256(package_json.encode('utf-8')).hexdigest(),
+                "already_closed": False
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"結算醫院日報失敗: {e}")
+            raise HTTPException(status_code=500, detail=f"結算醫院日報失敗: {str(e)}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _compact_report(report_id: str, report: dict) -> dict:
+        """
+        精簡日報封包 (供中央指揮部，頻寬受限時傳送)
+
+        血品僅列非零血型，陣列取代物件以縮短鍵名
+        """
+        return {
+            "id": report_id,
+            "h": report['hospital_id'],
+            "d": report['report_date'],
+            "st": [report['total_stations'], report['operational_stations'], report['offline_stations']],
+            "sx": report['surgeries_performed'],
+            "b": {
+                blood_type: [v['on_hand'], v['received'], v['consumed']]
+                for blood_type, v in report['blood_inventory'].items()
+                if v['on_hand'] or v['received'] or v['consumed']
+            },
+            "sh": [s['blood_type'] for s in report['critical_shortages']],
+            "eq": report['equipment_status'].get('open_alerts', 0)
+        }
+
+    def get_report_package(self, hospital_id: str, report_date: str) -> dict:
+        """取得已結算日報的 REPORT 封包"""
+        report = self.get_daily_report(hospital_id, report_date)
+        if not report.get('frozen'):
+            raise HTTPException(status_code=404, detail=f"{report_date} 日報尚未結算")
+
+        package = self._compact_report(report['report_id'], report)
+        package_json = json.dumps(package, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+        return {
+            "report_id": report['report_id'],
+            "report": report,
+            "package": package,
+            "package_size": len(package_json.encode('utf-8')),
+            "checksum": hashlib.sha256(package_json.encode('utf-8')).hexdigest()
+        }
+
+    def get_hospital_overview(self, hospital_id: str = 'HOSP-001') -> dict:
+        """醫院總覽 (只讀取彙總表，與回報站點數無關)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT hospital_name, total_stations, operational_status
+                FROM hospitals WHERE hospital_id = ?
+            """, (hospital_id,))
+            hospital = cursor.fetchone()
+            if not hospital:
+                raise HTTPException(status_code=404, detail=f"醫院 {hospital_id} 不存在")
+
+            cursor.execute("""
+                SELECT metric, metric_key, value, updated_at
+                FROM hospital_rollup_totals
+                WHERE hospital_id = ?
+            """, (hospital_id,))
+
+            blood = {blood_type: 0 for blood_type in config.BLOOD_TYPES}
+            totals = {'stations_reporting': 0, 'item_units': 0, 'equipment_alerts': 0}
+            last_updated = None
+            for row in cursor.fetchall():
+                if row['metric'] == 'blood':
+                    blood[row['metric_key']] = row['value']
+                else:
+                    totals[row['metric']] = row['value']
+                if row['updated_at'] and (last_updated is None or row['updated_at'] > last_updated):
+                    last_updated = row['updated_at']
+
+            return {
+                "hospital_id": hospital_id,
+                "hospital_name": hospital['hospital_name'],
+                "operational_status": hospital['operational_status'],
+                "total_stations": hospital['total_stations'],
+                "stations_reporting": totals['stations_reporting'],
+                "total_item_units": totals['item_units'],
+                "blood_inventory": blood,
+                "total_blood_units": sum(blood.values()),
+                "equipment_alerts": totals['equipment_alerts'],
+                "last_updated": last_updated
+            }
+        finally:
+            conn.close()
+
+    def get_hospital_item_distribution(self, item_code: str) -> List[Dict]:
+        """單一物品在各站點的庫存 (走 item_code 索引)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT station_id, quantity, updated_at
+                FROM hospital_item_balances
+                WHERE item_code = ?
+                ORDER BY quantity DESC
+            """, (item_code,))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    # ========== 排程備份記錄 ==========
+
+    def start_backup_run(self, run_type: str, trigger_type: str, target_dir: str) -> int:
+        """新增備份執行記錄，回傳記錄ID"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT INTO backup_runs (run_type, trigger_type, target_dir)
+                VALUES (?, ?, ?)
+            """, (run_type, trigger_type, target_dir))
+            conn.commit()
+            return cursor.lastrowid
+        finally:
+            conn.close()
 
-        # 匯入變更(複用 import_sync_package 邏輯)
-        result = self.import_sync_package(package_id, changes, checksum, package_type)
+    def finish_backup_run(
+        self,
+        run_id: int,
+        status: str,
+        duration_seconds: float,
+        bytes_written: Optional[int] = None,
+        link_seq: Optional[int] = None,
+        rotated_files: int = 0,
+        error_message: Optional[str] = None
+    ):
+        """更新備份執行結果"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
 
-        if result['success']:
-            # 更新站點同步狀態
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute("""
-                    UPDATE stations
-                    SET last_sync_at = CURRENT_TIMESTAMP,
-                        sync_status = 'SYNCED'
-                    WHERE station_id = ?
-                """, (station_id,))
-                conn.commit()
-            except Exception as e:
-                logger.warning(f"更新站點同步狀態失敗: {e}")
-            finally:
-                conn.close()
+        try:
+            cursor.execute("""
+                UPDATE backup_runs
+                SET status = ?, finished_at = CURRENT_TIMESTAMP, duration_seconds = ?,
+                    bytes = ?, link_seq = ?, rotated_files = ?, error_message = ?
+                WHERE id = ?
+            """, (status, round(duration_seconds, 3), bytes_written, link_seq, rotated_files, error_message, run_id))
+            conn.commit()
+        finally:
+            conn.close()
 
-        return {
-            **result,
-            "station_id": station_id,
-            "response_package_id": f"PKG-RESPONSE-{package_id}"
-        }
+    def get_backup_runs(self, limit: int = 50) -> List[Dict]:
+        """查詢最近的備份執行記錄"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                SELECT * FROM backup_runs
+                ORDER BY id DESC
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
 
 
 # ============================================================================
@@ -2520,6 +4473,78 @@ app = FastAPI(
     description="醫療站物資、血袋、設備、手術記錄管理系統"
 )
 
+# ========== 請求優先等級 ==========
+
+# 臨床寫入：延遲直接影響病患處置
+CRITICAL_ROUTES = (
+    ('POST', '/api/pharmacy/dispense/'),
+    ('POST', '/api/blood/receive'),
+    ('POST', '/api/blood/consume'),
+    ('POST', '/api/blood/transfer'),
+    ('POST', '/api/blood/emergency/'),
+    ('POST', '/api/receive'),
+    ('POST', '/api/consume'),
+    ('POST', '/api/surgery/record'),
+    ('POST', '/api/equipment/check/'),
+    ('POST', '/api/batch'),
+)
+
+# 匯出、備份、同步：可延後或拒絕 (另外所有路徑含 /export/ 者)
+BULK_ROUTES = (
+    '/api/emergency/download-all',
+    '/api/emergency/quick-backup',
+    '/api/emergency/qr-code',
+    '/api/emergency/backup/verify',
+    '/api/emergency/backup/incremental',
+    '/api/emergency/backup/chain/restore',
+    '/api/backups/run',
+    '/api/analytics/export',
+    '/api/station/sync/',
+    '/api/hospital/sync/',
+    '/api/hospital/reports/daily/package',
+)
+
+# 不受准入控制：長連線與監控端點
+UNMANAGED_ROUTES = ('/api/events/stream', '/api/health', '/api/admission/status')
+
+
+def _route_matches(path: str, route: str) -> bool:
+    """以 / 結尾的規則比對前綴，其餘比對完整路徑"""
+    return path == route or (route.endswith('/') and path.startswith(route))
+
+
+def _classify_request(method: str, path: str) -> Optional[str]:
+    """依方法與路徑決定優先等級；非 API 路徑 (頁面、靜態檔) 不受控制"""
+    if not path.startswith('/api/') or path in UNMANAGED_ROUTES:
+        return None
+    if any(method == m and _route_matches(path, route) for m, route in CRITICAL_ROUTES):
+        return CRITICAL
+    if '/export/' in path or any(_route_matches(path, route) for route in BULK_ROUTES):
+        return BULK
+    return INTERACTIVE
+
+
+admission = AdmissionController(
+    {
+        CRITICAL: PriorityClass(CRITICAL, config.ADMISSION_CRITICAL_CONCURRENCY, max_queue=64, queue_timeout=30),
+        INTERACTIVE: PriorityClass(INTERACTIVE, config.ADMISSION_INTERACTIVE_CONCURRENCY, max_queue=64, queue_timeout=10),
+        BULK: PriorityClass(BULK, config.ADMISSION_BULK_CONCURRENCY, max_queue=config.ADMISSION_BULK_QUEUE, queue_timeout=60),
+    },
+    critical_budget_ms=config.ADMISSION_CRITICAL_BUDGET_MS,
+    bulk_defer_seconds=config.ADMISSION_BULK_DEFER_SECONDS
+)
+
+# 寫入請求的 Idempotency-Key (db 於下方建立，連線於請求時才取得)
+idempotency_store = IdempotencyStore(
+    lambda: db.get_connection(),
+    ttl_seconds=config.IDEMPOTENCY_TTL_HOURS * 3600
+)
+
+# 先加入的中介層在內層：CORS 包在最外面 (准入拒絕的 503 也帶 CORS 標頭)，
+# 冪等處理在准入之後，被拒絕的請求不會佔用鍵
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+app.add_middleware(AdmissionMiddleware, controller=admission, classify=_classify_request)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -2589,30 +4614,72 @@ async def manual_setup():
     return RedirectResponse(url="/setup_wizard.html")
 
 
+# 靜態資源 (啟動時預先壓縮；/static 檔案另有指紋網址，HTML 中的引用自動改寫)
+static_assets = StaticAssetStore(
+    mmap_threshold=config.STATIC_ASSET_MMAP_THRESHOLD,
+    check_interval=config.STATIC_ASSET_CHECK_SECONDS
+)
+static_assets.add_directory("/static", Path(__file__).parent / "static")
+static_assets.add_file("/Index.html", Path(__file__).parent / "Index.html", rewrite=True)
+static_assets.add_file("/setup_wizard.html", Path(__file__).parent / "setup_wizard.html", rewrite=True)
+# Service Worker 需由根路徑提供 (控制範圍為整個網站)，其中預先快取的 /static 網址同樣改寫為指紋網址
+static_assets.add_file("/sw.js", Path(__file__).parent / "sw.js", rewrite=True)
+
+
+def _static_asset_response(request: Request, url: str, not_found: str) -> Response:
+    """
+    回傳預先壓縮的靜態資源
+
+    指紋網址帶 immutable 長期快取，其餘網址 no-cache 並以 ETag 驗證
+    """
+    asset, immutable = static_assets.lookup(url)
+    if asset is None:
+        raise HTTPException(status_code=404, detail=not_found)
+
+    encoding = asset.select_encoding(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    }
+    if asset.encodings:
+        headers["Vary"] = "Accept-Encoding"
+
+    if_none_match = _parse_if_none_match(request.headers.get("if-none-match"))
+    if headers["ETag"] in if_none_match or "*" in if_none_match:
+        static_assets.stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    static_assets.stats["served"] += 1
+    if encoding:
+        static_assets.stats["compressed_hits"] += 1
+        headers["Content-Encoding"] = encoding
+        return Response(content=asset.encodings[encoding], media_type=asset.media_type, headers=headers)
+    if asset.mapped:
+        headers["Content-Length"] = str(asset.size)
+        return StreamingResponse(asset.iter_content(), media_type=asset.media_type, headers=headers)
+    return Response(content=asset.content, media_type=asset.media_type, headers=headers)
+
+
 @app.get("/setup_wizard.html")
-async def serve_setup_wizard():
+def serve_setup_wizard(request: Request):
     """
     Serve setup wizard HTML file
     """
-    from pathlib import Path
-    wizard_file = Path(__file__).parent / "setup_wizard.html"
-    if wizard_file.exists():
-        return FileResponse(wizard_file)
-    else:
-        raise HTTPException(status_code=404, detail="Setup wizard not found")
+    return _static_asset_response(request, "/setup_wizard.html", "Setup wizard not found")
 
 
 @app.get("/Index.html")
-async def serve_index():
+def serve_index(request: Request):
     """
     Serve main Index.html file
     """
-    from pathlib import Path
-    index_file = Path(__file__).parent / "Index.html"
-    if index_file.exists():
-        return FileResponse(index_file)
-    else:
-        raise HTTPException(status_code=404, detail="Index.html not found")
+    return _static_asset_response(request, "/Index.html", "Index.html not found")
+
+
+@app.get("/sw.js")
+def serve_service_worker(request: Request):
+    """離線用 Service Worker (快取頁面外殼)"""
+    return _static_asset_response(request, "/sw.js", "sw.js not found")
 
 
 @app.get("/test_data.html")
@@ -2654,10 +4721,105 @@ async def serve_debug():
         raise HTTPException(status_code=404, detail="debug.html not found")
 
 
-# 掛載靜態文件(Logo圖片等)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.get("/static/{filename}")
+def serve_static(request: Request, filename: str):
+    """靜態文件 (Logo圖片等)，支援指紋網址 /static/<名稱>.<雜湊>.<副檔名>"""
+    return _static_asset_response(request, f"/static/{filename}", "File not found")
 
 db = DatabaseManager(config.DATABASE_PATH)
+backup_engine = SQLiteBackupEngine(config.DATABASE_PATH)
+# 排程備份與增量備份鏈使用節流引擎，避免影響前景 API
+throttled_backup_engine = SQLiteBackupEngine(
+    config.DATABASE_PATH,
+    pages_per_step=config.BACKUP_THROTTLE_PAGES,
+    throttle_sleep=config.BACKUP_THROTTLE_SLEEP
+)
+backup_chain = BackupChain(config.BACKUP_CHAIN_DIR, config.DATABASE_PATH, throttled_backup_engine)
+backup_cache = BackupArtifactCache(config.BACKUP_CACHE_DIR, DataVersionMonitor(config.DATABASE_PATH))
+# 高頻查詢端點的回應快取 (依資料表版本重用)
+read_cache = ReadCache(db.table_versions, max_bytes=config.READ_CACHE_MAX_BYTES)
+# 即時推播 (交易提交後發布變更訊息)
+event_bus = EventBus(buffer_size=config.EVENT_STREAM_BUFFER, max_subscribers=config.EVENT_STREAM_MAX_CLIENTS)
+
+# 匯出用執行緒池 (ZIP 大型成員平行壓縮)
+export_executor = ThreadPoolExecutor(max_workers=config.EXPORT_WORKERS, thread_name_prefix="export")
+
+
+def _export_worker_init():
+    """匯出子行程初始化：fork 繼承的執行緒池物件沒有執行緒，需重建"""
+    global export_executor
+    export_executor = ThreadPoolExecutor(max_workers=config.EXPORT_WORKERS, thread_name_prefix="export")
+
+
+# 匯出工作行程池 (CSV / 備份包 / QR Code / 同步封包)
+export_pool = ExportWorkerPool(
+    max_workers=config.EXPORT_PROCESS_WORKERS,
+    max_queue=config.EXPORT_QUEUE_MAX,
+    initializer=_export_worker_init,
+    versions=db.table_versions
+)
+
+
+async def _run_export_job(fn, *args, job: str, **kwargs):
+    """在匯出行程池執行工作，並將排隊已滿/子行程錯誤轉為 HTTP 錯誤"""
+    try:
+        return await export_pool.run(fn, *args, job=job, **kwargs)
+    except ExportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ExportJobError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+def _csv_export_chunks(kind: str, params: Dict) -> Iterator[bytes]:
+    """CSV 串流 (於匯出子行程中執行，寫入 spool 檔由主行程讀取送出)"""
+    streams = {
+        "inventory": db.export_inventory_csv,
+        "inventory_events": db.export_inventory_events_csv,
+        "surgery_records": db.export_surgery_records_csv
+    }
+    return streams[kind](**params)
+
+
+async def _csv_export_response(kind: str, params: Dict, filename: str, media_type: str) -> StreamingResponse:
+    """
+    於子行程產生 CSV 並串流給客戶端
+
+    子行程寫入 spool 檔，主行程邊讀邊送；子行程產生完即釋放，下載緩慢的客戶端不佔用匯出行程。
+
+    等到第一段內容產生後才送出回應標頭，排隊已滿或查詢失敗仍可回傳對應的錯誤狀態
+    """
+    chunks = export_pool.stream(_csv_export_chunks, kind, params, job=f"csv:{kind}")
+    try:
+        first = await run_in_threadpool(next, chunks, b"")
+    except ExportQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except ExportJobError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    async def body():
+        try:
+            if first:
+                yield first
+            while True:
+                chunk = await run_in_threadpool(next, chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        except ExportJobError as e:
+            logger.error(f"CSV 匯出中斷 ({kind}): {e.detail}")
+        finally:
+            await run_in_threadpool(chunks.close)
+
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
+def _generate_sync_package_job(params: Dict) -> Dict:
+    """產生同步封包 (於匯出子行程中執行)"""
+    return db.generate_sync_package(**params)
 
 
 # ========== 背景任務：每日設備重置 (v1.4.5) ==========
@@ -2682,6 +4844,7 @@ async def daily_equipment_reset():
 
             # 執行重置
             affected = db.reset_equipment_daily()
+            event_bus.publish('equipment', None, action='DAILY_RESET', affected=affected)
             logger.info(f"✓ 設備每日重置已執行 ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')}): {affected} 個設備已重置")
 
         except Exception as e:
@@ -2690,13 +4853,214 @@ async def daily_equipment_reset():
             await asyncio.sleep(3600)
 
 
+# ========== 背景任務：醫院日報結算 ==========
+
+async def daily_report_close():
+    """每日結算前一日的醫院日報並產生 REPORT 封包"""
+    while True:
+        try:
+            now = datetime.now()
+            target_time = datetime.combine(now.date(), config.DAILY_REPORT_CLOSE_TIME)
+            if now >= target_time:
+                target_time += timedelta(days=1)
+
+            await asyncio.sleep((target_time - now).total_seconds())
+
+            report_date = (target_time - timedelta(days=1)).strftime('%Y-%m-%d')
+            conn = db.get_connection()
+            try:
+                hospital_ids = [row['hospital_id'] for row in conn.execute("SELECT hospital_id FROM hospitals")]
+            finally:
+                conn.close()
+
+            for hospital_id in hospital_ids:
+                db.close_daily_report(hospital_id, report_date)
+
+        except Exception as e:
+            logger.error(f"醫院日報結算任務錯誤: {e}")
+            await asyncio.sleep(3600)
+
+
+# ========== 背景任務：排程備份 ==========
+
+_backup_run_lock = threading.Lock()
+
+
+def run_backup_job(run_type: str, trigger_type: str = 'SCHEDULED') -> Dict:
+    """
+    執行一次備份並記錄於 backup_runs
+
+    FULL 建立新基底快照，INCREMENTAL 寫入差異 (尚無基底時自動建立基底)；
+    完成後依數量與總大小輪替舊的基底及其差異。
+    排程與手動觸發共用同一把鎖，另一個備份執行中時回傳 busy (不等待)
+    """
+    run_id = db.start_backup_run(run_type, trigger_type, config.BACKUP_CHAIN_DIR)
+    started = datetime.now()
+
+    if not _backup_run_lock.acquire(blocking=False):
+        db.finish_backup_run(run_id, 'SKIPPED', 0, error_message="另一個備份正在執行")
+        return {"run_id": run_id, "status": "SKIPPED", "busy": True}
+
+    try:
+        if run_type == 'FULL':
+            link, skipped = backup_chain.create_base(), False
+        else:
+            result = backup_chain.create(config.BACKUP_CHAIN_MAX_DELTAS)
+            link, skipped = result["link"], result["skipped"]
+
+        # 輪替：先依保留數量，再依總大小 (至少保留最新的基底)
+        rotated = backup_chain.prune(config.BACKUP_KEEP_FULL)
+        keep = config.BACKUP_KEEP_FULL
+        while keep > 1 and backup_chain.total_size() > config.BACKUP_MAX_BYTES:
+            keep -= 1
+            rotated += backup_chain.prune(keep)
+
+        duration = (datetime.now() - started).total_seconds()
+        status = 'SKIPPED' if skipped else 'SUCCESS'
+        bytes_written = 0 if skipped else link['size']
+        db.finish_backup_run(
+            run_id, status, duration,
+            bytes_written=bytes_written,
+            link_seq=link['seq'],
+            rotated_files=len(rotated)
+        )
+        if not skipped:
+            logger.info(
+                f"✓ 排程備份 {run_type} 完成: 環節 #{link['seq']} ({link['size']} bytes, {duration:.1f}s)"
+                + (f", 輪替 {len(rotated)} 個檔案" if rotated else "")
+            )
+        return {
+            "run_id": run_id, "status": status, "seq": link['seq'], "bytes": bytes_written,
+            "seconds": duration, "link": link
+        }
+
+    except Exception as e:
+        duration = (datetime.now() - started).total_seconds()
+        db.finish_backup_run(run_id, 'FAILED', duration, error_message=str(e))
+        logger.error(f"排程備份 {run_type} 失敗: {e}")
+        return {"run_id": run_id, "status": "FAILED", "error": str(e)}
+    finally:
+        _backup_run_lock.release()
+
+
+async def scheduled_backups():
+    """每小時增量備份、每日完整備份"""
+    interval = timedelta(minutes=config.BACKUP_INCREMENTAL_INTERVAL_MINUTES)
+    now = datetime.now()
+    next_incremental = now + interval
+    next_full = datetime.combine(now.date(), config.BACKUP_FULL_TIME)
+    if now >= next_full:
+        next_full += timedelta(days=1)
+
+    while True:
+        try:
+            due = min(next_incremental, next_full)
+            await asyncio.sleep(max(0.0, (due - datetime.now()).total_seconds()))
+
+            if datetime.now() >= next_full:
+                await run_in_threadpool(run_backup_job, 'FULL')
+                next_full += timedelta(days=1)
+                next_incremental = datetime.now() + interval
+            else:
+                await run_in_threadpool(run_backup_job, 'INCREMENTAL')
+                next_incremental += interval
+
+        except Exception as e:
+            logger.error(f"排程備份任務錯誤: {e}")
+            await asyncio.sleep(600)
+
+
+# ========== 背景任務：exports/ 保留政策 ==========
+
+async def exports_retention():
+    """定期清理 exports/temp/ 中由系統產生、超過數量或天數的暫存檔"""
+    while True:
+        try:
+            removed = []
+            for directory, pattern in config.EXPORTS_RETENTION_TARGETS:
+                removed += await run_in_threadpool(
+                    apply_retention, directory, pattern,
+                    max_files=config.EXPORTS_MAX_FILES,
+                    max_age_days=config.EXPORTS_MAX_AGE_DAYS
+                )
+            if removed:
+                logger.info(f"✓ exports/ 保留政策: 已清理 {len(removed)} 個檔案")
+        except Exception as e:
+            logger.error(f"exports/ 清理任務錯誤: {e}")
+
+        await asyncio.sleep(3600)
+
+
+# ========== 背景任務：Idempotency-Key 清理 ==========
+
+async def idempotency_key_cleanup():
+    """每小時刪除超過保存期限的冪等鍵"""
+    while True:
+        try:
+            removed = await run_in_threadpool(idempotency_store.prune)
+            if removed:
+                logger.info(f"✓ 已清理 {removed} 個過期的 Idempotency-Key")
+        except Exception as e:
+            logger.error(f"Idempotency-Key 清理任務錯誤: {e}")
+
+        await asyncio.sleep(3600)
+
+
+# ========== 背景任務：逾期庫存保留釋放 ==========
+
+async def dispense_reservation_expiry():
+    """定期釋放逾期未審核的領用保留量，通知藥師端重新整理"""
+    while True:
+        try:
+            expired = await run_in_threadpool(db.expire_dispense_reservations)
+            for reservation in expired:
+                event_bus.publish(
+                    'dispense', action='RESERVATION_EXPIRED', dispenseId=reservation['dispense_id'],
+                    code=reservation['item_code'], quantity=reservation['quantity']
+                )
+            if expired:
+                logger.info(f"✓ 已釋放 {len(expired)} 筆逾期未審核的領用保留")
+        except Exception as e:
+            logger.error(f"領用保留逾期檢查錯誤: {e}")
+
+        await asyncio.sleep(config.DISPENSE_RESERVATION_CHECK_SECONDS)
+
+
 @app.on_event("startup")
 async def startup_event():
     """應用啟動時執行"""
+    event_bus.attach_loop(asyncio.get_running_loop())
+
+    # 匯出子行程需在其他執行緒啟動前 fork
+    export_pool.start()
+    status_info = export_pool.get_status()
+    logger.info(f"✓ 匯出工作池已啟動 ({status_info['mode']}, {status_info['max_workers']} workers)")
+
     # 啟動每日設備重置背景任務
     asyncio.create_task(daily_equipment_reset())
     logger.info("✓ 每日設備重置背景任務已啟動 (07:00am)")
 
+    asyncio.create_task(daily_report_close())
+    logger.info(f"✓ 醫院日報結算背景任務已啟動 ({config.DAILY_REPORT_CLOSE_TIME.strftime('%H:%M')})")
+
+    asyncio.create_task(exports_retention())
+    asyncio.create_task(idempotency_key_cleanup())
+    asyncio.create_task(dispense_reservation_expiry())
+
+    static_assets.build()
+    assets = static_assets.get_status()["assets"]
+    logger.info(
+        f"✓ 靜態資源已預先壓縮 ({len(assets)} 檔, "
+        f"{sum(a['size'] for a in assets) // 1024} KB → "
+        f"gzip {sum(a['encodings'].get('gzip', a['size']) for a in assets) // 1024} KB)"
+    )
+
+    asyncio.create_task(scheduled_backups())
+    logger.info(
+        f"✓ 排程備份已啟動 (增量每 {config.BACKUP_INCREMENTAL_INTERVAL_MINUTES} 分鐘, "
+        f"完整 {config.BACKUP_FULL_TIME.strftime('%H:%M')}, 目標 {config.BACKUP_TARGET_DIR})"
+    )
+
 
 # ============================================================================
 # API 端點
@@ -2818,55 +5182,245 @@ async def get_station_types():
     }
 
 
+# ========== 讀取快取 ==========
+
+# 各快取端點所依賴的資料表 (任一表有寫入提交即重建)
+STATS_TABLES = ('items', 'inventory_events', 'blood_inventory', 'equipment')
+ITEMS_TABLES = ('items', 'inventory_events', 'medicines', 'reserved_stock')
+BLOOD_TABLES = ('blood_inventory', 'emergency_blood_bags')
+EQUIPMENT_TABLES = ('equipment',)
+
+
+def _cached_json(request: Request, endpoint: str, params: tuple, tables: tuple, builder) -> Response:
+    """
+    回傳快取的 JSON 回應 (資料表版本未變時不查詢資料庫)
+
+    附強 ETag；If-None-Match 相符時直接回 304，只比對記憶體中的版本號
+    """
+    headers = {"Cache-Control": "no-cache"}
+
+    etag = read_cache.etag(endpoint, params, tables)
+    if etag in _parse_if_none_match(request.headers.get("if-none-match")):
+        read_cache.record_not_modified()
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    body, etag = read_cache.get_or_build(endpoint, params, tables, builder)
+    return Response(content=body, media_type="application/json", headers={**headers, "ETag": etag})
+
+
+def _parse_if_none_match(value: Optional[str]) -> List[str]:
+    """解析 If-None-Match (可含多個 ETag；弱比較時忽略 W/ 前綴)"""
+    if not value:
+        return []
+    return [tag.strip().removeprefix("W/") for tag in value.split(",")]
+
+
+@app.get("/api/cache/status")
+async def get_read_cache_status():
+    """讀取快取狀態 (命中率、記憶體用量、各表版本)"""
+    return read_cache.get_status()
+
+
+@app.get("/api/static/status")
+async def get_static_assets_status():
+    """靜態資源狀態 (指紋網址、原始與壓縮後大小、304 次數)"""
+    return static_assets.get_status()
+
+
+@app.get("/api/admission/status")
+async def get_admission_status():
+    """准入控制狀態 (各優先等級執行中/排隊數、拒絕與延後次數、延遲百分位數)"""
+    return admission.get_status()
+
+
+# ========== 即時推播 API ==========
+
+@app.get("/api/events/stream")
+async def event_stream(
+    request: Request,
+    station_id: Optional[str] = Query(None, description="站點ID (可用逗號分隔多個)，留空則接收所有站點"),
+    topics: Optional[str] = Query(None, description=f"主題 (逗號分隔): {', '.join(EVENT_TOPICS)}")
+):
+    """
+    即時變更推播 (Server-Sent Events)
+
+    - event 為主題名稱，data 為 JSON (topic, station_id 與變更摘要)
+    - 緩衝區溢出或重連時補送不完整會收到 resync，用戶端應重新載入資料
+    - 重連時瀏覽器自動帶 Last-Event-ID，補送斷線期間的訊息
+    """
+    topic_filter = [t.strip() for t in topics.split(",") if t.strip()] if topics else None
+    unknown = set(topic_filter or ()) - set(EVENT_TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"未知的主題: {', '.join(sorted(unknown))}")
+    stations = [s.strip() for s in station_id.split(",") if s.strip()] if station_id else None
+
+    last_event_id = request.headers.get("last-event-id")
+    try:
+        subscription = event_bus.subscribe(
+            stations, topic_filter,
+            last_event_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        )
+    except EventBusFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.next_event(config.EVENT_STREAM_KEEPALIVE_SECONDS)
+                yield ": keepalive\n\n" if event is None else EventBus.format_sse(event)
+        finally:
+            event_bus.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/events/status")
+async def get_event_stream_status():
+    """即時推播狀態 (連線數、各連線緩衝與丟棄數)"""
+    return event_bus.get_status()
+
+
+def _publish_operation(op: str, request, result: dict, equipment_id: Optional[str] = None):
+    """寫入操作提交後發布即時變更訊息 (單一端點與 /api/batch 共用)"""
+    if op in ('receive', 'consume'):
+        event_bus.publish(
+            'inventory', request.stationId, action=op.upper(), code=request.itemCode, quantity=request.quantity
+        )
+    elif op in ('blood_receive', 'blood_consume'):
+        event_bus.publish(
+            'blood', request.stationId, action=op.split('_')[1].upper(), bloodType=request.bloodType,
+            quantity=request.quantity, newQuantity=result["newQuantity"]
+        )
+    elif op == 'equipment_check':
+        event_bus.publish(
+            'equipment', request.stationId, action='CHECK', equipmentId=equipment_id,
+            status=request.status, powerLevel=request.powerLevel
+        )
+        if request.status in config.EQUIPMENT_ALERT_STATUSES:
+            event_bus.publish('alert', request.stationId, kind='EQUIPMENT', equipmentId=equipment_id, status=request.status)
+    elif op == 'dispense_emergency':
+        event_bus.publish(
+            'dispense', request.stationCode, action='EMERGENCY', dispenseId=result["dispense_id"],
+            code=request.medicineCode, quantity=request.quantity
+        )
+        event_bus.publish(
+            'alert', request.stationCode, kind='EMERGENCY_DISPENSE', dispenseId=result["dispense_id"],
+            code=request.medicineCode, remainingStock=result["remaining_stock"],
+            reservedOverdrawn=result["reserved_overdrawn"]
+        )
+    elif op == 'dispense_normal':
+        event_bus.publish(
+            'dispense', request.stationCode, action='PENDING', dispenseId=result["dispense_id"],
+            code=request.medicineCode, quantity=request.quantity
+        )
+    elif op == 'surgery_record':
+        event_bus.publish(
+            'inventory', request.stationId, action='SURGERY', recordNumber=result["recordNumber"],
+            codes=[item.itemCode for item in request.consumptions]
+        )
+
+
 @app.get("/api/stats")
-async def get_stats(station_id: str = None):
+async def get_stats(request: Request, station_id: str = None):
     """取得系統統計(支援站點過濾)"""
     try:
-        stats = db.get_stats(station_id)
-        return stats
+        return _cached_json(request, "stats", (station_id,), STATS_TABLES, lambda: db.get_stats(station_id))
     except Exception as e:
         logger.error(f"取得統計失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ========== 物品管理 API ==========
+@app.get("/api/dashboard")
+async def get_dashboard(
+    station_id: str = None,
+    fields: Optional[str] = Query(
+        None, description=f"要回傳的區塊 (逗號分隔): {', '.join(DatabaseManager.DASHBOARD_FIELDS)}，留空則全部"
+    ),
+    dispense_limit: int = Query(50, ge=1, le=200, description="待處理領用最大筆數")
+):
+    """
+    儀表板彙總 (統計、物品、血袋、設備、待處理領用)
+
+    所有區塊在同一讀取交易中查詢，取代分別呼叫五個端點；
+    小螢幕可用 fields 只取需要的區塊，例如 fields=stats,blood
+    """
+    selected = None
+    if fields:
+        selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+        unknown = set(selected) - set(DatabaseManager.DASHBOARD_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知的區塊: {', '.join(sorted(unknown))}")
 
-@app.get("/api/items")
-async def get_items():
-    """取得所有物品 (包含一般物品與藥品)"""
     try:
-        # Get general inventory items
-        items = db.get_inventory_items()
+        return db.get_dashboard(station_id, selected, dispense_limit)
+    except Exception as e:
+        logger.error(f"取得儀表板失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # Get medicines from pharmacy database
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT
-                medicine_code as code,
-                COALESCE(brand_name, generic_name) as name,
-                unit,
-                current_stock,
-                min_stock,
-                '藥品' as category,
-                is_controlled_drug,
-                controlled_level
-            FROM medicines
-            WHERE is_active = 1
-            ORDER BY medicine_code
-        """)
 
-        medicines = [dict(row) for row in cursor.fetchall()]
+@app.get("/api/sync/changes")
+async def get_sync_changes(
+    since_version: int = Query(0, ge=0, description="上次同步回傳的 version，0 表示取得完整資料"),
+    station_id: Optional[str] = Query(None, description="血品只回傳此站點")
+):
+    """
+    離線鏡像同步 (平板端 IndexedDB)
+
+    回傳 since_version 之後變更的物品、血品與設備 (同一版本)，以及已刪除的鍵；
+    版本無效時回傳完整資料並標記 reset
+    """
+    try:
+        return db.get_sync_changes(since_version, station_id)
+    except Exception as e:
+        logger.error(f"取得同步差異失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        # Combine items and medicines
-        all_items = items + medicines
+# ========== 物品管理 API ==========
+
+@app.get("/api/items")
+async def get_items(
+    request: Request,
+    since_version: Optional[int] = Query(None, description="只回傳此版本之後有變更的物品 (差異查詢)")
+):
+    """
+    取得所有物品 (包含一般物品與藥品)
 
-        return {"items": all_items, "count": len(all_items)}
+    回應附 version；之後以 since_version=version 查詢只取得變更的物品與已刪除的代碼，
+    版本無效 (例如資料庫已還原) 時回傳完整清單
+    """
+    try:
+        if since_version is not None:
+            delta = db.get_items_delta(since_version)
+            if delta is not None:
+                return {**delta, "count": len(delta["items"]), "delta": True}
+        return _cached_json(request, "items", (), ITEMS_TABLES, _build_items_response)
     except Exception as e:
         logger.error(f"取得物品列表失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _build_items_response() -> Dict:
+    """查詢一般物品與藥品清單"""
+    # 先取版本再查詢：期間的新變更會在下次差異查詢重送，不會遺漏
+    version = db.get_change_version()
+
+    conn = db.get_connection()
+    try:
+        cursor = conn.cursor()
+        # Get general inventory items and medicines
+        all_items = db._query_inventory_items(cursor) + db._query_active_medicines(cursor)
+    finally:
+        conn.close()
+
+    return {"items": all_items, "count": len(all_items), "version": version, "delta": False}
+
+
 @app.post("/api/items")
 async def create_item(request: ItemCreateRequest):
     """新增物品"""
@@ -2989,37 +5543,65 @@ async def delete_item(code: str):
 @app.post("/api/receive")
 async def receive_item(request: ReceiveRequest):
     """進貨"""
-    return db.receive_item(request)
+    result = db.receive_item(request)
+    _publish_operation('receive', request, result)
+    return result
 
 
 @app.post("/api/consume")
 async def consume_item(request: ConsumeRequest):
     """消耗"""
-    return db.consume_item(request)
+    result = db.consume_item(request)
+    _publish_operation('consume', request, result)
+    return result
 
 
 # ========== 血袋管理 API ==========
 
 @app.get("/api/blood/inventory")
-async def get_blood_inventory(station_id: str = Query(None, description="站點ID，留空則查詢所有站點")):
+async def get_blood_inventory(
+    request: Request,
+    station_id: str = Query(None, description="站點ID，留空則查詢所有站點"),
+    since_version: Optional[int] = Query(None, description="只回傳此版本之後有變更的血品 (差異查詢)")
+):
     """取得血袋庫存(支援多站點)"""
     try:
-        inventory = db.get_blood_inventory(station_id)
-        return {"bloodInventory": inventory, "station_id": station_id}
+        if since_version is not None:
+            delta = db.get_blood_inventory_delta(since_version, station_id)
+            if delta is not None:
+                return {**delta, "station_id": station_id, "delta": True}
+        return _cached_json(
+            request, "blood_inventory", (station_id,), BLOOD_TABLES,
+            lambda: _build_blood_inventory_response(station_id)
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _build_blood_inventory_response(station_id: Optional[str]) -> Dict:
+    version = db.get_change_version()
+    return {
+        "bloodInventory": db.get_blood_inventory(station_id),
+        "station_id": station_id,
+        "version": version,
+        "delta": False
+    }
+
+
 @app.post("/api/blood/receive")
 async def receive_blood(request: BloodRequest):
     """血袋入庫"""
-    return db.process_blood('receive', request)
+    result = db.process_blood('receive', request)
+    _publish_operation('blood_receive', request, result)
+    return result
 
 
 @app.post("/api/blood/consume")
 async def consume_blood(request: BloodRequest):
     """血袋出庫"""
-    return db.process_blood('consume', request)
+    result = db.process_blood('consume', request)
+    _publish_operation('blood_consume', request, result)
+    return result
 
 
 @app.get("/api/blood/events")
@@ -3123,11 +5705,13 @@ async def get_emergency_blood_bags(status: Optional[str] = Query(None, descripti
 async def use_emergency_blood_bag(request: EmergencyBloodBagUseRequest):
     """使用緊急血袋"""
     try:
-        return db.use_emergency_blood_bag(
+        result = db.use_emergency_blood_bag(
             request.bloodBagCode,
             request.patientName,
             request.operator
         )
+        event_bus.publish('blood', None, action='EMERGENCY_USE', bloodBagCode=request.bloodBagCode)
+        return result
     except Exception as e:
         logger.error(f"緊急血袋使用失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -3432,6 +6016,9 @@ async def transfer_blood(request: BloodTransferRequest):
         conn.commit()
         conn.close()
 
+        for station, action in ((request.sourceStationId, 'TRANSFER_OUT'), (request.targetStationId, 'TRANSFER_IN')):
+            event_bus.publish('blood', station, action=action, bloodType=request.bloodType, quantity=request.quantity)
+
         logger.info(
             f"血袋併站轉移成功: {request.bloodType} {request.quantity}U "
             f"從 {request.sourceStationId} -> {request.targetStationId}"
@@ -3467,15 +6054,34 @@ async def get_equipment_status(station_id: str = None):
 
 
 @app.get("/api/equipment")
-async def get_equipment(station_id: str = None):
+async def get_equipment(
+    request: Request,
+    station_id: str = None,
+    since_version: Optional[int] = Query(None, description="只回傳此版本之後有變更的設備 (差異查詢)")
+):
     """取得所有設備"""
-    return await get_equipment_status(station_id)
+    try:
+        if since_version is not None:
+            delta = db.get_equipment_delta(since_version)
+            if delta is not None:
+                return {**delta, "count": len(delta["equipment"]), "delta": True}
+        return _cached_json(request, "equipment", (station_id,), EQUIPMENT_TABLES, lambda: _build_equipment_response(station_id))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _build_equipment_response(station_id: Optional[str]) -> Dict:
+    version = db.get_change_version()
+    status = db.get_equipment_status(station_id)
+    return {"equipment": status, "count": len(status), "version": version, "delta": False}
 
 
 @app.post("/api/equipment/check/{equipment_id}")
 async def check_equipment(equipment_id: str, request: EquipmentCheckRequest):
     """設備檢查"""
-    return db.check_equipment(equipment_id, request)
+    result = db.check_equipment(equipment_id, request)
+    _publish_operation('equipment_check', request, result, equipment_id)
+    return result
 
 
 @app.post("/api/equipment")
@@ -3580,7 +6186,9 @@ async def delete_equipment(equipment_id: str):
 @app.post("/api/surgery/record")
 async def create_surgery_record(request: SurgeryRecordRequest):
     """建立手術記錄"""
-    return db.create_surgery_record(request)
+    result = db.create_surgery_record(request)
+    _publish_operation('surgery_record', request, result)
+    return result
 
 
 @app.get("/api/surgery/records")
@@ -3606,142 +6214,216 @@ async def export_surgery_csv(
 ):
     """匯出手術記錄 CSV"""
     try:
-        csv_content = db.export_surgery_records_csv(start_date, end_date)
-
         filename = f"surgery_records_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-        return StreamingResponse(
-            iter([csv_content]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        return await _csv_export_response(
+            "surgery_records",
+            {"start_date": start_date, "end_date": end_date},
+            filename,
+            "text/csv"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"匯出 CSV 失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# ============================================================================
-# MIRS v2.3 - Emergency Dispense API (Break-the-Glass Feature)
-# ============================================================================
-
-@app.post("/api/pharmacy/dispense/emergency", status_code=201)
-async def emergency_dispense(request: EmergencyDispenseRequest):
-    """
-    緊急領用藥品 (Break-the-Glass)
-    - 不需要藥師 PIN 碼
-    - 立即扣庫存
-    - 記錄緊急原因
-    - 狀態設為 EMERGENCY
+# ========== 批次操作 API ==========
+
+# 操作類型 -> (請求模型, 寫入操作)；寫入操作只執行 SQL，由 execute_batch 統一提交
+BATCH_OPERATIONS = {
+    'receive': (ReceiveRequest, lambda cursor, req: db._receive_item(cursor, req)),
+    'consume': (ConsumeRequest, lambda cursor, req: db._consume_item(cursor, req)),
+    'blood_receive': (BloodRequest, lambda cursor, req: db._process_blood(cursor, 'receive', req)),
+    'blood_consume': (BloodRequest, lambda cursor, req: db._process_blood(cursor, 'consume', req)),
+    'equipment_check': (BatchEquipmentCheckRequest, lambda cursor, req: db._check_equipment(cursor, req.equipmentId, req)),
+    'dispense_emergency': (EmergencyDispenseRequest, lambda cursor, req: db._dispense_emergency(cursor, req)),
+    'dispense_normal': (NormalDispenseRequest, lambda cursor, req: db._dispense_normal(cursor, req)),
+    'surgery_record': (SurgeryRecordRequest, lambda cursor, req: db._create_surgery_record(cursor, req)),
+}
+
+# 操作類型 -> (對應單一端點路徑, 成功狀態碼)；操作的 idempotencyKey 與單一端點的 Idempotency-Key 共用，
+# 指紋依單一端點的請求計算，離線佇列重送時不論先前是否已由單一端點送達都不會重複執行
+BATCH_OPERATION_ENDPOINTS = {
+    'receive': ('/api/receive', 200),
+    'consume': ('/api/consume', 200),
+    'blood_receive': ('/api/blood/receive', 200),
+    'blood_consume': ('/api/blood/consume', 200),
+    'equipment_check': ('/api/equipment/check/{equipmentId}', 200),
+    'dispense_emergency': ('/api/pharmacy/dispense/emergency', 201),
+    'dispense_normal': ('/api/pharmacy/dispense/normal', 201),
+    'surgery_record': ('/api/surgery/record', 201),
+}
+
+
+def _batch_operation_fingerprint(operation: BatchOperation) -> str:
+    """依對應單一端點的請求 (路徑參數自 data 移出) 計算 Idempotency-Key 指紋"""
+    path_template, _ = BATCH_OPERATION_ENDPOINTS[operation.op]
+    path = path_template.format(**operation.data)
+    body = {key: value for key, value in operation.data.items() if f"{{{key}}}" not in path_template}
+    return request_fingerprint("POST", path, b"", json.dumps(body).encode("utf-8"))
+
+
+def _reserve_batch_keys(operations: List[BatchOperation]) -> Tuple[Dict[int, Dict], Dict[int, str]]:
     """
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    保留批次中各操作的 Idempotency-Key
 
-    try:
-        # 1. 檢查藥品是否存在 (先查 medicines 表，再查 items 表)
-        # 先查 medicines 表
-        cursor.execute("""
-            SELECT medicine_code, generic_name, brand_name, unit, current_stock
-            FROM medicines
-            WHERE medicine_code = ? AND is_active = 1
-        """, (request.medicineCode,))
-
-        medicine = cursor.fetchone()
+    Returns:
+        (已有結果的操作 {索引: 結果}, 新保留的鍵 {索引: 鍵})
+    """
+    resolved, reserved = {}, {}
+    for index, operation in enumerate(operations):
+        key = operation.idempotencyKey
+        if not key:
+            continue
+        state, record = idempotency_store.reserve(key, _batch_operation_fingerprint(operation))
+        if state == IDEMPOTENCY_NEW:
+            reserved[index] = key
+        elif state == IDEMPOTENCY_REPLAY:
+            body = json.loads(record["body"]) if record["body"] else None
+            if record["status_code"] < 400:
+                resolved[index] = {"success": True, "status_code": record["status_code"], "result": body, "replayed": True}
+            else:
+                detail = body.get("detail", body) if isinstance(body, dict) else body
+                resolved[index] = {"success": False, "status_code": record["status_code"], "error": detail, "replayed": True}
+        elif state == IDEMPOTENCY_IN_PROGRESS:
+            resolved[index] = {"success": False, "status_code": 409, "error": "相同 Idempotency-Key 的請求仍在處理中，請稍後重試"}
+        elif state == IDEMPOTENCY_UNKNOWN:
+            resolved[index] = {
+                "success": False, "status_code": 409,
+                "error": "此 Idempotency-Key 的請求執行中斷，結果不明 (寫入可能已生效)；請人工確認後再以新的鍵送出"
+            }
+        else:
+            resolved[index] = {"success": False, "status_code": 422, "error": "此 Idempotency-Key 已用於不同的請求"}
+    return resolved, reserved
 
-        # 如果不在 medicines 表，查 items 表
-        if not medicine:
-            cursor.execute("""
-                SELECT code as medicine_code, name as generic_name, name as brand_name, unit,
-                       (SELECT SUM(CASE WHEN event_type='RECEIVE' THEN quantity ELSE -quantity END)
-                        FROM inventory_events WHERE item_code = code) as current_stock
-                FROM items
-                WHERE code = ?
-            """, (request.medicineCode,))
-            medicine = cursor.fetchone()
 
-        if not medicine:
-            raise HTTPException(status_code=404, detail=f"藥品/物品代碼 {request.medicineCode} 不存在")
+def _complete_batch_keys(cursor, operations: List[BatchOperation], reserved: Dict[int, str],
+                         outcomes: Dict[int, Dict]) -> List[int]:
+    """
+    在批次交易提交前保存各操作的結果 (含 4xx，與單一端點相同)，鍵與寫入同時提交，
+    不會出現寫入已提交而鍵仍為執行中的情形
 
-        current_stock = medicine['current_stock'] or 0
+    Returns:
+        已保存結果的操作索引；5xx 的鍵不保存
+    """
+    completed = []
+    for index, key in reserved.items():
+        outcome = outcomes.get(index)
+        if outcome is None or (outcome["status_code"] or 500) >= 500:
+            continue
+        if outcome["success"]:
+            status_code, content = BATCH_OPERATION_ENDPOINTS[operations[index].op][1], outcome["result"]
+        else:
+            status_code, content = outcome["status_code"], {"detail": outcome["error"]}
+        body = json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        idempotency_store.complete(key, status_code, "application/json", body, cursor=cursor)
+        completed.append(index)
+    return completed
 
-        # 2. 檢查庫存是否足夠
-        if current_stock < request.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"庫存不足！當前庫存: {current_stock} {medicine['unit']}, 需要: {request.quantity} {medicine['unit']}"
-            )
 
-        # 3. 建立緊急領用記錄
-        medicine_name = medicine['brand_name'] or medicine['generic_name']
+@app.post("/api/batch")
+async def execute_batch(request: BatchRequest):
+    """
+    批次寫入 (例如手術結束時一次記錄手術、耗材、血袋與設備檢查)
+
+    - 所有操作在同一交易中依序執行，只提交一次；後面的操作看得到前面操作的結果
+    - atomic=true (預設): 任一操作失敗則全部回滾，回應狀態碼為失敗操作的狀態碼
+    - atomic=false: 失敗的操作個別回滾，其餘照常提交
+    - 任一操作的 data 驗證失敗時整個批次回傳 422，不執行任何操作
+    - 操作帶 idempotencyKey 時與單一端點的 Idempotency-Key 共用：已執行過的操作不再執行，
+      結果標示 replayed (離線佇列重送用)
+    """
+    prepared, errors = [], []
+    for index, operation in enumerate(request.operations):
+        spec = BATCH_OPERATIONS.get(operation.op)
+        if spec is None:
+            errors.append({"index": index, "op": operation.op, "error": f"未知的操作類型，可用: {', '.join(BATCH_OPERATIONS)}"})
+            continue
+        model, handler = spec
+        try:
+            prepared.append((operation.op, model(**operation.data), handler))
+        except ValidationError as e:
+            errors.append({"index": index, "op": operation.op, "error": json.loads(e.json(include_url=False))})
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
 
-        cursor.execute("""
-            INSERT INTO dispense_records (
-                medicine_code, medicine_name, quantity, unit,
-                dispensed_by, status, emergency_reason,
-                patient_ref_id, patient_name, station_code,
-                created_at
-            ) VALUES (?, ?, ?, ?, ?, 'EMERGENCY', ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (
-            request.medicineCode,
-            medicine_name,
-            request.quantity,
-            medicine['unit'],
-            request.dispensedBy,
-            request.emergencyReason,
-            request.patientRefId,
-            request.patientName,
-            request.stationCode
-        ))
+    resolved, reserved = _reserve_batch_keys(request.operations)
+    outcomes, committed, completed = None, False, []
+    pending = [i for i in range(len(prepared)) if i not in resolved]
 
-        dispense_id = cursor.lastrowid
+    def save_keys(cursor, executed: List[Dict]):
+        completed.extend(_complete_batch_keys(cursor, request.operations, reserved, dict(zip(pending, executed))))
 
-        # 4. 立即記錄庫存消耗事件
-        cursor.execute("""
-            INSERT INTO inventory_events (
-                event_type, item_code, quantity, remarks, station_id, operator, timestamp
-            ) VALUES ('CONSUME', ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (
-            request.medicineCode,
-            request.quantity,
-            f"🚨 緊急領用: {request.emergencyReason}",
-            request.stationCode,
-            request.dispensedBy
-        ))
+    try:
+        if request.atomic and any(not r["success"] for r in resolved.values()):
+            executed = [
+                {"success": False, "status_code": None, "error": "未執行 (先前的操作失敗，批次已回滾)"}
+                for _ in pending
+            ]
+        else:
+            executed, committed = db.execute_batch(
+                [(prepared[i][2], (prepared[i][1],)) for i in pending],
+                atomic=request.atomic,
+                before_commit=save_keys
+            )
+        outcomes = [resolved.get(i) for i in range(len(prepared))]
+        for i, outcome in zip(pending, executed):
+            outcomes[i] = outcome
+    except Exception as e:
+        logger.error(f"批次操作失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # 未提交 (含提交失敗) 或未保存結果的鍵釋放，允許以同一鍵重試
+        for index, key in reserved.items():
+            if not committed or index not in completed:
+                idempotency_store.release(key)
+
+    results = []
+    for index, ((op, req, _), outcome) in enumerate(zip(prepared, outcomes)):
+        results.append({"index": index, "op": op, **outcome})
+        if committed and outcome["success"] and not outcome.get("replayed"):
+            _publish_operation(op, req, outcome["result"], getattr(req, 'equipmentId', None))
+
+    succeeded = sum(1 for r in results if r["success"])
+    body = {
+        "success": committed and succeeded == len(results),
+        "atomic": request.atomic,
+        "committed": committed,
+        "succeeded": succeeded if committed else 0,
+        "failed": len(results) - succeeded,
+        "results": results
+    }
 
-        # 5. 如果是 medicines 表的藥品，更新 current_stock
-        cursor.execute("SELECT medicine_code FROM medicines WHERE medicine_code = ?", (request.medicineCode,))
-        if cursor.fetchone():
-            cursor.execute("""
-                UPDATE medicines
-                SET current_stock = current_stock - ?
-                WHERE medicine_code = ?
-            """, (request.quantity, request.medicineCode))
+    if not committed:
+        failure = next(r for r in results if not r["success"] and r["status_code"])
+        logger.warning(f"批次操作已回滾: 第 {failure['index'] + 1} 項 ({failure['op']}) 失敗 - {failure['error']}")
+        return JSONResponse(status_code=failure["status_code"], content=body)
 
-        conn.commit()
+    logger.info(f"批次操作完成: {succeeded}/{len(results)} 項成功")
+    return body
 
-        new_stock = current_stock - request.quantity
-        logger.info(f"🚨 緊急領用成功: 藥品={medicine_name}, 數量={request.quantity}, 領用人={request.dispensedBy}, 原因={request.emergencyReason}")
 
-        return {
-            "success": True,
-            "message": "緊急領用成功，已立即扣除庫存",
-            "dispense_id": dispense_id,
-            "medicine_name": medicine_name,
-            "quantity": request.quantity,
-            "unit": medicine['unit'],
-            "remaining_stock": new_stock,
-            "warning": "⚠️ 此為緊急領用，請藥師上班後盡快確認"
-        }
+# ============================================================================
+# MIRS v2.3 - Emergency Dispense API (Break-the-Glass Feature)
+# ============================================================================
 
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"緊急領用失敗: {e}")
-        raise HTTPException(status_code=500, detail=f"緊急領用失敗: {str(e)}")
-    finally:
-        conn.close()
+@app.post("/api/pharmacy/dispense/emergency", status_code=201)
+async def emergency_dispense(request: EmergencyDispenseRequest):
+    """
+    緊急領用藥品 (Break-the-Glass)
+    - 不需要藥師 PIN 碼
+    - 立即扣庫存
+    - 記錄緊急原因
+    - 狀態設為 EMERGENCY
+    """
+    result = db.dispense_emergency(request)
+    _publish_operation('dispense_emergency', request, result)
+    logger.info(f"🚨 緊急領用成功: 藥品={result['medicine_name']}, 數量={request.quantity}, 領用人={request.dispensedBy}, 原因={request.emergencyReason}")
+    if result["reserved_overdrawn"]:
+        logger.warning(f"🚨 緊急領用動用待審核保留: 藥品={request.medicineCode}, 數量={result['reserved_overdrawn']}")
+    return result
 
 
 @app.post("/api/pharmacy/dispense/normal", status_code=201)
@@ -3752,97 +6434,17 @@ async def normal_dispense(request: NormalDispenseRequest):
     - 不立即扣庫存
     - 等待藥師 PIN 碼審核
     """
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    try:
-        # 檢查藥品/物品是否存在 (先查 medicines 表，再查 items 表)
-        # 先查 medicines 表
-        cursor.execute("""
-            SELECT medicine_code, generic_name, brand_name, unit, current_stock
-            FROM medicines
-            WHERE medicine_code = ? AND is_active = 1
-        """, (request.medicineCode,))
-
-        medicine = cursor.fetchone()
-
-        # 如果不在 medicines 表，查 items 表
-        if not medicine:
-            cursor.execute("""
-                SELECT code as medicine_code, name as generic_name, name as brand_name, unit,
-                       (SELECT SUM(CASE WHEN event_type='RECEIVE' THEN quantity ELSE -quantity END)
-                        FROM inventory_events WHERE item_code = code) as current_stock
-                FROM items
-                WHERE code = ?
-            """, (request.medicineCode,))
-            medicine = cursor.fetchone()
-
-        if not medicine:
-            raise HTTPException(status_code=404, detail=f"藥品/物品代碼 {request.medicineCode} 不存在")
-
-        current_stock = medicine['current_stock'] or 0
-
-        # 預檢查庫存
-        if current_stock < request.quantity:
-            raise HTTPException(
-                status_code=400,
-                detail=f"庫存不足！當前庫存: {current_stock} {medicine['unit']}, 需要: {request.quantity} {medicine['unit']}"
-            )
-
-        # 建立待審核領用記錄
-        medicine_name = medicine['brand_name'] or medicine['generic_name']
-
-        cursor.execute("""
-            INSERT INTO dispense_records (
-                medicine_code, medicine_name, quantity, unit,
-                dispensed_by, status,
-                patient_ref_id, patient_name, prescription_id,
-                station_code, created_at
-            ) VALUES (?, ?, ?, ?, ?, 'PENDING', ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (
-            request.medicineCode,
-            medicine_name,
-            request.quantity,
-            medicine['unit'],
-            request.dispensedBy,
-            request.patientRefId,
-            request.patientName,
-            request.prescriptionId,
-            request.stationCode
-        ))
-
-        dispense_id = cursor.lastrowid
-        conn.commit()
-
-        logger.info(f"📋 正常領用請求建立: 藥品={medicine_name}, 數量={request.quantity}, 領用人={request.dispensedBy}")
-
-        return {
-            "success": True,
-            "message": "領用請求已建立，等待藥師審核",
-            "dispense_id": dispense_id,
-            "status": "PENDING",
-            "medicine_name": medicine_name,
-            "quantity": request.quantity,
-            "unit": medicine['unit']
-        }
-
-    except HTTPException:
-        conn.rollback()
-        raise
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"建立領用請求失敗: {e}")
-        raise HTTPException(status_code=500, detail=f"建立領用請求失敗: {str(e)}")
-    finally:
-        conn.close()
+    result = db.dispense_normal(request)
+    _publish_operation('dispense_normal', request, result)
+    logger.info(f"📋 正常領用請求建立: 藥品={result['medicine_name']}, 數量={request.quantity}, 領用人={request.dispensedBy}")
+    return result
 
 
 @app.post("/api/pharmacy/dispense/approve")
 async def approve_dispense(request: DispenseApprovalRequest):
     """
     藥師審核領用 (使用 PIN 碼)
-    - 審核 PENDING 記錄 → 扣庫存
+    - 審核 PENDING 記錄 → 扣庫存，保留轉為消耗 (保留已逾期者依可用庫存檢查)
     - 確認 EMERGENCY 記錄 → 不扣庫存(已扣過)
     """
     # TODO: PIN 碼應該從配置或資料庫讀取
@@ -3851,8 +6453,7 @@ async def approve_dispense(request: DispenseApprovalRequest):
     if request.pinCode != PHARMACIST_PIN:
         raise HTTPException(status_code=401, detail="PIN 碼錯誤，拒絕審核")
 
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db.get_connection()
     cursor = conn.cursor()
 
     try:
@@ -3868,6 +6469,9 @@ async def approve_dispense(request: DispenseApprovalRequest):
 
         # 如果是 PENDING，需要扣庫存
         if record['status'] == 'PENDING':
+            db._expire_reservations(cursor, record['medicine_code'])
+            reserved = db._consume_reservation(cursor, request.dispenseId)
+
             # 先查 medicines 表
             cursor.execute("""
                 SELECT current_stock FROM medicines
@@ -3891,6 +6495,15 @@ async def approve_dispense(request: DispenseApprovalRequest):
             if current_stock < record['quantity']:
                 raise HTTPException(status_code=400, detail=f"庫存不足！當前庫存: {current_stock}")
 
+            # 無有效保留 (已逾期或升級前建立) 時，不可動用其他待審核領用的保留量
+            if not reserved:
+                reserved_stock = db._reserved_quantity(cursor, record['medicine_code'])
+                if current_stock - reserved_stock < record['quantity']:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"可用庫存不足！當前庫存: {current_stock}, 待審核保留: {reserved_stock} (此領用的保留已逾期)"
+                    )
+
             # 記錄庫存消耗
             cursor.execute("""
                 INSERT INTO inventory_events (
@@ -3925,6 +6538,10 @@ async def approve_dispense(request: DispenseApprovalRequest):
 
         conn.commit()
 
+        event_bus.publish(
+            'dispense', record['station_code'], action='APPROVED', dispenseId=request.dispenseId,
+            code=record['medicine_code'], previousStatus=record['status']
+        )
         status_desc = "緊急領用已確認" if record['status'] == 'EMERGENCY' else "領用審核通過"
         logger.info(f"✅ {status_desc}: ID={request.dispenseId}, 審核人={request.approvedBy}")
 
@@ -3950,24 +6567,39 @@ async def approve_dispense(request: DispenseApprovalRequest):
 @app.get("/api/pharmacy/dispense/pending")
 async def get_pending_dispenses(
     status: Optional[str] = Query(None, description="狀態篩選: PENDING | EMERGENCY | APPROVED"),
-    limit: int = Query(50, ge=1, le=200, description="最大回傳筆數")
+    limit: int = Query(50, ge=1, le=200, description="最大回傳筆數"),
+    since_version: Optional[int] = Query(None, description="只回傳此版本之後有變更的記錄 (差異查詢)")
 ):
     """
     查詢待處理領用記錄
     - 預設顯示所有 PENDING 和 EMERGENCY
     - 藥師可以看到需要確認的緊急領用
+    - since_version: 只回傳變更的記錄，已不符合篩選者列於 removed
     """
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    statuses = (status,) if status else ('PENDING', 'EMERGENCY')
+    if since_version is not None:
+        try:
+            delta = db.get_pending_dispenses_delta(since_version, statuses)
+        except Exception as e:
+            logger.error(f"查詢待處理領用差異失敗: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if delta is not None:
+            return {**delta, "count": len(delta["records"]), "delta": True}
+
+    conn = db.get_connection()
     cursor = conn.cursor()
 
     try:
+        version = cursor.execute("SELECT value FROM change_seq WHERE id = 1").fetchone()[0]
         if status:
             cursor.execute("""
                 SELECT
                     dr.*,
-                    CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending
+                    CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending,
+                    sr.status AS reservation_status,
+                    sr.expires_at AS reservation_expires_at
                 FROM dispense_records dr
+                LEFT JOIN stock_reservations sr ON sr.dispense_id = dr.id
                 WHERE dr.status = ?
                 ORDER BY dr.created_at ASC
                 LIMIT ?
@@ -3977,8 +6609,11 @@ async def get_pending_dispenses(
             cursor.execute("""
                 SELECT
                     dr.*,
-                    CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending
+                    CAST((julianday('now') - julianday(dr.created_at)) * 24 AS INTEGER) AS hours_pending,
+                    sr.status AS reservation_status,
+                    sr.expires_at AS reservation_expires_at
                 FROM dispense_records dr
+                LEFT JOIN stock_reservations sr ON sr.dispense_id = dr.id
                 WHERE dr.status IN ('PENDING', 'EMERGENCY')
                 ORDER BY dr.created_at ASC
                 LIMIT ?
@@ -3990,7 +6625,9 @@ async def get_pending_dispenses(
             "records": records,
             "count": len(records),
             "emergency_count": sum(1 for r in records if r['status'] == 'EMERGENCY'),
-            "pending_count": sum(1 for r in records if r['status'] == 'PENDING')
+            "pending_count": sum(1 for r in records if r['status'] == 'PENDING'),
+            "version": version,
+            "delta": False
         }
 
     except Exception as e:
@@ -4009,8 +6646,7 @@ async def get_dispense_history(
     limit: int = Query(100, ge=1, le=500, description="最大回傳筆數")
 ):
     """查詢領用歷史記錄"""
-    conn = sqlite3.connect(config.DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+    conn = db.get_connection()
     cursor = conn.cursor()
 
     try:
@@ -4074,15 +6710,11 @@ async def get_inventory_events(
 async def export_inventory_csv():
     """匯出庫存清單 CSV"""
     try:
-        csv_content = db.export_inventory_csv()
-
         filename = f"inventory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-        return StreamingResponse(
-            iter([csv_content]),
-            media_type="text/csv;charset=utf-8",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        return await _csv_export_response("inventory", {}, filename, "text/csv;charset=utf-8")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"匯出庫存 CSV 失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -4114,18 +6746,79 @@ async def export_inventory_events_csv(
 ):
     """匯出庫存事件記錄 CSV"""
     try:
-        csv_content = db.export_inventory_events_csv(event_type, start_date, end_date)
-
         filename = f"inventory_events_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
 
-        return StreamingResponse(
-            iter([csv_content]),
-            media_type="text/csv;charset=utf-8",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        return await _csv_export_response(
+            "inventory_events",
+            {"event_type": event_type, "start_date": start_date, "end_date": end_date},
+            filename,
+            "text/csv;charset=utf-8"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"匯出事件記錄 CSV 失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _build_analytics_zip(dest_path: str) -> dict:
+    """建置欄式分析匯出 ZIP 至 dest_path (於執行緒池中執行)"""
+    with tempfile.TemporaryDirectory(prefix="analytics_") as work_dir:
+        manifest = export_columnar(config.DATABASE_PATH, work_dir)
+
+        def file_member(path: Path):
+            def generate():
+                with open(path, 'rb') as f:
+                    yield from iter(lambda: f.read(1024 * 1024), b'')
+            return generate
+
+        writer = ZipStreamWriter(executor=export_executor)
+        for path in sorted(Path(work_dir).rglob("*")):
+            if path.is_file():
+                writer.add(f"analytics/{path.relative_to(work_dir).as_posix()}", file_member(path))
+        with open(dest_path, 'wb') as f:
+            for chunk in writer.stream():
+                f.write(chunk)
+
+    return {"tables": manifest["tables"]}
+
+
+@app.get("/api/analytics/export")
+async def export_analytics_columnar():
+    """
+    匯出分析用欄式資料 (ZIP)
+
+    inventory_events / blood_events / dispense_records / surgery_consumptions
+    每欄一個 .npy (日期為 epoch 秒、文字為字典編碼)，解壓後以
+    services.columnar_export.load_columnar() 記憶體映射載入；依資料版本快取
+    """
+    if not NUMPY_AVAILABLE:
+        raise HTTPException(status_code=503, detail="欄式匯出需要 numpy，請先安裝 (pip install numpy)")
+
+    try:
+        artifact = await backup_cache.get(
+            "analytics",
+            lambda path: export_pool.call(_build_analytics_zip, path, job="analytics_zip"),
+            suffix=".zip"
+        )
+
+        built_at = datetime.fromtimestamp(artifact['built_at']).strftime("%Y%m%d_%H%M%S")
+        return FileResponse(
+            path=artifact['path'],
+            media_type="application/zip",
+            filename=f"analytics_{config.STATION_ID}_{built_at}.zip",
+            headers={
+                "X-Backup-Cache": artifact['cache'],
+                "X-Data-Version": str(artifact['version']),
+                "X-Analytics-Rows": str(sum(t["rows"] for t in artifact["tables"].values()))
+            }
         )
+
+    except ColumnarExportError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
-        logger.error(f"匯出事件記錄 CSV 失敗: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"欄式分析匯出失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"匯出失敗: {str(e)}")
 
 
 # ============================================================================
@@ -4135,9 +6828,10 @@ async def export_inventory_events_csv(
 @app.get("/api/emergency/quick-backup")
 async def emergency_quick_backup():
     """
-    緊急快速備份 - 直接下載資料庫檔案
+    緊急快速備份 - 下載資料庫一致性快照
 
-    戰時緊急撤離使用：最快速的資料保全方式
+    戰時緊急撤離使用：最快速的資料保全方式。
+    以 SQLite 備份 API 分段複製，寫入不需暫停，下載的是某一時間點的完整資料庫
     """
     try:
         db_path = Path(config.DATABASE_PATH)
@@ -4149,104 +6843,110 @@ async def emergency_quick_backup():
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"{config.STATION_ID}_{timestamp}.db"
 
-        logger.info(f"緊急快速備份: {filename}")
+        # 資料未變更時重用上次快照；同時多人下載只做一次快照
+        snapshot = await backup_cache.get("db", backup_engine.snapshot, suffix=".db")
+        logger.info(
+            f"緊急快速備份: {filename} ({snapshot['cache']}, 資料版本 {snapshot['version']}, "
+            f"{snapshot['bytes']} bytes, {snapshot['throughput_bytes_per_sec'] / 1024 / 1024:.1f} MB/s)"
+        )
 
         return FileResponse(
-            path=str(db_path),
+            path=snapshot['path'],
             media_type="application/octet-stream",
-            filename=filename
+            filename=filename,
+            headers={
+                "X-Backup-Pages": str(snapshot['pages']),
+                "X-Backup-Cache": snapshot['cache'],
+                "X-Data-Version": str(snapshot['version'])
+            }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"快速備份失敗: {e}")
         raise HTTPException(status_code=500, detail=f"備份失敗: {str(e)}")
 
 
-@app.get("/api/emergency/download-all")
-async def emergency_download_all():
+def _build_emergency_zip(dest_path: str, progress: Optional[Callable[[Dict], None]] = None) -> dict:
     """
-    緊急完整備份 - 生成包含所有資料的ZIP包
+    建置完整備份 ZIP 至 dest_path (於匯出子行程中執行)
 
-    包含內容：
-    - database/: 完整資料庫
-    - exports/: CSV + JSON 分類資料
-    - config/: 站點設定檔
-    - README.txt: 使用說明
-    - manifest.json: 檔案清單與檢查碼
+    各成員依序產生並直接寫入檔案，大型成員以匯出執行緒池平行壓縮；
+    progress 為回報資料庫快照進度的回呼 (送回主行程的 backup_engine 狀態)
     """
+    backup_engine.status_listener = progress
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        zip_filename = f"emergency_backup_{config.STATION_ID}_{timestamp}.zip"
-        zip_path = Path("exports") / zip_filename
-
-        # 確保exports目錄存在
-        zip_path.parent.mkdir(exist_ok=True)
-
-        logger.info(f"開始生成完整備份包: {zip_filename}")
-
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # 1. 加入資料庫
-            db_path = Path(config.DATABASE_PATH)
-            if db_path.exists():
-                zipf.write(db_path, f"database/{db_path.name}")
-                logger.info("✓ 資料庫已加入")
-
-            # 2. 導出CSV資料
-            exports_dir = Path("exports/temp")
-            exports_dir.mkdir(exist_ok=True, parents=True)
-
-            # 初始化變數
-            inventory_data = []
-            blood_data = []
-            equipment = []
+        return _write_emergency_zip(dest_path)
+    finally:
+        backup_engine.status_listener = None
+
+
+def _write_emergency_zip(dest_path: str) -> dict:
+    writer = ZipStreamWriter(executor=export_executor)
+    statistics = {"total_items": 0, "total_blood_types": 0, "total_equipment": 0}
+
+    def csv_member(fieldnames: List[str], rows, stat_key: str):
+        def generate():
+            buffer = io.StringIO()
+            csv_writer = csv.writer(buffer)
+            csv_writer.writerow(fieldnames)
+            yield ('\ufeff' + buffer.getvalue()).encode('utf-8')
+            count = 0
+            for row in rows():
+                buffer.seek(0)
+                buffer.truncate()
+                csv_writer.writerow([row[f] for f in fieldnames])
+                yield buffer.getvalue().encode('utf-8')
+                count += 1
+            statistics[stat_key] = count
+        return generate
+
+    def equipment_rows():
+        conn = db.get_connection()
+        try:
+            yield from conn.execute("SELECT * FROM equipment")
+        finally:
+            conn.close()
 
-            try:
-                # 導出庫存清單
-                inventory_data = db.get_inventory_items()
-                if inventory_data:
-                    csv_path = exports_dir / "inventory.csv"
-                    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=inventory_data[0].keys())
-                        writer.writeheader()
-                        writer.writerows([dict(item) for item in inventory_data])
-                    zipf.write(csv_path, "exports/inventory.csv")
-                    logger.info("✓ 庫存清單已導出")
-
-                # 導出血袋庫存
-                blood_data = db.get_blood_inventory()
-                if blood_data:
-                    csv_path = exports_dir / "blood_inventory.csv"
-                    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=['blood_type', 'quantity', 'station_id'])
-                        writer.writeheader()
-                        writer.writerows([dict(b) for b in blood_data])
-                    zipf.write(csv_path, "exports/blood_inventory.csv")
-                    logger.info("✓ 血袋庫存已導出")
-
-                # 導出設備清單
-                conn = db.get_connection()
-                cursor = conn.cursor()
-                equipment = cursor.execute("SELECT * FROM equipment").fetchall()
-                if equipment:
-                    csv_path = exports_dir / "equipment.csv"
-                    with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=[desc[0] for desc in cursor.description])
-                        writer.writeheader()
-                        writer.writerows([dict(zip([desc[0] for desc in cursor.description], row)) for row in equipment])
-                    zipf.write(csv_path, "exports/equipment.csv")
-                    logger.info("✓ 設備清單已導出")
+    def database_member():
+        snapshot = backup_engine.snapshot()
+        logger.info(f"✓ 資料庫快照完成 ({snapshot['bytes']} bytes, {snapshot['seconds']}s)")
+        try:
+            with open(snapshot['path'], 'rb') as f:
+                yield from iter(lambda: f.read(1024 * 1024), b'')
+        finally:
+            os.remove(snapshot['path'])
+
+    # 1. 資料庫 (快照於輸出到此成員時才建立)
+    db_path = Path(config.DATABASE_PATH)
+    if db_path.exists():
+        writer.add(f"database/{db_path.name}", database_member)
+
+    # 2. CSV 資料
+    writer.add("exports/inventory.csv", csv_member(
+        ['code', 'name', 'unit', 'min_stock', 'category', 'current_stock'],
+        db.get_inventory_items, "total_items"
+    ))
+    writer.add("exports/blood_inventory.csv", csv_member(
+        ['blood_type', 'quantity', 'station_id'],
+        db.get_blood_inventory, "total_blood_types"
+    ))
 
-            except Exception as e:
-                logger.warning(f"部分資料導出失敗: {e}")
+    conn = db.get_connection()
+    try:
+        equipment_columns = [row['name'] for row in conn.execute("PRAGMA table_info(equipment)")]
+    finally:
+        conn.close()
+    writer.add("exports/equipment.csv", csv_member(equipment_columns, equipment_rows, "total_equipment"))
 
-            # 3. 加入配置文件
-            config_path = Path("config/station_config.json")
-            if config_path.exists():
-                zipf.write(config_path, "config/station_config.json")
-                logger.info("✓ 配置文件已加入")
+    # 3. 配置文件
+    config_path = Path("config/station_config.json")
+    if config_path.exists():
+        writer.add("config/station_config.json", config_path.read_bytes())
 
-            # 4. 生成README
-            readme_content = f"""
+    # 4. README
+    readme_content = f"""
 ==============================================
 醫療站庫存系統 - 緊急備份包
 ==============================================
@@ -4286,43 +6986,82 @@ manifest.json      檔案清單與檢查碼
 請妥善保管並定期更新
 ==============================================
 """
-            zipf.writestr("README.txt", readme_content.encode('utf-8'))
-            logger.info("✓ README已生成")
-
-            # 5. 生成manifest
-            manifest = {
-                "backup_time": datetime.now().isoformat(),
-                "station_id": config.STATION_ID,
-                "version": config.VERSION,
-                "files": {},
-                "statistics": {
-                    "total_items": len(inventory_data) if inventory_data else 0,
-                    "total_blood_types": len(blood_data) if blood_data else 0,
-                    "total_equipment": len(equipment) if equipment else 0
+    writer.add("README.txt", readme_content.encode('utf-8'))
+
+    # 5. manifest (最後產生，記錄前面各成員的大小與 CRC)
+    def manifest_member():
+        manifest = {
+            "manifest_version": 2,
+            "hash_algorithm": "sha256",
+            "backup_time": datetime.now().isoformat(),
+            "station_id": config.STATION_ID,
+            "version": config.VERSION,
+            "files": {
+                entry["name"]: {
+                    "size": entry["size"],
+                    "compressed_size": entry["compressed_size"],
+                    "crc32": f"{entry['crc']:08x}",
+                    "sha256": entry["sha256"]
                 }
-            }
+                for entry in writer.entries
+            },
+            "statistics": statistics
+        }
+        yield json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')
+
+    writer.add("manifest.json", manifest_member)
+
+    with open(dest_path, 'wb') as f:
+        for chunk in writer.stream():
+            f.write(chunk)
+
+    return {"files": len(writer.entries), "statistics": statistics}
 
-            # 計算檔案檢查碼
-            for item in zipf.filelist:
-                if item.filename != "manifest.json":
-                    manifest["files"][item.filename] = {
-                        "size": item.file_size,
-                        "compressed_size": item.compress_size
-                    }
 
-            zipf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
-            logger.info("✓ Manifest已生成")
+@app.get("/api/emergency/download-all")
+async def emergency_download_all():
+    """
+    緊急完整備份 - 生成包含所有資料的ZIP包
+
+    包含內容：
+    - database/: 資料庫一致性快照
+    - exports/: CSV 分類資料
+    - config/: 站點設定檔
+    - README.txt: 使用說明
+    - manifest.json: 檔案清單與檢查碼
 
-        # 清理臨時目錄
-        if exports_dir.exists():
-            shutil.rmtree(exports_dir)
+    以資料版本快取：資料未變更時直接回傳上次的備份包，
+    多人同時下載時只建置一次，所有請求共用結果
+    """
+    try:
+        config_path = Path("config/station_config.json")
+        fingerprint = str(config_path.stat().st_mtime_ns) if config_path.exists() else ""
+
+        artifact = await backup_cache.get(
+            "full",
+            lambda path: export_pool.call(
+                _build_emergency_zip, path, job="emergency_zip",
+                progress=lambda fields: backup_engine.update_status(**fields)
+            ),
+            suffix=".zip",
+            fingerprint=fingerprint
+        )
 
-        logger.info(f"完整備份包生成成功: {zip_filename}")
+        built_at = datetime.fromtimestamp(artifact['built_at']).strftime("%Y%m%d_%H%M%S")
+        zip_filename = f"emergency_backup_{config.STATION_ID}_{built_at}.zip"
+        logger.info(
+            f"完整備份包: {zip_filename} ({artifact['cache']}, 資料版本 {artifact['version']}, "
+            f"{artifact['size']} bytes, 建置 {artifact['seconds']}s)"
+        )
 
         return FileResponse(
-            path=str(zip_path),
+            path=artifact['path'],
             media_type="application/zip",
-            filename=zip_filename
+            filename=zip_filename,
+            headers={
+                "X-Backup-Cache": artifact['cache'],
+                "X-Data-Version": str(artifact['version'])
+            }
         )
 
     except Exception as e:
@@ -4330,38 +7069,236 @@ manifest.json      檔案清單與檢查碼
         raise HTTPException(status_code=500, detail=f"備份失敗: {str(e)}")
 
 
+@app.get("/api/emergency/backup/status")
+async def get_backup_status():
+    """取得目前 (或最近一次) 資料庫快照的進度與吞吐量，以及備份快取統計"""
+    return {**backup_engine.get_status(), "cache": backup_cache.get_status()}
+
+
+@app.get("/api/exports/workers")
+async def get_export_workers_status():
+    """匯出工作池狀態 (執行中/排隊數、平均等待與執行時間)"""
+    return export_pool.get_status()
+
+
+@app.get("/api/backups/runs")
+async def get_backup_runs(limit: int = Query(50, ge=1, le=500, description="筆數")):
+    """排程/手動備份執行記錄 (耗時、寫入量) 與備份目標狀態"""
+    runs = db.get_backup_runs(limit)
+
+    target = {"path": config.BACKUP_CHAIN_DIR, "available": Path(config.BACKUP_CHAIN_DIR).exists()}
+    if target["available"]:
+        usage = shutil.disk_usage(config.BACKUP_CHAIN_DIR)
+        target.update(
+            free_bytes=usage.free,
+            total_bytes=usage.total,
+            used_by_backups=await run_in_threadpool(backup_chain.total_size)
+        )
+
+    return {
+        "runs": runs,
+        "target": target,
+        "schedule": {
+            "incremental_interval_minutes": config.BACKUP_INCREMENTAL_INTERVAL_MINUTES,
+            "full_time": config.BACKUP_FULL_TIME.strftime('%H:%M'),
+            "keep_full": config.BACKUP_KEEP_FULL,
+            "max_bytes": config.BACKUP_MAX_BYTES
+        }
+    }
+
+
+@app.post("/api/backups/run")
+async def trigger_backup_run(run_type: str = Query("INCREMENTAL", description="FULL 或 INCREMENTAL")):
+    """手動觸發一次排程備份 (同樣節流並記錄)"""
+    run_type = run_type.upper()
+    if run_type not in ('FULL', 'INCREMENTAL'):
+        raise HTTPException(status_code=400, detail="run_type 必須為 FULL 或 INCREMENTAL")
+
+    result = await run_in_threadpool(run_backup_job, run_type, 'MANUAL')
+    if result.get("busy"):
+        raise HTTPException(status_code=409, detail="另一個備份正在執行，請稍後再試")
+    if result["status"] == "FAILED":
+        raise HTTPException(status_code=500, detail=f"備份失敗: {result['error']}")
+    return {k: v for k, v in result.items() if k != "link"}
+
+
+@app.post("/api/emergency/backup/verify")
+async def verify_emergency_backup(request: Request):
+    """
+    驗證緊急備份包
+
+    請求內容為 ZIP 檔 (application/zip)；未附檔案時驗證目前快取的最新備份包。
+    依 manifest.json 的 SHA-256 平行檢查每個成員
+    """
+    upload_path = None
+    try:
+        archive_path = None
+        chunks = request.stream()
+        first = b""
+        async for chunk in chunks:
+            if chunk:
+                first = chunk
+                break
+
+        if first:
+            temp_dir = Path("exports/temp")
+            temp_dir.mkdir(parents=True, exist_ok=True)
+            upload_path = temp_dir / f"verify_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.zip"
+            with open(upload_path, 'wb') as f:
+                f.write(first)
+                async for chunk in chunks:
+                    f.write(chunk)
+            archive_path = str(upload_path)
+        else:
+            archive_path = backup_cache.artifact_path("full")
+            if not archive_path:
+                raise HTTPException(status_code=400, detail="請上傳備份包，或先產生一次完整備份")
+
+        result = await run_in_threadpool(verify_archive, archive_path, export_executor)
+        if result.get("error"):
+            raise HTTPException(status_code=400, detail=result["error"])
+
+        logger.info(
+            f"備份包驗證: {'通過' if result['valid'] else ('失敗' if result['verified'] else '未驗證')} "
+            f"({result['checked']} 個成員, {result['failed']} 個錯誤, "
+            f"{len(result['unverified'])} 個未記錄雜湊, {result['seconds']}s)"
+        )
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"備份包驗證失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"驗證失敗: {str(e)}")
+    finally:
+        if upload_path is not None and upload_path.exists():
+            upload_path.unlink()
+
+
+@app.post("/api/emergency/backup/incremental")
+async def create_incremental_backup(force_base: bool = Query(False, description="強制建立新基底快照")):
+    """
+    建立增量備份環節
+
+    無基底或差異累積過多時建立基底快照，否則只寫入上次備份後新增、變更與刪除的資料列；
+    與排程備份共用執行鎖並記錄於 backup_runs，另一個備份執行中時回傳 409
+    """
+    result = await run_in_threadpool(run_backup_job, 'FULL' if force_base else 'INCREMENTAL', 'MANUAL')
+    if result.get("busy"):
+        raise HTTPException(status_code=409, detail="另一個備份正在執行，請稍後再試")
+    if result["status"] == "FAILED":
+        raise HTTPException(status_code=500, detail=f"增量備份失敗: {result['error']}")
+
+    link = result["link"]
+    skipped = result["status"] == "SKIPPED"
+    if skipped:
+        logger.info("增量備份: 無變更，略過")
+    else:
+        logger.info(f"✓ 增量備份環節 #{link['seq']} ({link['type']}, {link['size']} bytes, {link['seconds']}s)")
+
+    return {
+        "run_id": result["run_id"],
+        "skipped": skipped,
+        "seq": link["seq"],
+        "type": link["type"],
+        "base_seq": link["base_seq"],
+        "size": link["size"],
+        "rows": link["rows"],
+        "seconds": link["seconds"],
+        "hash": link["hash"]
+    }
+
+
+@app.get("/api/emergency/backup/chain")
+async def get_backup_chain():
+    """列出增量備份鏈環節"""
+    links = await run_in_threadpool(backup_chain.links)
+    return {
+        "chain_dir": config.BACKUP_CHAIN_DIR,
+        "links": [
+            {
+                "seq": link["seq"],
+                "type": link["type"],
+                "base_seq": link["base_seq"],
+                "created_at": link["created_at"],
+                "size": link["size"],
+                "rows": link["rows"],
+                "hash": link["hash"]
+            }
+            for link in links
+        ],
+        "total_size": sum(link["size"] for link in links)
+    }
+
+
+@app.get("/api/emergency/backup/chain/restore")
+async def restore_backup_chain(upto_seq: Optional[int] = Query(None, description="還原到此環節序號，預設最新")):
+    """
+    將備份鏈還原到指定時間點並下載還原後的資料庫
+
+    不會覆寫線上資料庫；以下載檔案替換需停機後手動進行
+    """
+    try:
+        restore_path = Path("exports/temp") / f"restore_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.db"
+        result = await run_in_threadpool(backup_chain.restore, str(restore_path), upto_seq)
+        logger.info(f"備份鏈還原: #{result['base_seq']} + {result['deltas_applied']} 個差異 → #{result['applied_seq']}")
+
+        return FileResponse(
+            path=result['path'],
+            media_type="application/octet-stream",
+            filename=f"{config.STATION_ID}_restored_{result['applied_seq']:06d}.db",
+            background=BackgroundTask(os.remove, result['path'])
+        )
+    except BackupChainError as e:
+        raise HTTPException(status_code=409, detail=f"備份鏈驗證失敗: {e}")
+    except Exception as e:
+        logger.error(f"備份鏈還原失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"還原失敗: {str(e)}")
+
+
 @app.get("/api/emergency/info")
 async def get_emergency_info():
     """取得緊急資訊(用於QR Code掃描後顯示)"""
     try:
-        stats = db.get_stats()
-        blood_inventory = db.get_blood_inventory()
-        equipment = db.get_equipment_status()
-
-        total_blood = sum(b['quantity'] for b in blood_inventory)
-        equipment_alerts = sum(1 for e in equipment if e['status'] not in ['NORMAL', 'UNCHECKED'])
-
-        return {
-            "station_id": config.STATION_ID,
-            "timestamp": datetime.now().isoformat(),
-            "version": config.VERSION,
-            "stats": {
-                "total_items": stats.get('total_items', 0),
-                "low_stock_items": stats.get('low_stock_items', 0),
-                "total_blood_units": total_blood,
-                "equipment_alerts": equipment_alerts
-            },
-            "blood_inventory": blood_inventory,
-            "equipment_status": [
-                {"id": e['id'], "name": e['name'], "status": e['status']}
-                for e in equipment
-            ]
-        }
+        body, _ = read_cache.get_or_build(
+            "emergency_info", (), STATS_TABLES + BLOOD_TABLES, _build_emergency_info
+        )
+        # 時間戳記每次回應時更新，其餘內容取自快取
+        info = json.loads(body)
+        info["timestamp"] = datetime.now().isoformat()
+        return info
     except Exception as e:
         logger.error(f"取得緊急資訊失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _build_emergency_info() -> Dict:
+    """緊急資訊內容 (不含時間戳記)"""
+    stats = db.get_stats()
+    blood_inventory = db.get_blood_inventory()
+    equipment = db.get_equipment_status()
+
+    total_blood = sum(b['quantity'] for b in blood_inventory)
+    equipment_alerts = sum(1 for e in equipment if e['status'] not in ['NORMAL', 'UNCHECKED'])
+
+    return {
+        "station_id": config.STATION_ID,
+        "timestamp": None,
+        "version": config.VERSION,
+        "stats": {
+            "total_items": stats.get('total_items', 0),
+            "low_stock_items": stats.get('low_stock_items', 0),
+            "total_blood_units": total_blood,
+            "equipment_alerts": equipment_alerts
+        },
+        "blood_inventory": blood_inventory,
+        "equipment_status": [
+            {"id": e['id'], "name": e['name'], "status": e['status']}
+            for e in equipment
+        ]
+    }
+
+
 @app.get("/emergency/view")
 async def view_emergency_info():
     """緊急資訊顯示頁面 (QR Code掃描後跳轉)"""
@@ -4628,38 +7565,274 @@ async def emergency_qr_code(request: Request):
         protocol = "https" if request.url.scheme == "https" else "http"
         qr_url = f"{protocol}://{host}/emergency/view"
 
-        # 生成QR Code
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-
-        # 生成圖片
-        img = qr.make_image(fill_color="black", back_color="white")
-
-        # 保存到BytesIO
-        img_io = BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
+        # 生成QR Code (於匯出子行程繪製)
+        png = await _run_export_job(_render_qr_png, qr_url, job="qr")
 
         logger.info("緊急QR Code已生成")
 
         # 返回圖片
         return StreamingResponse(
-            img_io,
+            BytesIO(png),
             media_type="image/png",
             headers={"Content-Disposition": f"inline; filename=emergency_qr_{config.STATION_ID}.png"}
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"QR Code生成失敗: {e}")
         raise HTTPException(status_code=500, detail=f"QR Code生成失敗: {str(e)}")
 
 
+# ========== 離線 QR Code 同步通道 (噴泉碼) ==========
+
+# 進行中的解碼工作 (依傳輸ID)，僅保留最近幾筆；解碼在執行緒中進行，以鎖保護
+qr_decode_sessions: Dict[int, FountainDecoder] = {}
+qr_decode_lock = threading.Lock()
+QR_DECODE_SESSION_LIMIT = 8
+
+
+def _render_qr_png(content: str) -> bytes:
+    """將網址繪製為高容錯 QR Code PNG (於匯出子行程中執行)"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(content)
+    qr.make(fit=True)
+
+    img_io = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+def _render_qr_data_url(content: str) -> str:
+    """將文字內容繪製為 QR Code PNG data URL"""
+    qr = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=6,
+        border=2,
+    )
+    qr.add_data(content)
+    qr.make(fit=True)
+
+    img_io = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(img_io, 'PNG')
+    return "data:image/png;base64," + base64.b64encode(img_io.getvalue()).decode('ascii')
+
+
+def _render_qr_data_urls(contents: List[str]) -> List[str]:
+    """批次繪製 QR Code 幀 (於匯出子行程中執行)"""
+    return [_render_qr_data_url(content) for content in contents]
+
+
+@app.post("/api/station/sync/qr/encode")
+async def encode_sync_qr_frames(request: QRSyncEncodeRequest):
+    """
+    【站點層】將增量同步封包編碼為 QR Code 動畫幀
+
+    無網路、無 USB 時，以手機螢幕對拍傳輸同步封包。
+    封包壓縮後以噴泉碼 (LT Code) 編碼，接收端以任意順序收到足夠數量的幀即可還原，
+    漏掃的幀不需要重播。
+
+    返回:
+    - frames: 幀內容 (format=json 時附 QR 圖片)
+    - throughput_bytes_per_sec: 以指定 fps 估算的有效吞吐量
+    - 或 format=html 時返回循環播放的動畫頁面
+    """
+    try:
+        if request.format not in ("json", "html"):
+            raise HTTPException(status_code=400, detail=f"無效的輸出格式: {request.format}")
+
+        result = await _run_export_job(_generate_sync_package_job, {
+            "station_id": request.stationId,
+            "hospital_id": request.hospitalId,
+            "sync_type": "DELTA" if request.sinceTimestamp else "FULL",
+            "since_timestamp": request.sinceTimestamp,
+            # 只用來繪製幀，不另建封包記錄 (接收端匯入時記錄)
+            "record": False
+        }, job="sync_package")
+
+        # 以 SyncPackageUpload 的格式打包，接收端可直接匯入
+        package = {
+            "stationId": request.stationId,
+            "packageId": result['package_id'],
+            "packageType": result['package_type'],
+            "changes": result['changes'],
+            "checksum": result['checksum']
+        }
+        payload = zlib.compress(json.dumps(package, ensure_ascii=False).encode('utf-8'), 9)
+        if len(payload) > config.QR_SYNC_MAX_PAYLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"同步封包壓縮後 {len(payload)} bytes 超過 QR 傳輸上限 {config.QR_SYNC_MAX_PAYLOAD_BYTES} bytes，請指定 sinceTimestamp 縮小範圍"
+            )
+
+        transfer_id = zlib.crc32(result['package_id'].encode('utf-8'))
+        encoder = FountainEncoder(payload, block_size=request.blockSize, transfer_id=transfer_id)
+        # 區塊數少時倍率不足以容忍漏掃，至少多送 4 幀
+        frame_count = max(encoder.k + 4, int(encoder.k * request.redundancy + 0.999))
+        frames = encoder.frames(frame_count)
+        images = await _run_export_job(_render_qr_data_urls, frames, job="qr_frames")
+
+        throughput = estimate_throughput(request.blockSize, request.fps)
+        logger.info(
+            f"QR 同步幀已產生: {result['package_id']} "
+            f"({len(payload)} bytes 壓縮後, {encoder.k} 區塊, {frame_count} 幀)"
+        )
+
+        if request.format == "html":
+            html_content = f"""
+<!DOCTYPE html>
+<html lang="zh-TW">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>QR 同步 - {result['package_id']}</title>
+    <style>
+        body {{ font-family: 'Microsoft JhengHei', sans-serif; text-align: center; background: #fff; }}
+        img {{ width: min(90vw, 90vh); image-rendering: pixelated; }}
+        .info {{ font-size: 14px; color: #555; }}
+    </style>
+</head>
+<body>
+    <img id="frame" alt="QR frame">
+    <div class="info">{result['package_id']} · {frame_count} 幀 · {request.fps:g} fps · <span id="counter"></span></div>
+    <script>
+        const frames = {json.dumps(images)};
+        let index = 0;
+        const img = document.getElementById('frame');
+        const counter = document.getElementById('counter');
+        setInterval(() => {{
+            img.src = frames[index];
+            counter.textContent = `${{index + 1}} / ${{frames.length}}`;
+            index = (index + 1) % frames.length;
+        }}, {1000.0 / request.fps:.1f});
+    </script>
+</body>
+</html>
+"""
+            return HTMLResponse(content=html_content)
+
+        return {
+            "success": True,
+            "package_id": result['package_id'],
+            "changes_count": result['changes_count'],
+            "payload_size": len(payload),
+            "block_size": request.blockSize,
+            "block_count": encoder.k,
+            "frame_count": frame_count,
+            "fps": request.fps,
+            "throughput_bytes_per_sec": round(throughput, 1),
+            "estimated_seconds": round(len(payload) / throughput, 1),
+            "frames": frames,
+            "images": images
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"QR 同步幀產生失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"QR 同步幀產生失敗: {str(e)}")
+
+
+def _decode_qr_frames(request: QRSyncDecodeRequest) -> Dict:
+    """累積幀並嘗試還原封包 (CPU 密集，於執行緒中執行)"""
+    with qr_decode_lock:
+        complete = False
+        decoder = None
+        rejected = 0
+
+        for frame in request.frames:
+            try:
+                transfer_id = parse_frame(frame)[0]
+            except FountainError:
+                rejected += 1
+                continue
+
+            decoder = qr_decode_sessions.get(transfer_id)
+            if decoder is None:
+                if len(qr_decode_sessions) >= QR_DECODE_SESSION_LIMIT:
+                    qr_decode_sessions.pop(next(iter(qr_decode_sessions)))
+                decoder = FountainDecoder(
+                    max_data_length=config.QR_SYNC_MAX_PAYLOAD_BYTES, min_block_size=64, max_block_size=1024
+                )
+                qr_decode_sessions[transfer_id] = decoder
+
+            try:
+                complete = decoder.add_frame(frame)
+            except FountainError:
+                # 首幀即被拒絕 (格式或長度超出上限) 的工作不保留
+                if decoder.transfer_id is None:
+                    qr_decode_sessions.pop(transfer_id, None)
+                raise
+
+        if decoder is None:
+            raise HTTPException(status_code=400, detail="沒有可辨識的幀")
+
+        progress = {
+            "transfer_id": decoder.transfer_id,
+            "frames_received": decoder.frames_received,
+            "frames_rejected": rejected,
+            "blocks_total": decoder.k,
+            "progress": round(decoder.progress, 3),
+            "complete": complete
+        }
+
+        if not complete:
+            return {"success": True, **progress}
+
+        data = decoder.result()
+        qr_decode_sessions.pop(decoder.transfer_id, None)
+
+    # 幀內容由傳送端決定：解壓縮設上限，格式錯誤視為無效封包
+    try:
+        decompressor = zlib.decompressobj()
+        raw = decompressor.decompress(data, config.QR_SYNC_MAX_PACKAGE_BYTES)
+        if decompressor.unconsumed_tail:
+            raise FountainError(f"同步封包解壓縮後超過上限 ({config.QR_SYNC_MAX_PACKAGE_BYTES} bytes)")
+        package = json.loads(raw.decode('utf-8'))
+        if not isinstance(package, dict) or not isinstance(package.get('changes'), list):
+            raise ValueError("缺少 changes")
+        missing = [key for key in ('packageId', 'checksum') if key not in package]
+        if missing:
+            raise ValueError(f"缺少 {', '.join(missing)}")
+    except (zlib.error, UnicodeDecodeError, ValueError) as e:
+        raise FountainError(f"還原的資料不是有效的同步封包: {e}")
+
+    logger.info(f"QR 同步封包已還原: {package['packageId']} ({len(package['changes'])} 項變更)")
+    response = {"success": True, **progress, "package": package}
+    if request.apply:
+        response["import_result"] = db.import_sync_package(
+            package_id=package['packageId'],
+            changes=package['changes'],
+            checksum=package['checksum'],
+            package_type=package.get('packageType', 'DELTA')
+        )
+    return response
+
+
+@app.post("/api/station/sync/qr/decode")
+async def decode_sync_qr_frames(request: QRSyncDecodeRequest):
+    """
+    【站點層】還原 QR Code 幀傳來的同步封包
+
+    幀可分批、任意順序送入，伺服器依傳輸ID累積解碼進度。
+    收齊後返回封包內容；apply=true 時直接匯入。
+    """
+    try:
+        return await run_in_threadpool(_decode_qr_frames, request)
+    except HTTPException:
+        raise
+    except FountainError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"QR 同步封包還原失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"QR 同步封包還原失敗: {str(e)}")
+
+
 # ========== 聯邦架構 - 同步封包 API (Phase 1 & 2) ==========
 
 @app.post("/api/station/sync/generate")
@@ -4676,11 +7849,15 @@ async def generate_station_sync_package(request: SyncPackageGenerate):
     - hospitalId: 所屬醫院ID (e.g., HOSP-001)
     - syncType: DELTA (增量) 或 FULL (全量)
     - sinceTimestamp: 增量同步起始時間 (可選)
+    - maxBytes: 單一封包大小上限 (可選，頻寬受限時使用)
+    - priorities: 各資料表優先序覆寫 (可選)
 
     返回:
     - package_id: 封包ID
     - checksum: SHA-256 校驗碼
-    - changes: 變更記錄清單
+    - changes: 變更記錄清單 (高優先序在前)
+    - cursor: 本封包各表實際送出的範圍
+    - follow_up_packages: 超出預算的後續封包
     """
     try:
         logger.info(f"開始產生同步封包: station={request.stationId}, type={request.syncType}, since={request.sinceTimestamp}")
@@ -4693,14 +7870,16 @@ async def generate_station_sync_package(request: SyncPackageGenerate):
         if request.syncType == "DELTA" and not request.sinceTimestamp:
             logger.warning("增量同步未提供 sinceTimestamp，將使用全量同步")
 
-        result = db.generate_sync_package(
-            station_id=request.stationId,
-            hospital_id=request.hospitalId,
-            sync_type=request.syncType,
-            since_timestamp=request.sinceTimestamp
-        )
+        result = await _run_export_job(_generate_sync_package_job, {
+            "station_id": request.stationId,
+            "hospital_id": request.hospitalId,
+            "sync_type": request.syncType,
+            "since_timestamp": request.sinceTimestamp,
+            "max_bytes": request.maxBytes,
+            "priorities": request.priorities
+        }, job="sync_package")
 
-        logger.info(f"✓ 同步封包已產生: {result['package_id']} ({result['changes_count']} 項變更, {result['package_size']} bytes)")
+        logger.info(f"✓ 同步封包已產生: {result['package_id']} ({result['changes_count']} 項變更, {result['package_size']} bytes, 共 {result['total_packages']} 包)")
         return result
 
     except HTTPException:
@@ -4875,6 +8054,74 @@ async def upload_hospital_sync(request: SyncPackageUpload):
         raise HTTPException(status_code=500, detail=f"醫院層接收同步失敗: {str(e)}")
 
 
+@app.get("/api/hospital/overview")
+async def get_hospital_overview(hospital_id: str = Query("HOSP-001", description="醫院ID")):
+    """
+    【醫院層】跨站點總覽
+
+    由上傳同步時增量維護的彙總表直接讀取，查詢成本不隨回報站點數增加
+    """
+    try:
+        return db.get_hospital_overview(hospital_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"取得醫院總覽失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/hospital/items/{item_code}/stations")
+async def get_hospital_item_distribution(item_code: str):
+    """【醫院層】物品在各站點的庫存分佈"""
+    try:
+        stations = db.get_hospital_item_distribution(item_code)
+        return {
+            "item_code": item_code,
+            "stations": stations,
+            "total_quantity": sum(s['quantity'] for s in stations)
+        }
+    except Exception as e:
+        logger.error(f"取得物品站點分佈失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/hospital/reports/daily")
+async def get_hospital_daily_report(
+    hospital_id: str = Query("HOSP-001", description="醫院ID"),
+    report_date: Optional[str] = Query(None, description="報告日期 (YYYY-MM-DD)，預設今日")
+):
+    """
+    【醫院層】醫院日報
+
+    當日報告隨站點上傳即時累計；已結算的日期回傳凍結版本
+    """
+    try:
+        return db.get_daily_report(hospital_id, report_date)
+    except Exception as e:
+        logger.error(f"取得醫院日報失敗: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/hospital/reports/daily/close")
+async def close_hospital_daily_report(
+    hospital_id: str = Query("HOSP-001", description="醫院ID"),
+    report_date: Optional[str] = Query(None, description="報告日期 (YYYY-MM-DD)，預設昨日；不可為今日或未來日期"),
+    submitted_by: str = Query("SYSTEM", description="結算人員")
+):
+    """【醫院層】手動結算醫院日報並產生 REPORT 同步封包 (與每日排程相同，預設結算前一日)"""
+    report_date = report_date or (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    return db.close_daily_report(hospital_id, report_date, submitted_by)
+
+
+@app.get("/api/hospital/reports/daily/package")
+async def get_hospital_report_package(
+    report_date: str = Query(..., description="報告日期 (YYYY-MM-DD)"),
+    hospital_id: str = Query("HOSP-001", description="醫院ID")
+):
+    """【醫院層】取得已結算日報的精簡 REPORT 封包 (上傳中央指揮部)"""
+    return db.get_report_package(hospital_id, report_date)
+
+
 @app.post("/api/hospital/transfer/coordinate")
 async def coordinate_hospital_transfer(request: HospitalTransferCoordinate):
     """
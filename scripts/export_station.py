@@ -1,15 +1,45 @@
 #!/usr/bin/env python3
 """
 資料匯出腳本
-從兩個資料庫匯出站點資料到統一的 JSON 格式
+從兩個資料庫串流匯出站點資料，每張表一個 JSON Lines 檔 (每行一筆記錄)
+
+輸出目錄結構:
+    export_meta.json              站點資訊與各表摘要 (匯出完成時寫入)
+    pharmacy.medicines.jsonl
+    pharmacy.transactions.jsonl
+    pharmacy.controlled_drug_logs.jsonl
+    general.items.jsonl
+    general.transactions.jsonl
+    .state/<檔名>.json            各表的高水位 (rowid) 與已寫入位元組數
+
+記憶體用量與資料量無關：每次只取 chunk_rows 筆，寫入並 fsync 後更新高水位；
+中斷後以 --resume 重新執行，會截斷未確認的尾端並從高水位繼續
 """
 
-import sqlite3
+import argparse
+import base64
 import json
 import os
+import sqlite3
 import sys
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+
+# (資料庫, 來源表, 輸出名稱)
+EXPORT_TABLES = [
+    ('pharmacy', 'medicines', 'medicines'),
+    ('pharmacy', 'pharmacy_transactions', 'transactions'),
+    ('pharmacy', 'controlled_drug_log', 'controlled_drug_logs'),
+    ('general', 'items', 'items'),
+    ('general', 'transactions', 'transactions'),
+]
+
+DEFAULT_CHUNK_ROWS = 5000
+META_FILE = 'export_meta.json'
+STATE_DIR = '.state'
 
 
 def read_config(config_path: str) -> dict:
@@ -31,92 +61,107 @@ def read_config(config_path: str) -> dict:
         sys.exit(1)
 
 
-def export_pharmacy_data(db_path: str) -> dict:
-    """
-    從藥局資料庫匯出資料
+def _json_default(value):
+    """BLOB 欄位以 base64 字串輸出"""
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"無法序列化的型別: {type(value).__name__}")
 
-    Args:
-        db_path: 藥局資料庫路徑
 
-    Returns:
-        藥局資料字典
-    """
-    try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row  # 使用 Row 物件以便轉換為字典
-        cursor = conn.cursor()
+def _new_state() -> Dict:
+    return {"high_water_mark": 0, "rows": 0, "bytes": 0, "completed": False}
 
-        # 匯出 medicines
-        cursor.execute("SELECT * FROM medicines")
-        medicines = [dict(row) for row in cursor.fetchall()]
 
-        # 匯出 pharmacy_transactions
-        cursor.execute("SELECT * FROM pharmacy_transactions")
-        transactions = [dict(row) for row in cursor.fetchall()]
+def _read_state(state_path: Path) -> Dict:
+    if state_path.exists():
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return _new_state()
 
-        # 匯出 controlled_drug_log
-        cursor.execute("SELECT * FROM controlled_drug_log")
-        controlled_drug_logs = [dict(row) for row in cursor.fetchall()]
 
-        conn.close()
+def _write_state(state_path: Path, state: Dict):
+    """先寫暫存檔再改名，中斷時不會留下半個狀態檔"""
+    tmp_path = state_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, state_path)
 
-        return {
-            "medicines": medicines,
-            "transactions": transactions,
-            "controlled_drug_logs": controlled_drug_logs,
-            "record_count": {
-                "medicines": len(medicines),
-                "transactions": len(transactions),
-                "controlled_drug_logs": len(controlled_drug_logs)
-            }
-        }
-
-    except Exception as e:
-        print(f"✗ 從藥局資料庫匯出失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
 
-
-def export_general_data(db_path: str) -> dict:
+def export_table(
+    db_path: str,
+    table: str,
+    output_file: str,
+    resume: bool = False,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> Dict:
     """
-    從一般庫存資料庫匯出資料
+    串流匯出單一資料表為 JSON Lines
+
+    依 rowid 遞增讀取，每 chunk_rows 筆寫入並 fsync 後記錄高水位；
+    可在獨立的行程中執行 (只接收路徑等可序列化參數)
 
     Args:
-        db_path: 一般庫存資料庫路徑
+        db_path: 資料庫路徑
+        table: 來源表名
+        output_file: 輸出 .jsonl 路徑
+        resume: 是否從上次的高水位繼續
+        chunk_rows: 每次取出並確認的筆數
 
     Returns:
-        一般庫存資料字典
+        匯出狀態 (high_water_mark, rows, bytes, exported_now, completed)
     """
-    try:
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    output_path = Path(output_file)
+    state_path = output_path.parent / STATE_DIR / f"{output_path.name}.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
 
-        # 匯出 items
-        cursor.execute("SELECT * FROM items")
-        items = [dict(row) for row in cursor.fetchall()]
+    state = _read_state(state_path) if resume else _new_state()
+    state["completed"] = False
 
-        # 匯出 transactions
-        cursor.execute("SELECT * FROM transactions")
-        transactions = [dict(row) for row in cursor.fetchall()]
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    exported_now = 0
 
-        conn.close()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT rowid AS "__rowid__", * FROM "{table}" WHERE rowid > ? ORDER BY rowid',
+            (state["high_water_mark"],)
+        )
 
-        return {
-            "items": items,
-            "transactions": transactions,
-            "record_count": {
-                "items": len(items),
-                "transactions": len(transactions)
-            }
-        }
+        # 續傳時截斷到最後一次確認的位置，丟棄中斷時寫了一半的資料
+        mode = 'r+b' if resume and output_path.exists() else 'wb'
+        with open(output_path, mode) as f:
+            f.truncate(state["bytes"])
+            f.seek(state["bytes"])
+
+            while True:
+                rows = cursor.fetchmany(chunk_rows)
+                if not rows:
+                    break
+
+                lines = []
+                for row in rows:
+                    record = dict(row)
+                    del record["__rowid__"]
+                    lines.append(json.dumps(record, ensure_ascii=False, default=_json_default))
+                f.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+                state["high_water_mark"] = rows[-1]["__rowid__"]
+                state["rows"] += len(rows)
+                state["bytes"] = f.tell()
+                exported_now += len(rows)
+                _write_state(state_path, state)
+
+        state["completed"] = True
+        _write_state(state_path, state)
+    finally:
+        conn.close()
 
-    except Exception as e:
-        print(f"✗ 從一般庫存資料庫匯出失敗: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
+    return {**state, "exported_now": exported_now}
 
 
 def get_station_metadata(db_path: str) -> dict:
@@ -149,13 +194,22 @@ def get_station_metadata(db_path: str) -> dict:
         return {}
 
 
-def export_station_data(config_path: str, output_path: str) -> bool:
+def export_station_data(
+    config_path: str,
+    output_dir: str,
+    resume: bool = False,
+    workers: int = 1,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS
+) -> bool:
     """
     匯出站點資料
 
     Args:
         config_path: 配置檔案路徑
-        output_path: 輸出檔案路徑
+        output_dir: 輸出目錄
+        resume: 是否從各表高水位繼續 (中斷續傳或追加新資料)
+        workers: 平行匯出的行程數，1 表示依序匯出
+        chunk_rows: 每次取出並確認的筆數
 
     Returns:
         是否成功
@@ -172,92 +226,105 @@ def export_station_data(config_path: str, output_path: str) -> bool:
             project_root = script_dir.parent
 
         # 取得資料庫路徑
-        general_db = os.path.join(
-            project_root,
-            config.get('database', {}).get('general_inventory_path', 'database/general_inventory.db')
-        )
-        pharmacy_db = os.path.join(
-            project_root,
-            config.get('database', {}).get('pharmacy_path', 'database/pharmacy.db')
-        )
+        db_paths = {
+            'general': os.path.join(
+                project_root,
+                config.get('database', {}).get('general_inventory_path', 'database/general_inventory.db')
+            ),
+            'pharmacy': os.path.join(
+                project_root,
+                config.get('database', {}).get('pharmacy_path', 'database/pharmacy.db')
+            ),
+        }
 
         # 檢查資料庫是否存在
-        if not os.path.exists(general_db):
-            print(f"✗ 一般庫存資料庫不存在: {general_db}")
+        if not os.path.exists(db_paths['general']):
+            print(f"✗ 一般庫存資料庫不存在: {db_paths['general']}")
             return False
 
-        if not os.path.exists(pharmacy_db):
-            print(f"✗ 藥局資料庫不存在: {pharmacy_db}")
+        if not os.path.exists(db_paths['pharmacy']):
+            print(f"✗ 藥局資料庫不存在: {db_paths['pharmacy']}")
             return False
 
         print(f"✓ 讀取配置檔案: {config_path}")
-        print(f"✓ 一般庫存資料庫: {general_db}")
-        print(f"✓ 藥局資料庫: {pharmacy_db}")
+        print(f"✓ 一般庫存資料庫: {db_paths['general']}")
+        print(f"✓ 藥局資料庫: {db_paths['pharmacy']}")
         print()
 
         # 取得站點後設資料
         print("正在讀取站點資料...")
-        station_metadata = get_station_metadata(general_db)
-
-        # 匯出藥局資料
-        print("正在匯出藥局資料...")
-        pharmacy_data = export_pharmacy_data(pharmacy_db)
-        print(f"  - Medicines: {pharmacy_data['record_count']['medicines']} 筆")
-        print(f"  - Transactions: {pharmacy_data['record_count']['transactions']} 筆")
-        print(f"  - Controlled Drug Logs: {pharmacy_data['record_count']['controlled_drug_logs']} 筆")
-
-        # 匯出一般庫存資料
-        print("正在匯出一般庫存資料...")
-        general_data = export_general_data(general_db)
-        print(f"  - Items: {general_data['record_count']['items']} 筆")
-        print(f"  - Transactions: {general_data['record_count']['transactions']} 筆")
-        print()
-
-        # 組合匯出資料
-        export_data = {
-            "export_meta": {
-                "station_id": station_metadata.get('station_code', config.get('station', {}).get('code', 'UNKNOWN')),
-                "station_name": station_metadata.get('station_name', config.get('station', {}).get('name', 'Unknown Station')),
-                "station_type": station_metadata.get('station_type', config.get('station', {}).get('station_type', 'UNKNOWN')),
-                "exported_at": datetime.now().isoformat(),
-                "schema_version": config.get('schema_version', '1.5.0')
-            },
-            "pharmacy_data": pharmacy_data,
-            "general_data": general_data
-        }
+        station_metadata = get_station_metadata(db_paths['general'])
 
         # 確保輸出目錄存在
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        output_root = Path(output_dir)
+        if not output_root.exists():
+            output_root.mkdir(parents=True)
             print(f"✓ 創建輸出目錄: {output_dir}")
 
-        # 寫入 JSON 檔案
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(export_data, f, ensure_ascii=False, indent=2)
+        # 未完成的匯出不應被誤認為完整，先移除舊的 export_meta.json
+        meta_path = output_root / META_FILE
+        if meta_path.exists():
+            meta_path.unlink()
+
+        jobs = [
+            (db_paths[database], table, str(output_root / f"{database}.{name}.jsonl"))
+            for database, table, name in EXPORT_TABLES
+        ]
+
+        mode = f"{workers} 個行程平行" if workers > 1 else "依序"
+        print(f"正在{mode}匯出資料{' (續傳)' if resume else ''}...")
+
+        results: List[Optional[Dict]] = [None] * len(jobs)
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(export_table, db_path, table, output_file, resume, chunk_rows)
+                    for db_path, table, output_file in jobs
+                ]
+                results = [future.result() for future in futures]
+        else:
+            for index, (db_path, table, output_file) in enumerate(jobs):
+                results[index] = export_table(db_path, table, output_file, resume, chunk_rows)
+
+        tables = {}
+        for (database, table, name), (_, _, output_file), result in zip(EXPORT_TABLES, jobs, results):
+            tables[f"{database}.{name}"] = {
+                "file": Path(output_file).name,
+                "source_table": table,
+                "rows": result["rows"],
+                "bytes": result["bytes"],
+                "high_water_mark": result["high_water_mark"]
+            }
+            print(f"  - {database}.{name}: {result['rows']} 筆 (本次 {result['exported_now']} 筆)")
+        print()
+
+        export_meta = {
+            "station_id": station_metadata.get('station_code', config.get('station', {}).get('code', 'UNKNOWN')),
+            "station_name": station_metadata.get('station_name', config.get('station', {}).get('name', 'Unknown Station')),
+            "station_type": station_metadata.get('station_type', config.get('station', {}).get('station_type', 'UNKNOWN')),
+            "exported_at": datetime.now().isoformat(),
+            "schema_version": config.get('schema_version', '1.5.0'),
+            "format": "jsonl"
+        }
 
-        # 取得檔案大小
-        file_size = os.path.getsize(output_path)
-        file_size_kb = file_size / 1024
+        tmp_meta = meta_path.with_suffix('.tmp')
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump({"export_meta": export_meta, "tables": tables}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_meta, meta_path)
 
-        print(f"✓ 資料匯出成功: {output_path}")
-        print(f"  - 檔案大小: {file_size_kb:.2f} KB")
+        total_bytes = sum(t["bytes"] for t in tables.values())
+        total_records = sum(t["rows"] for t in tables.values())
 
-        # 顯示匯出摘要
-        total_records = (
-            pharmacy_data['record_count']['medicines'] +
-            pharmacy_data['record_count']['transactions'] +
-            pharmacy_data['record_count']['controlled_drug_logs'] +
-            general_data['record_count']['items'] +
-            general_data['record_count']['transactions']
-        )
+        print(f"✓ 資料匯出成功: {output_dir}")
+        print(f"  - 檔案大小: {total_bytes / 1024:.2f} KB")
 
+        # 顯示匯出摘要
         print()
         print("匯出摘要：")
-        print(f"  - 站點ID: {export_data['export_meta']['station_id']}")
-        print(f"  - 站點名稱: {export_data['export_meta']['station_name']}")
+        print(f"  - 站點ID: {export_meta['station_id']}")
+        print(f"  - 站點名稱: {export_meta['station_name']}")
         print(f"  - 總記錄數: {total_records} 筆")
-        print(f"  - 匯出時間: {export_data['export_meta']['exported_at']}")
+        print(f"  - 匯出時間: {export_meta['exported_at']}")
 
         return True
 
@@ -275,20 +342,25 @@ def main():
     print("=" * 70)
     print()
 
-    # 檢查命令行參數
-    if len(sys.argv) < 3:
-        print("使用方式:")
-        print(f"  python {sys.argv[0]} <config_path> <output_path>")
-        print()
-        print("範例:")
-        print(f"  python {sys.argv[0]} config/station.json exports/output.json")
-        sys.exit(1)
-
-    config_path = sys.argv[1]
-    output_path = sys.argv[2]
+    parser = argparse.ArgumentParser(
+        description="串流匯出站點資料為 JSON Lines",
+        epilog=f"範例: python {sys.argv[0]} config/station.json exports/station_export --workers 2"
+    )
+    parser.add_argument('config_path', help="站點配置檔案")
+    parser.add_argument('output_dir', help="輸出目錄")
+    parser.add_argument('--resume', action='store_true', help="從各表高水位繼續 (中斷續傳或只追加新資料)")
+    parser.add_argument('--workers', type=int, default=1, help="平行匯出的行程數 (預設 1)")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help="每批筆數")
+    args = parser.parse_args()
 
     # 執行匯出
-    success = export_station_data(config_path, output_path)
+    success = export_station_data(
+        args.config_path,
+        args.output_dir,
+        resume=args.resume,
+        workers=max(1, args.workers),
+        chunk_rows=max(1, args.chunk_rows)
+    )
 
     print("=" * 70)
     if success:
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+增量備份還原腳本
+驗證備份鏈後，將資料庫還原到鏈上指定的環節 (時間點)
+"""
+
+import sys
+from pathlib import Path
+
+# 讓腳本可直接從專案根目錄或 scripts/ 執行
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.backup_chain import BackupChain, BackupChainError
+
+
+def list_links(chain: BackupChain):
+    """列出備份鏈環節"""
+    links = chain.links()
+    if not links:
+        print("✗ 備份鏈為空")
+        return
+
+    for link in links:
+        rows = f"{link['rows']} 筆" if link['rows'] is not None else "完整快照"
+        print(f"  #{link['seq']:<4} {link['type']:<5} {link['created_at']}  {link['size']:>10,} bytes  {rows}")
+
+
+def main():
+    """主函數"""
+    print("=" * 70)
+    print("增量備份還原工具")
+    print("=" * 70)
+    print()
+
+    if len(sys.argv) < 3:
+        print("使用方式:")
+        print(f"  python {sys.argv[0]} <chain_dir> --list")
+        print(f"  python {sys.argv[0]} <chain_dir> <output_db> [seq]")
+        print()
+        print("範例:")
+        print(f"  python {sys.argv[0]} backups/chain restored.db")
+        print(f"  python {sys.argv[0]} backups/chain restored.db 12")
+        sys.exit(1)
+
+    chain = BackupChain(sys.argv[1], db_path="")
+
+    if sys.argv[2] == "--list":
+        list_links(chain)
+        return
+
+    output_path = sys.argv[2]
+    upto_seq = int(sys.argv[3]) if len(sys.argv) > 3 else None
+
+    if Path(output_path).exists():
+        print(f"✗ 目標檔案已存在，請先移除: {output_path}")
+        sys.exit(1)
+
+    try:
+        result = chain.restore(output_path, upto_seq)
+    except BackupChainError as e:
+        print(f"✗ 備份鏈驗證失敗: {e}")
+        sys.exit(1)
+
+    print(f"✓ 基底: #{result['base_seq']}")
+    print(f"✓ 套用差異: {result['deltas_applied']} 個 ({result['rows_applied']} 筆)")
+    print(f"✓ 還原至: #{result['applied_seq']} ({result['restored_to']})")
+    print()
+    print("=" * 70)
+    print(f"✅ 還原完成: {result['path']}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+緊急備份包驗證腳本
+依 manifest.json 的 SHA-256 平行檢查每個成員，撤離前確認備份可信
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# 讓腳本可直接從專案根目錄或 scripts/ 執行
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.backup_verify import verify_archive
+
+
+def main():
+    """主函數"""
+    print("=" * 70)
+    print("緊急備份包驗證工具")
+    print("=" * 70)
+    print()
+
+    if len(sys.argv) < 2:
+        print("使用方式:")
+        print(f"  python {sys.argv[0]} <backup.zip> [workers]")
+        print()
+        print("範例:")
+        print(f"  python {sys.argv[0]} emergency_backup_BORP-01_20250101_120000.zip")
+        sys.exit(1)
+
+    archive_path = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else min(4, os.cpu_count() or 1)
+
+    if not Path(archive_path).exists():
+        print(f"✗ 檔案不存在: {archive_path}")
+        sys.exit(1)
+
+    result = verify_archive(archive_path, workers=workers)
+    if result.get("error"):
+        print(f"✗ {result['error']}")
+        sys.exit(1)
+
+    print(f"備份時間: {result['backup_time']}")
+    print(f"站點ID: {result['station_id']}")
+    print()
+
+    for member in result["members"]:
+        mark = "✓" if member["status"] == "OK" else ("?" if member["status"] == "UNHASHED" else "✗")
+        detail = f"  ({member['detail']})" if member["detail"] else ""
+        print(f"  {mark} {member['status']:<9} {member['name']}{detail}")
+    for name in result["unlisted"]:
+        print(f"  ✗ UNLISTED  {name}  (manifest 未列出)")
+
+    print()
+    print(f"檢查 {result['checked']} 個成員，耗時 {result['seconds']}s")
+    print("=" * 70)
+    if result["valid"]:
+        print("✅ 備份包完整")
+    elif not result["failed"] and not result["unlisted"]:
+        if result["unverified"]:
+            print(f"⚠️ 備份包未驗證: {len(result['unverified'])} 個成員未記錄 SHA-256，無法確認內容未被修改")
+        else:
+            print("⚠️ 備份包未驗證: manifest 未列出任何成員")
+        sys.exit(1)
+    else:
+        print("❌ 備份包驗證失敗")
+        sys.exit(1)
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
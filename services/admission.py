@@ -0,0 +1,249 @@
+"""
+請求優先等級與准入控制 (ASGI 中介層)
+依路由將請求分為三級，各級有獨立的同時執行上限與等候佇列：
+
+- critical: 臨床寫入 (緊急領藥、血袋出庫、進貨消耗等)
+- interactive: 一般查詢與操作
+- bulk: 匯出、備份、同步封包等大量工作
+
+critical 請求的延遲 (含排隊) 記錄在滑動視窗中；p99 超過預算或 critical 有請求在排隊時，
+新的 bulk 請求先延後，延後逾時仍未恢復則以 503 拒絕 (Retry-After)，
+讓 critical 路徑的延遲不受匯出負載影響。
+"""
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+
+CRITICAL = 'critical'
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class AdmissionRejected(Exception):
+    """佇列已滿或等候逾時"""
+
+    def __init__(self, detail: str, retry_after: int = 5):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class PriorityClass:
+    """單一優先等級的執行名額與 FIFO 等候佇列 (僅在事件迴圈中存取)"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        """
+        Args:
+            name: 等級名稱
+            max_concurrent: 同時執行上限
+            max_queue: 等候佇列上限，超過時直接拒絕
+            queue_timeout: 等候逾時秒數
+        """
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.active = 0
+        self._waiters: deque = deque()
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "timeouts": 0, "shed": 0, "deferred": 0}
+        # (完成時間, 延遲秒數)
+        self.latencies: deque = deque(maxlen=2000)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """取得執行名額，必要時排隊等候"""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self.stats["admitted"] += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise AdmissionRejected(f"{self.name} 請求佇列已滿，請稍後再試")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.stats["queued"] += 1
+        try:
+            # 不用 wait_for：逾時或連線中斷時仍能判斷名額是否已交接給本請求
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        if not waiter.done():
+            self._abandon(waiter)
+            self.stats["timeouts"] += 1
+            raise AdmissionRejected(f"{self.name} 請求等候逾時 ({self.queue_timeout:g} 秒)")
+        self.stats["admitted"] += 1
+
+    def _abandon(self, waiter: asyncio.Future):
+        """放棄等候；名額若已交接給此等候者則轉交下一位"""
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        """釋放名額：有等候者時直接交接，不經過 active 計數"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def record_latency(self, seconds: float):
+        self.latencies.append((time.monotonic(), seconds))
+
+    def percentile(self, q: float, window_seconds: float) -> Optional[float]:
+        """滑動視窗內的延遲百分位數 (秒)，視窗內無資料時回傳 None"""
+        cutoff = time.monotonic() - window_seconds
+        values = sorted(seconds for finished, seconds in self.latencies if finished >= cutoff)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    def get_status(self, window_seconds: float) -> Dict:
+        p50 = self.percentile(0.50, window_seconds)
+        p99 = self.percentile(0.99, window_seconds)
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            **self.stats,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None
+        }
+
+
+class AdmissionController:
+    """各優先等級的准入控制與 bulk 降載判斷"""
+
+    def __init__(
+        self,
+        classes: Dict[str, PriorityClass],
+        critical_budget_ms: float = 500,
+        latency_window_seconds: float = 10,
+        bulk_defer_seconds: float = 10
+    ):
+        """
+        Args:
+            classes: {等級名稱: PriorityClass}，需包含 critical 與 bulk
+            critical_budget_ms: critical 請求 p99 延遲預算
+            latency_window_seconds: 計算 p99 的滑動視窗
+            bulk_defer_seconds: critical 超出預算時 bulk 請求最多延後的秒數
+        """
+        self.classes = classes
+        self.critical_budget = critical_budget_ms / 1000
+        self.latency_window = latency_window_seconds
+        self.bulk_defer_seconds = bulk_defer_seconds
+
+    def critical_degraded(self) -> bool:
+        """critical 有請求排隊，或近期 p99 超過預算"""
+        critical = self.classes[CRITICAL]
+        if critical.waiting:
+            return True
+        p99 = critical.percentile(0.99, self.latency_window)
+        return p99 is not None and p99 > self.critical_budget
+
+    async def admit(self, class_name: str) -> PriorityClass:
+        """
+        准入請求，回傳取得名額的等級 (完成後呼叫其 release())
+
+        bulk 請求在 critical 超出預算時先延後，延後逾時則拒絕
+        """
+        priority_class = self.classes[class_name]
+
+        if class_name == BULK and self.critical_degraded():
+            priority_class.stats["deferred"] += 1
+            deadline = time.monotonic() + self.bulk_defer_seconds
+            while self.critical_degraded():
+                if time.monotonic() >= deadline:
+                    priority_class.stats["shed"] += 1
+                    raise AdmissionRejected("臨床作業優先處理中，大量作業暫緩，請稍後再試", retry_after=30)
+                await asyncio.sleep(0.25)
+
+        await priority_class.acquire()
+        return priority_class
+
+    def get_status(self) -> Dict:
+        return {
+            "critical_budget_ms": self.critical_budget * 1000,
+            "latency_window_seconds": self.latency_window,
+            "critical_degraded": self.critical_degraded(),
+            "classes": {name: c.get_status(self.latency_window) for name, c in self.classes.items()}
+        }
+
+
+class AdmissionMiddleware:
+    """
+    ASGI 中介層：依 classify(method, path) 決定等級後准入
+
+    classify 回傳 None 的請求 (靜態頁面、SSE 長連線等) 不受控制；
+    名額持有到回應完整送出為止 (含串流回應)
+    """
+
+    def __init__(self, app, controller: AdmissionController, classify: Callable[[str, str], Optional[str]]):
+        self.app = app
+        self.controller = controller
+        self.classify = classify
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        class_name = self.classify(scope["method"], scope["path"])
+        if class_name is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        try:
+            priority_class = await self.controller.admit(class_name)
+        except AdmissionRejected as e:
+            await self._reject(send, e, class_name)
+            return
+
+        header = (b"x-priority-class", class_name.encode("ascii"))
+
+        async def send_with_class(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [header]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_class)
+        finally:
+            priority_class.release()
+            priority_class.record_latency(time.monotonic() - started)
+
+    @staticmethod
+    async def _reject(send, error: AdmissionRejected, class_name: str):
+        body = json.dumps({"detail": error.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(error.retry_after).encode("ascii")),
+                (b"x-priority-class", class_name.encode("ascii"))
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
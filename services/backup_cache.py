@@ -0,0 +1,160 @@
+"""
+備份產物快取
+以資料庫資料版本 (PRAGMA data_version) 作為快取鍵：資料未變更時直接回傳既有產物，
+同一版本的並行請求合併為單次建置，所有等待者共用結果
+"""
+
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+
+class DataVersionMonitor:
+    """
+    資料版本監視器
+
+    PRAGMA data_version 只在「其他連線」提交變更時遞增，且數值只對同一連線有意義，
+    因此以一條只讀、長期保持的連線查詢
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        """取得目前資料版本"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class BackupArtifactCache:
+    """依 (種類, 資料版本) 快取備份產物檔案"""
+
+    def __init__(self, cache_dir: str, monitor: DataVersionMonitor):
+        """
+        初始化快取
+
+        Args:
+            cache_dir: 產物存放目錄 (啟動時清空；版本號跨連線無意義)
+            monitor: 資料版本監視器
+        """
+        self.cache_dir = Path(cache_dir)
+        self.monitor = monitor
+
+        self._artifacts: Dict[str, Dict] = {}
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self.stats = {"hits": 0, "builds": 0, "coalesced": 0, "failures": 0}
+
+        if self.cache_dir.exists():
+            for stale in self.cache_dir.iterdir():
+                if stale.is_file():
+                    stale.unlink()
+
+    async def get(
+        self,
+        kind: str,
+        builder: Callable[[str], Dict],
+        suffix: str = "",
+        fingerprint: str = ""
+    ) -> Dict:
+        """
+        取得產物，必要時建置
+
+        Args:
+            kind: 產物種類 (例如 'db'、'full')
+            builder: 在執行緒池中呼叫 builder(目標路徑) 建置產物，回傳附加資訊
+            suffix: 產物副檔名
+            fingerprint: 資料庫以外會影響產物內容的因素 (例如設定檔修改時間)
+
+        Returns:
+            產物資訊 (path, version, built_at, seconds, size, cache: HIT/MISS/COALESCED, ...)
+        """
+        version = await asyncio.get_running_loop().run_in_executor(None, self.monitor.current)
+        key = (kind, version, fingerprint)
+
+        artifact = self._artifacts.get(kind)
+        if artifact and artifact["key"] == key and Path(artifact["path"]).exists():
+            self.stats["hits"] += 1
+            return {**artifact, "cache": "HIT"}
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            artifact = await asyncio.shield(task)
+            return {**artifact, "cache": "COALESCED"}
+
+        # 建置在獨立 task 中進行，發起請求的客戶端中斷不影響其他等待者
+        task = asyncio.ensure_future(self._build(key, builder, suffix))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        artifact = await asyncio.shield(task)
+        return {**artifact, "cache": "MISS"}
+
+    async def _build(self, key: Tuple, builder: Callable[[str], Dict], suffix: str) -> Dict:
+        kind, version, _ = key
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{kind}_{version}_{int(time.time() * 1000)}{suffix}"
+
+        started = time.monotonic()
+        try:
+            extra = await asyncio.get_running_loop().run_in_executor(None, builder, str(path))
+        except Exception:
+            self.stats["failures"] += 1
+            path.unlink(missing_ok=True)
+            raise
+
+        artifact = {
+            **(extra or {}),
+            "key": key,
+            "kind": kind,
+            "path": str(path),
+            "version": version,
+            "built_at": time.time(),
+            "seconds": round(time.monotonic() - started, 3),
+            "size": path.stat().st_size
+        }
+
+        # 保留前一版產物 (可能仍有請求正要開始傳送)，再前一版才刪除
+        previous = self._artifacts.get(kind)
+        if previous:
+            artifact["previous_path"] = previous["path"]
+            if previous.get("previous_path"):
+                Path(previous["previous_path"]).unlink(missing_ok=True)
+
+        self._artifacts[kind] = artifact
+        self.stats["builds"] += 1
+        return artifact
+
+    def artifact_path(self, kind: str) -> Optional[str]:
+        """取得某種類最新產物的路徑"""
+        artifact = self._artifacts.get(kind)
+        return artifact["path"] if artifact else None
+
+    def get_status(self) -> Dict:
+        """快取狀態與命中統計"""
+        return {
+            **self.stats,
+            "building": [f"{kind}@{version}" for kind, version, _ in self._inflight],
+            "artifacts": {
+                kind: {
+                    "version": artifact["version"],
+                    "size": artifact["size"],
+                    "built_at": artifact["built_at"],
+                    "seconds": artifact["seconds"]
+                }
+                for kind, artifact in self._artifacts.items()
+            }
+        }
@@ -0,0 +1,514 @@
+"""
+增量備份鏈
+基底快照 (完整資料庫) + 之後的小型差異檔，每個環節的清單含前一環節雜湊，
+形成可驗證的雜湊鏈；可還原到鏈上任一時間點
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.backup_service import SQLiteBackupEngine, BackupError
+
+
+# 以新增為主的事件表，新資料列依 id 水位擷取，修改與刪除由變更記錄補上；
+# 其他表的新增、修改與刪除全部由變更記錄擷取 (例如扣庫存未更新 updated_at、刪除物品)
+APPEND_ONLY_TABLES = (
+    'inventory_events', 'blood_events', 'equipment_checks',
+    'surgery_consumptions', 'station_merge_history', 'inventory_audit_details'
+)
+
+# 變更記錄表：觸發器寫入每筆異動資料列的鍵值，差異環節據此擷取變更內容與刪除 (墓碑)
+CHANGE_LOG_TABLE = 'backup_change_log'
+
+# 備份本身的記錄表不納入差異 (否則每次執行都會產生只含執行記錄的差異)；
+# 冪等鍵為短期暫存，同樣不納入
+EXCLUDED_TABLES = ('backup_runs', 'idempotency_keys', CHANGE_LOG_TABLE)
+
+# 差異檔資料列批次大小
+_FETCH_BATCH = 1000
+
+
+class BackupChainError(BackupError):
+    """備份鏈損毀或不完整"""
+    pass
+
+
+def _sha256_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_hash(manifest: Dict) -> str:
+    body = {k: v for k, v in manifest.items() if k != 'hash'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _table_strategies(conn: sqlite3.Connection) -> Dict[str, Dict]:
+    """
+    決定每張表的擷取方式與資料列鍵
+
+    Returns:
+        {表名: {"strategy": 'append' | 'log', "key": [鍵欄位]}}
+        - append: APPEND_ONLY_TABLES 中的事件表，擷取 id 大於水位的新資料，另加變更記錄中的修改/刪除
+        - log: 依變更記錄擷取新增、修改與刪除
+        鍵為主鍵欄位，無主鍵的表以 rowid 為鍵
+    """
+    strategies = {}
+    tables = conn.execute("""
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+        ORDER BY name
+    """).fetchall()
+
+    for (table,) in tables:
+        if table in EXCLUDED_TABLES:
+            continue
+        info = list(conn.execute(f'PRAGMA table_info({_quote(table)})'))
+        columns = {row[1] for row in info}
+        key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5] > 0] or ['rowid']
+
+        strategy = 'append' if table in APPEND_ONLY_TABLES and key == ['id'] and 'id' in columns else 'log'
+        strategies[table] = {"strategy": strategy, "key": key}
+    return strategies
+
+
+def install_change_log(conn: sqlite3.Connection, strategies: Dict[str, Dict]):
+    """
+    建立變更記錄表與各表觸發器 (已存在則略過)
+
+    append 表的新增由 id 水位涵蓋，只記錄修改與刪除；修改鍵值時新舊鍵都記錄
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHANGE_LOG_TABLE} (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key TEXT NOT NULL
+        )
+    """)
+
+    for table, spec in strategies.items():
+        operations = ('UPDATE', 'DELETE') if spec['strategy'] == 'append' else ('INSERT', 'UPDATE', 'DELETE')
+        literal = "'" + table.replace("'", "''") + "'"
+        for operation in operations:
+            def key_sql(row: str) -> str:
+                return "json_array(" + ", ".join(
+                    f"{row}.rowid" if column == 'rowid' else f"{row}.{_quote(column)}" for column in spec['key']
+                ) + ")"
+
+            row = 'OLD' if operation == 'DELETE' else 'NEW'
+            statements = [f"INSERT INTO {CHANGE_LOG_TABLE} (table_name, row_key) VALUES ({literal}, {key_sql(row)});"]
+            if operation == 'UPDATE':
+                statements.append(
+                    f"INSERT INTO {CHANGE_LOG_TABLE} (table_name, row_key) "
+                    f"SELECT {literal}, {key_sql('OLD')} WHERE {key_sql('OLD')} IS NOT {key_sql('NEW')};"
+                )
+
+            trigger = _quote(f"trg_backup_log_{table}_{operation.lower()}")
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {trigger}
+                AFTER {operation} ON {_quote(table)}
+                BEGIN
+                    {' '.join(statements)}
+                END
+            """)
+
+
+def _scan_state(conn: sqlite3.Connection, strategies: Dict[str, Dict]) -> Dict:
+    """
+    記錄目前水位
+
+    Returns:
+        watermarks: append 表的 MAX(id)
+        change_log_seq: 變更記錄的最大序號 (下一次差異從此之後讀取)
+    """
+    watermarks = {
+        table: conn.execute(f'SELECT MAX(id) FROM {_quote(table)}').fetchone()[0]
+        for table, spec in strategies.items() if spec['strategy'] == 'append'
+    }
+    change_log_seq = conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {CHANGE_LOG_TABLE}").fetchone()[0]
+    return {"watermarks": watermarks, "change_log_seq": change_log_seq}
+
+
+def _select_columns(spec: Dict) -> str:
+    return "rowid, *" if spec['key'] == ['rowid'] else "*"
+
+
+def _key_where(spec: Dict) -> str:
+    return " AND ".join(f"{'rowid' if column == 'rowid' else _quote(column)} = ?" for column in spec['key'])
+
+
+class BackupChain:
+    """增量備份鏈管理"""
+
+    def __init__(self, chain_dir: str, db_path: str, engine: Optional[SQLiteBackupEngine] = None):
+        """
+        初始化備份鏈
+
+        Args:
+            chain_dir: 備份鏈目錄
+            db_path: 來源資料庫路徑
+            engine: 產生基底快照用的備份引擎
+        """
+        self.chain_dir = Path(chain_dir)
+        self.db_path = db_path
+        self.engine = engine or SQLiteBackupEngine(db_path)
+
+    # ========== 鏈結讀取 ==========
+
+    def links(self) -> List[Dict]:
+        """依序列出所有環節清單"""
+        if not self.chain_dir.exists():
+            return []
+        manifests = []
+        for path in sorted(self.chain_dir.glob("link_*.json")):
+            with open(path, 'r', encoding='utf-8') as f:
+                manifests.append(json.load(f))
+        return manifests
+
+    def verify(self, upto_seq: Optional[int] = None) -> List[Dict]:
+        """
+        驗證雜湊鏈與資料檔
+
+        Args:
+            upto_seq: 驗證到此序號 (含)，預設整條鏈
+
+        Returns:
+            驗證通過的環節清單
+
+        Raises:
+            BackupChainError: 雜湊不符、資料檔遺失或鏈結中斷
+        """
+        links = self.links()
+        if upto_seq is not None:
+            links = [link for link in links if link['seq'] <= upto_seq]
+        if not links:
+            raise BackupChainError("備份鏈為空")
+
+        # 輪替後鏈首為保留下來的最舊基底，其 prev_hash 指向已刪除的環節，作為錨點
+        if links[0]['type'] != 'BASE':
+            raise BackupChainError(f"環節 {links[0]['seq']} 之前的基底已遺失")
+        prev_hash = links[0]['prev_hash']
+        for link in links:
+            if link['hash'] != _manifest_hash(link):
+                raise BackupChainError(f"環節 {link['seq']} 清單雜湊不符")
+            if link['prev_hash'] != prev_hash:
+                raise BackupChainError(f"環節 {link['seq']} 與前一環節鏈結中斷")
+
+            data_path = self.chain_dir / link['file']
+            if not data_path.exists():
+                raise BackupChainError(f"環節 {link['seq']} 資料檔遺失: {link['file']}")
+            if _sha256_file(data_path) != link['file_sha256']:
+                raise BackupChainError(f"環節 {link['seq']} 資料檔雜湊不符")
+            prev_hash = link['hash']
+        return links
+
+    # ========== 建立環節 ==========
+
+    def _write_link(self, manifest: Dict, data_path: Path) -> Dict:
+        links = self.links()
+        manifest['prev_hash'] = links[-1]['hash'] if links else None
+        manifest['file_sha256'] = _sha256_file(data_path)
+        manifest['size'] = data_path.stat().st_size
+        manifest['hash'] = _manifest_hash(manifest)
+
+        manifest_path = self.chain_dir / f"link_{manifest['seq']:06d}.json"
+        tmp_path = manifest_path.with_suffix('.json.partial')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, manifest_path)
+        return manifest
+
+    def _next_seq(self) -> int:
+        links = self.links()
+        return links[-1]['seq'] + 1 if links else 1
+
+    def _install_change_log(self) -> Dict[str, Dict]:
+        """在來源資料庫建立變更記錄觸發器，回傳各表擷取方式"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            strategies = _table_strategies(conn)
+            install_change_log(conn, strategies)
+            conn.commit()
+        finally:
+            conn.close()
+        return strategies
+
+    def create_base(self) -> Dict:
+        """建立基底快照環節 (快照前先建立變更記錄觸發器，之後的異動都會被記錄)"""
+        self.chain_dir.mkdir(parents=True, exist_ok=True)
+        seq = self._next_seq()
+        data_path = self.chain_dir / f"link_{seq:06d}_base.db"
+
+        started = datetime.now()
+        self._install_change_log()
+        snapshot = self.engine.snapshot(str(data_path))
+
+        conn = sqlite3.connect(f"file:{data_path}?mode=ro", uri=True)
+        try:
+            strategies = _table_strategies(conn)
+            state = _scan_state(conn, strategies)
+        finally:
+            conn.close()
+
+        manifest = {
+            "seq": seq,
+            "type": "BASE",
+            "base_seq": seq,
+            "created_at": started.isoformat(),
+            "file": data_path.name,
+            "strategies": strategies,
+            **state,
+            "rows": None,
+            "seconds": snapshot['seconds']
+        }
+        return self._write_link(manifest, data_path)
+
+    def _collect_table(self, conn: sqlite3.Connection, table: str, spec: Dict,
+                       previous: Dict, changed_keys: List[str]) -> Dict:
+        """
+        擷取單表的差異
+
+        Returns:
+            {strategy, key, columns, rows, deleted}；deleted 為已刪除資料列的鍵值 (墓碑)
+        """
+        select = f'SELECT {_select_columns(spec)} FROM {_quote(table)}'
+        columns = [d[0] for d in conn.execute(f'{select} LIMIT 0').description]
+        rows, deleted = [], []
+
+        # 前一環節尚未以相同方式記錄此表 (新表或舊版備份鏈)：整表複製一次
+        if previous['strategies'].get(table) != spec or previous.get('change_log_seq') is None:
+            cursor = conn.execute(select)
+            while True:
+                batch = cursor.fetchmany(_FETCH_BATCH)
+                if not batch:
+                    break
+                rows.extend(list(row) for row in batch)
+            return {"strategy": "full", "key": spec['key'], "columns": columns, "rows": rows, "deleted": deleted}
+
+        mark = None
+        if spec['strategy'] == 'append':
+            mark = previous['watermarks'].get(table)
+            if mark is None:
+                mark = -1
+            cursor = conn.execute(f'{select} WHERE id > ? ORDER BY id', (mark,))
+            while True:
+                batch = cursor.fetchmany(_FETCH_BATCH)
+                if not batch:
+                    break
+                rows.extend(list(row) for row in batch)
+
+        where = _key_where(spec)
+        for row_key in changed_keys:
+            values = json.loads(row_key)
+            # append 表 id 大於水位的資料列已在上方擷取
+            if mark is not None and values[0] > mark:
+                continue
+            row = conn.execute(f'{select} WHERE {where}', values).fetchone()
+            if row is None:
+                deleted.append(values)
+            else:
+                rows.append(list(row))
+
+        return {"strategy": spec['strategy'], "key": spec['key'], "columns": columns, "rows": rows, "deleted": deleted}
+
+    def create_delta(self) -> Optional[Dict]:
+        """
+        建立差異環節：上一環節之後新增、變更的資料列，以及刪除的資料列鍵值 (墓碑)
+
+        Returns:
+            新環節清單；沒有任何變更時回傳 None
+
+        Raises:
+            BackupChainError: 尚無基底快照
+        """
+        links = self.links()
+        if not links:
+            raise BackupChainError("尚無基底快照，請先建立基底")
+
+        previous = links[-1]
+        seq = previous['seq'] + 1
+        started = datetime.now()
+
+        self._install_change_log()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            # 上一環節已寫入，其水位之前的變更記錄不再需要
+            if previous.get('change_log_seq') is not None:
+                conn.execute(f"DELETE FROM {CHANGE_LOG_TABLE} WHERE seq <= ?", (previous['change_log_seq'],))
+                conn.commit()
+
+            # 單一讀取交易，所有表取自同一時間點
+            conn.execute("BEGIN")
+            strategies = _table_strategies(conn)
+            state = _scan_state(conn, strategies)
+
+            changed = {}
+            if previous.get('change_log_seq') is not None:
+                cursor = conn.execute(f"""
+                    SELECT table_name, row_key FROM {CHANGE_LOG_TABLE}
+                    WHERE seq > ? AND seq <= ?
+                    GROUP BY table_name, row_key
+                """, (previous['change_log_seq'], state['change_log_seq']))
+                for table, row_key in cursor:
+                    changed.setdefault(table, []).append(row_key)
+
+            tables = {}
+            rows_total = 0
+            for table, spec in strategies.items():
+                body = self._collect_table(conn, table, spec, previous, changed.get(table, []))
+                if body['rows'] or body['deleted'] or body['strategy'] == 'full':
+                    tables[table] = body
+                    rows_total += len(body['rows']) + len(body['deleted'])
+
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        if not tables:
+            return None
+
+        data_path = self.chain_dir / f"link_{seq:06d}_delta.json.gz"
+        tmp_path = data_path.with_suffix('.gz.partial')
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(tables, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, data_path)
+
+        manifest = {
+            "seq": seq,
+            "type": "DELTA",
+            "base_seq": previous['base_seq'],
+            "created_at": started.isoformat(),
+            "file": data_path.name,
+            "strategies": strategies,
+            **state,
+            "rows": rows_total,
+            "seconds": round((datetime.now() - started).total_seconds(), 3)
+        }
+        return self._write_link(manifest, data_path)
+
+    def create(self, max_deltas: int = 24) -> Dict:
+        """
+        建立下一個環節：無基底或差異數已達上限時建立新基底，否則建立差異
+
+        Returns:
+            {"link": 新環節清單或 None, "skipped": 是否因無變更而略過}
+        """
+        links = self.links()
+        if not links or sum(1 for l in links if l['base_seq'] == links[-1]['base_seq']) > max_deltas:
+            return {"link": self.create_base(), "skipped": False}
+
+        link = self.create_delta()
+        return {"link": link or links[-1], "skipped": link is None}
+
+    def prune(self, keep_bases: int) -> List[str]:
+        """
+        輪替：只保留最近 keep_bases 個基底及其差異
+
+        Returns:
+            已刪除的檔案路徑
+        """
+        links = self.links()
+        base_seqs = sorted({link['base_seq'] for link in links})
+        if keep_bases < 1 or len(base_seqs) <= keep_bases:
+            return []
+
+        oldest_kept = base_seqs[-keep_bases]
+        removed = []
+        for link in links:
+            if link['base_seq'] >= oldest_kept:
+                continue
+            for name in (link['file'], f"link_{link['seq']:06d}.json"):
+                path = self.chain_dir / name
+                if path.exists():
+                    path.unlink()
+                    removed.append(str(path))
+
+        return removed
+
+    def total_size(self) -> int:
+        """備份鏈占用的總大小"""
+        return sum(link['size'] for link in self.links())
+
+    # ========== 還原 ==========
+
+    def restore(self, target_path: str, upto_seq: Optional[int] = None) -> Dict:
+        """
+        還原資料庫到鏈上某一時間點
+
+        Args:
+            target_path: 還原後的資料庫路徑 (不可為線上資料庫)
+            upto_seq: 還原到此序號 (含)，預設最新環節
+
+        Returns:
+            還原摘要 (base_seq, applied_seq, rows_applied, path)
+
+        Raises:
+            BackupChainError: 鏈驗證失敗
+        """
+        links = self.verify(upto_seq)
+        target_seq = links[-1]['seq']
+        base_seq = links[-1]['base_seq']
+        chain = [link for link in links if link['seq'] >= base_seq]
+
+        target = Path(target_path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target.with_name(target.name + ".partial")
+        shutil.copyfile(self.chain_dir / chain[0]['file'], tmp_path)
+
+        rows_applied = 0
+        conn = sqlite3.connect(str(tmp_path))
+        try:
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            for link in chain[1:]:
+                with gzip.open(self.chain_dir / link['file'], 'rt', encoding='utf-8') as f:
+                    tables = json.load(f)
+
+                for table, body in tables.items():
+                    # 基底之後才新增的表無法由差異重建結構，略過
+                    if table not in existing:
+                        continue
+                    if body['strategy'] == 'full':
+                        conn.execute(f'DELETE FROM {_quote(table)}')
+                    if body.get('deleted'):
+                        conn.executemany(
+                            f'DELETE FROM {_quote(table)} WHERE {_key_where(body)}',
+                            body['deleted']
+                        )
+
+                    column_sql = ", ".join('rowid' if c == 'rowid' else _quote(c) for c in body['columns'])
+                    placeholders = ", ".join("?" * len(body['columns']))
+                    conn.executemany(
+                        f'INSERT OR REPLACE INTO {_quote(table)} ({column_sql}) VALUES ({placeholders})',
+                        body['rows']
+                    )
+                    rows_applied += len(body['rows']) + len(body.get('deleted', []))
+            conn.commit()
+        except Exception:
+            conn.close()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        conn.close()
+        os.replace(tmp_path, target)
+
+        return {
+            "path": str(target),
+            "base_seq": base_seq,
+            "applied_seq": target_seq,
+            "deltas_applied": len(chain) - 1,
+            "rows_applied": rows_applied,
+            "restored_to": links[-1]['created_at']
+        }
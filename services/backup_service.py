@@ -0,0 +1,224 @@
+"""
+線上資料庫備份引擎
+以 SQLite Online Backup API (sqlite3.Connection.backup) 分段複製頁面，
+產生一致性快照檔；每段之間釋放鎖定，寫入端只需等待單一小段複製
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+
+# 每段複製的頁數 (預設 page_size 4KB 時約 1MB)
+DEFAULT_PAGES_PER_STEP = 256
+# 每段之間讓出的時間 (秒)，讓寫入端有機會取得鎖定
+DEFAULT_STEP_SLEEP = 0.005
+
+
+class BackupError(RuntimeError):
+    """備份失敗"""
+    pass
+
+
+class SQLiteBackupEngine:
+    """SQLite 線上備份引擎"""
+
+    def __init__(
+        self,
+        db_path: str,
+        pages_per_step: int = DEFAULT_PAGES_PER_STEP,
+        step_sleep: float = DEFAULT_STEP_SLEEP,
+        throttle_sleep: float = 0.0
+    ):
+        """
+        初始化備份引擎
+
+        Args:
+            db_path: 來源資料庫路徑
+            pages_per_step: 每段複製頁數，越小寫入端等待越短、備份總時間越長
+            step_sleep: 來源忙碌 (被鎖定) 時重試前的等待秒數
+            throttle_sleep: 每段完成後固定暫停的秒數，用於排程備份限制 I/O，
+                讓前景 API 的讀寫不受影響
+        """
+        if pages_per_step < 1:
+            raise ValueError("pages_per_step 必須大於 0")
+
+        self.db_path = db_path
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self.throttle_sleep = throttle_sleep
+
+        self._lock = threading.Lock()
+        self._status: Dict = {"state": "IDLE"}
+        # 狀態變更時另外通知 (例如在子行程中執行時，將進度送回主行程)
+        self.status_listener: Optional[Callable[[Dict], None]] = None
+
+    def get_status(self) -> Dict:
+        """取得目前 (或最近一次) 備份的進度"""
+        with self._lock:
+            return dict(self._status)
+
+    def update_status(self, **fields):
+        """合併外部回報的狀態 (例如子行程中同一引擎的進度)"""
+        with self._lock:
+            self._status.update(fields)
+
+    def _set_status(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+        listener = self.status_listener
+        if listener is not None:
+            listener(fields)
+
+    def snapshot(
+        self,
+        dest_path: Optional[str] = None,
+        progress_callback: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
+        """
+        產生一致性快照
+
+        先寫入同目錄暫存檔，完成後才改名為目標檔，中途失敗不會留下半成品
+
+        Args:
+            dest_path: 快照檔路徑，未指定時建立於系統暫存目錄
+            progress_callback: 每段完成時呼叫，參數為進度資訊
+
+        Returns:
+            快照結果 (path, pages, bytes, seconds, steps, throughput_bytes_per_sec)
+
+        Raises:
+            BackupError: 來源不存在或複製失敗
+        """
+        if not Path(self.db_path).exists():
+            raise BackupError(f"資料庫檔案不存在: {self.db_path}")
+
+        if dest_path is None:
+            fd, dest_path = tempfile.mkstemp(prefix="snapshot_", suffix=".db")
+            os.close(fd)
+
+        dest = Path(dest_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest.with_name(dest.name + ".partial")
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+        started = time.monotonic()
+        steps = 0
+        self._set_status(
+            state="RUNNING", path=str(dest), started_at=time.time(),
+            pages_copied=0, pages_total=None, percent=0.0,
+            bytes_per_sec=0.0, error=None
+        )
+
+        source = sqlite3.connect(self.db_path, check_same_thread=False)
+        target = sqlite3.connect(str(tmp_path), check_same_thread=False)
+        try:
+            page_size = source.execute("PRAGMA page_size").fetchone()[0]
+
+            def on_progress(status, remaining, total):
+                nonlocal steps
+                steps += 1
+                copied = total - remaining
+                elapsed = max(time.monotonic() - started, 1e-6)
+                progress = {
+                    "pages_copied": copied,
+                    "pages_total": total,
+                    "percent": round(copied / total * 100, 1) if total else 100.0,
+                    "bytes_per_sec": round(copied * page_size / elapsed, 1)
+                }
+                self._set_status(**progress)
+                if progress_callback:
+                    progress_callback(progress)
+                if self.throttle_sleep and remaining:
+                    time.sleep(self.throttle_sleep)
+
+            source.backup(
+                target,
+                pages=self.pages_per_step,
+                progress=on_progress,
+                sleep=self.step_sleep
+            )
+            total_pages = target.execute("PRAGMA page_count").fetchone()[0]
+        except sqlite3.Error as e:
+            self._set_status(state="FAILED", error=str(e))
+            target.close()
+            tmp_path.unlink(missing_ok=True)
+            raise BackupError(f"備份失敗: {e}")
+        finally:
+            source.close()
+            target.close()
+
+        os.replace(tmp_path, dest)
+
+        seconds = time.monotonic() - started
+        size = dest.stat().st_size
+        result = {
+            "path": str(dest),
+            "pages": total_pages,
+            "page_size": page_size,
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "steps": steps,
+            "throughput_bytes_per_sec": round(size / seconds, 1) if seconds > 0 else float(size)
+        }
+        self._set_status(
+            state="COMPLETED", pages_copied=total_pages, pages_total=total_pages,
+            percent=100.0, bytes_per_sec=result["throughput_bytes_per_sec"],
+            seconds=result["seconds"], bytes=size
+        )
+        return result
+
+
+def apply_retention(
+    directory: str,
+    pattern: str = "*",
+    max_files: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    max_age_days: Optional[float] = None
+) -> List[str]:
+    """
+    依數量、總大小與保存天數清理目錄內的檔案 (由舊到新刪除)
+
+    Args:
+        directory: 目錄
+        pattern: 檔名樣式
+        max_files: 最多保留檔案數
+        max_bytes: 最多保留總大小
+        max_age_days: 超過此天數的檔案刪除
+
+    Returns:
+        已刪除的檔案路徑
+    """
+    folder = Path(directory)
+    if not folder.exists():
+        return []
+
+    files = sorted(
+        (p for p in folder.glob(pattern) if p.is_file() and not p.name.endswith(".partial")),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+
+    removed = []
+    now = time.time()
+    kept_bytes = 0
+    for index, path in enumerate(files):
+        stat = path.stat()
+        expired = max_age_days is not None and now - stat.st_mtime > max_age_days * 86400
+        over_count = max_files is not None and index >= max_files
+        over_size = max_bytes is not None and kept_bytes + stat.st_size > max_bytes and index > 0
+
+        if expired or over_count or over_size:
+            try:
+                path.unlink()
+                removed.append(str(path))
+            except OSError:
+                pass
+        else:
+            kept_bytes += stat.st_size
+    return removed
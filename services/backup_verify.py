@@ -0,0 +1,136 @@
+"""
+備份包驗證
+依 manifest.json 記錄的 SHA-256 逐一檢查 ZIP 成員；
+各成員獨立驗證，以執行緒池平行處理 (hashlib / zlib 處理大區塊時會釋放 GIL)
+"""
+
+import hashlib
+import json
+import time
+import zipfile
+import zlib
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+
+MANIFEST_NAME = "manifest.json"
+_READ_SIZE = 1024 * 1024
+
+
+def verify_member(archive_path: str, name: str, expected: Dict) -> Dict:
+    """
+    驗證單一成員 (每次開啟獨立的 ZipFile，可安全地平行呼叫)
+
+    Args:
+        archive_path: ZIP 檔路徑
+        name: 成員名稱
+        expected: manifest 中的記錄 (size, sha256)
+
+    Returns:
+        {name, status: OK/MISMATCH/CORRUPT/MISSING/UNHASHED, size, sha256, detail}
+    """
+    result = {"name": name, "status": "OK", "size": None, "sha256": None, "detail": None}
+
+    if not expected.get("sha256"):
+        result["status"] = "UNHASHED"
+        result["detail"] = "manifest 未記錄 SHA-256 (舊版備份包)"
+        return result
+
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            try:
+                member = archive.open(name)
+            except KeyError:
+                result["status"] = "MISSING"
+                result["detail"] = "ZIP 中找不到此成員"
+                return result
+
+            digest = hashlib.sha256()
+            size = 0
+            with member:
+                for chunk in iter(lambda: member.read(_READ_SIZE), b""):
+                    digest.update(chunk)
+                    size += len(chunk)
+    except (zipfile.BadZipFile, zlib.error, OSError, EOFError) as e:
+        # 讀到結尾時 zipfile 會比對 CRC，壓縮資料損毀也會在此拋出
+        result["status"] = "CORRUPT"
+        result["detail"] = str(e)
+        return result
+
+    result["size"] = size
+    result["sha256"] = digest.hexdigest()
+
+    if size != expected.get("size", size):
+        result["status"] = "MISMATCH"
+        result["detail"] = f"大小不符: 預期 {expected['size']}，實際 {size}"
+    elif result["sha256"] != expected["sha256"]:
+        result["status"] = "MISMATCH"
+        result["detail"] = "SHA-256 不符"
+    return result
+
+
+def verify_archive(
+    archive_path: str,
+    executor: Optional[Executor] = None,
+    workers: int = 4,
+    members: Optional[List[str]] = None
+) -> Dict:
+    """
+    驗證備份包
+
+    Args:
+        archive_path: ZIP 檔路徑
+        executor: 執行緒池，None 時建立暫時的執行緒池
+        workers: 未提供 executor 時的執行緒數
+        members: 只驗證指定成員，預設全部
+
+    Returns:
+        {valid, verified, members: [...], checked, failed, unverified, unlisted, seconds, bytes_per_sec}
+        verified 為 False 表示有成員未記錄 SHA-256 (或沒有任何成員)，此時 valid 亦為 False
+    """
+    started = time.monotonic()
+
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            names = set(archive.namelist())
+            manifest = json.loads(archive.read(MANIFEST_NAME).decode("utf-8"))
+    except KeyError:
+        return {"valid": False, "error": "備份包缺少 manifest.json", "members": []}
+    except (zipfile.BadZipFile, ValueError, OSError) as e:
+        return {"valid": False, "error": f"無法讀取備份包: {e}", "members": []}
+
+    files = manifest.get("files", {})
+    targets = [name for name in files if members is None or name in members]
+
+    own_executor = executor is None
+    pool = executor or ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="verify")
+    try:
+        futures = [pool.submit(verify_member, archive_path, name, files[name]) for name in targets]
+        results = [future.result() for future in futures]
+    finally:
+        if own_executor:
+            pool.shutdown(wait=True)
+
+    # manifest 未列出的成員 (manifest 本身除外) 可能是被夾帶的檔案
+    unlisted = sorted(names - set(files) - {MANIFEST_NAME})
+    failed = [r for r in results if r["status"] not in ("OK", "UNHASHED")]
+    # 未記錄 SHA-256 的成員無法證明未被竄改 (例如 manifest 被移除雜湊值)，視為未驗證
+    unverified = [r["name"] for r in results if r["status"] == "UNHASHED"]
+    verified = bool(results) and not unverified
+
+    seconds = time.monotonic() - started
+    checked_bytes = sum(r["size"] or 0 for r in results)
+    return {
+        "valid": verified and not failed and not unlisted,
+        "verified": verified,
+        "manifest_version": manifest.get("manifest_version", 1),
+        "backup_time": manifest.get("backup_time"),
+        "station_id": manifest.get("station_id"),
+        "checked": len(results),
+        "failed": len(failed),
+        "unverified": unverified,
+        "unlisted": unlisted,
+        "members": results,
+        "seconds": round(seconds, 3),
+        "bytes_per_sec": round(checked_bytes / seconds, 1) if seconds > 0 else None
+    }
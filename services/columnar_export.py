@@ -0,0 +1,266 @@
+"""
+欄式分析匯出
+將事件類資料表匯出為每欄一個 NumPy .npy 檔 (不使用 pickle)，分析端可直接記憶體映射：
+- 整數欄位: int64，NULL 以 NULL_INT 表示
+- 實數欄位: float64，NULL 以 NaN 表示
+- 日期/時間欄位: int64 epoch 秒 (依字串記載的時間直接換算，不做時區轉換)
+- 文字欄位: int32 字典編碼，字典另存為 JSON，NULL 以 -1 表示
+"""
+
+import json
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+
+# 預設匯出的分析用資料表
+ANALYTICS_TABLES = ('inventory_events', 'blood_events', 'dispense_records', 'surgery_consumptions')
+
+MANIFEST_NAME = "manifest.json"
+TABLE_META_NAME = "_table.json"
+NULL_INT = -(2 ** 63)
+NULL_CODE = -1
+FORMAT_VERSION = 1
+
+_DTYPES = {"int": "<i8", "float": "<f8", "datetime": "<i8", "category": "<i4"}
+_FETCH_BATCH = 5000
+
+
+class ColumnarExportError(RuntimeError):
+    """欄式匯出錯誤"""
+    pass
+
+
+def _require_numpy():
+    if not NUMPY_AVAILABLE:
+        raise ColumnarExportError("欄式匯出需要 numpy (pip install numpy)")
+
+
+def _column_kinds(conn: sqlite3.Connection, table: str) -> List[tuple]:
+    """依宣告型別決定每欄的編碼方式，回傳 [(欄名, kind)]"""
+    kinds = []
+    for row in conn.execute(f'PRAGMA table_info("{table}")'):
+        name, declared = row[1], (row[2] or '').upper()
+        if 'DATE' in declared or 'TIME' in declared:
+            kind = 'datetime'
+        elif 'INT' in declared or 'BOOL' in declared:
+            kind = 'int'
+        elif any(t in declared for t in ('REAL', 'FLOA', 'DOUB', 'NUMERIC', 'DECIMAL')):
+            kind = 'float'
+        else:
+            kind = 'category'
+        kinds.append((name, kind))
+    return kinds
+
+
+def _select_expression(name: str, kind: str) -> str:
+    """在 SQL 端完成型別轉換，Python 端只需處理 NULL"""
+    if kind == 'datetime':
+        return f"CAST(strftime('%s', \"{name}\") AS INTEGER)"
+    if kind == 'int':
+        return f'CAST("{name}" AS INTEGER)'
+    if kind == 'float':
+        return f'CAST("{name}" AS REAL)'
+    return f'"{name}"'
+
+
+def export_table(conn: sqlite3.Connection, table: str, table_dir: Path, batch_size: int = _FETCH_BATCH) -> Dict:
+    """
+    匯出單一資料表
+
+    筆數與資料在同一讀取交易中取得 (一致的快照)，
+    各欄直接寫入記憶體映射的 .npy 檔，記憶體用量只與批次大小及字典大小有關
+
+    Args:
+        conn: 資料庫連線 (不可處於交易中)
+        table: 資料表名稱
+        table_dir: 輸出目錄
+        batch_size: 每批讀取筆數
+
+    Returns:
+        資料表描述 (rows, columns)
+    """
+    table_dir.mkdir(parents=True, exist_ok=True)
+    columns = _column_kinds(conn, table)
+    select_sql = ", ".join(_select_expression(name, kind) for name, kind in columns)
+
+    conn.execute("BEGIN")
+    try:
+        rows_total = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+        arrays = {
+            name: np.lib.format.open_memmap(
+                str(table_dir / f"{name}.npy"), mode='w+', dtype=_DTYPES[kind], shape=(rows_total,)
+            )
+            for name, kind in columns
+        }
+        dictionaries: Dict[str, Dict] = {name: {} for name, kind in columns if kind == 'category'}
+
+        cursor = conn.execute(f'SELECT {select_sql} FROM "{table}" ORDER BY rowid')
+        offset = 0
+        while offset < rows_total:
+            batch = cursor.fetchmany(min(batch_size, rows_total - offset))
+            if not batch:
+                break
+            end = offset + len(batch)
+
+            for index, (name, kind) in enumerate(columns):
+                values = [row[index] for row in batch]
+                if kind == 'category':
+                    lookup = dictionaries[name]
+                    values = [NULL_CODE if v is None else lookup.setdefault(v, len(lookup)) for v in values]
+                elif kind == 'float':
+                    values = [np.nan if v is None else v for v in values]
+                else:
+                    values = [NULL_INT if v is None else v for v in values]
+                arrays[name][offset:end] = values
+
+            offset = end
+    finally:
+        conn.rollback()
+
+    column_meta = []
+    for name, kind in columns:
+        arrays[name].flush()
+        entry = {"name": name, "kind": kind, "dtype": _DTYPES[kind], "file": f"{name}.npy"}
+        if kind == 'category':
+            entry["dictionary"] = f"{name}.dict.json"
+            with open(table_dir / entry["dictionary"], 'w', encoding='utf-8') as f:
+                json.dump(list(dictionaries[name]), f, ensure_ascii=False)
+        column_meta.append(entry)
+    del arrays
+
+    meta = {"table": table, "rows": offset, "columns": column_meta}
+    with open(table_dir / TABLE_META_NAME, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta
+
+
+def export_columnar(
+    db_path: str,
+    dest_dir: str,
+    tables: Optional[List[str]] = None,
+    batch_size: int = _FETCH_BATCH
+) -> Dict:
+    """
+    匯出分析用欄式檔案
+
+    Args:
+        db_path: 資料庫路徑
+        dest_dir: 輸出目錄 (每張表一個子目錄)
+        tables: 要匯出的資料表，預設 ANALYTICS_TABLES (不存在的表略過)
+        batch_size: 每批讀取筆數
+
+    Returns:
+        manifest (format_version, exported_at, null_int, null_code, tables, seconds)
+    """
+    _require_numpy()
+    started = time.monotonic()
+    dest = Path(dest_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, isolation_level=None)
+    try:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        exported = {}
+        for table in tables or ANALYTICS_TABLES:
+            if table in existing:
+                meta = export_table(conn, table, dest / table, batch_size)
+                exported[table] = {"rows": meta["rows"], "columns": len(meta["columns"])}
+    finally:
+        conn.close()
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "exported_at": datetime.now().isoformat(),
+        "null_int": NULL_INT,
+        "null_code": NULL_CODE,
+        "tables": exported,
+        "seconds": round(time.monotonic() - started, 3)
+    }
+    with open(dest / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+# ========== 載入 ==========
+
+class ColumnarTable:
+    """
+    欄式資料表 (延遲載入，各欄以唯讀記憶體映射開啟)
+
+    用法:
+        events = load_columnar("analytics/")["inventory_events"]
+        qty = events["quantity"]            # np.memmap int64
+        codes = events.decode("item_code")  # 還原為字串
+        ts = events.datetimes("timestamp")  # datetime64[s]，NULL 為 NaT
+    """
+
+    def __init__(self, table_dir: str):
+        _require_numpy()
+        self.path = Path(table_dir)
+        with open(self.path / TABLE_META_NAME, 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._columns = {column["name"]: column for column in self.meta["columns"]}
+        self._arrays: Dict[str, "np.ndarray"] = {}
+        self._dictionaries: Dict[str, List] = {}
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    def kind(self, name: str) -> str:
+        return self._columns[name]["kind"]
+
+    def __getitem__(self, name: str) -> "np.ndarray":
+        """原始欄位陣列 (文字欄位為字典編碼)"""
+        if name not in self._arrays:
+            column = self._columns[name]
+            self._arrays[name] = np.load(self.path / column["file"], mmap_mode='r', allow_pickle=False)
+        return self._arrays[name]
+
+    def categories(self, name: str) -> List:
+        """文字欄位的字典 (編碼 i 對應 categories[i])"""
+        if name not in self._dictionaries:
+            with open(self.path / self._columns[name]["dictionary"], 'r', encoding='utf-8') as f:
+                self._dictionaries[name] = json.load(f)
+        return self._dictionaries[name]
+
+    def decode(self, name: str) -> "np.ndarray":
+        """文字欄位還原為 object 陣列，NULL 為 None"""
+        lookup = np.array(self.categories(name) + [None], dtype=object)
+        return lookup[self[name]]
+
+    def datetimes(self, name: str) -> "np.ndarray":
+        """日期欄位轉為 datetime64[s]，NULL 為 NaT"""
+        values = np.asarray(self[name]).view('datetime64[s]').copy()
+        values[np.asarray(self[name]) == NULL_INT] = np.datetime64('NaT')
+        return values
+
+
+def load_columnar(export_dir: str) -> Dict[str, ColumnarTable]:
+    """
+    開啟欄式匯出目錄
+
+    Args:
+        export_dir: export_columnar 的輸出目錄 (或解壓後的 ZIP)
+
+    Returns:
+        {資料表名: ColumnarTable}
+    """
+    root = Path(export_dir)
+    with open(root / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    return {table: ColumnarTable(str(root / table)) for table in manifest["tables"]}
@@ -0,0 +1,224 @@
+"""
+站內事件推播 (Server-Sent Events)
+同一站點的多台平板以一條 SSE 連線接收庫存、血袋、領藥、設備的變更，
+取代各自定時輪詢；訊息只描述「什麼變了」，用戶端再以差異查詢取得最新資料。
+
+- 發布端只在交易提交後呼叫 publish()，可從任何執行緒呼叫
+- 每個訂閱者有固定上限的緩衝區；消費太慢時丟棄最舊的訊息，
+  並在下一則訊息前插入 resync 通知，要求用戶端重新載入 (不拖慢發布端與其他訂閱者)
+- 保留最近的訊息，斷線重連時依 Last-Event-ID 補送
+"""
+
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+TOPICS = ('inventory', 'blood', 'dispense', 'equipment', 'alert')
+
+
+class EventBusFull(RuntimeError):
+    """訂閱者數量已達上限"""
+    pass
+
+
+class Subscription:
+    """單一 SSE 連線的訂閱 (僅在事件迴圈執行緒中存取)"""
+
+    def __init__(self, sub_id: int, stations: Optional[set], topics: Optional[set], buffer_size: int):
+        self.id = sub_id
+        self.stations = stations
+        self.topics = topics
+        self.buffer: deque = deque(maxlen=buffer_size)
+        self.dropped = 0
+        self.delivered = 0
+        self.connected_at = time.time()
+        self._ready = asyncio.Event()
+
+    def matches(self, event: Dict) -> bool:
+        if self.topics and event["topic"] not in self.topics:
+            return False
+        # 未標示站點的訊息 (全域) 送給所有訂閱者
+        if self.stations and event["station_id"] and event["station_id"] not in self.stations:
+            return False
+        return True
+
+    def push(self, event: Dict):
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(event)
+        self._ready.set()
+
+    async def next_event(self, timeout: float) -> Optional[Dict]:
+        """
+        取得下一則訊息，逾時回傳 None (呼叫端送出 keepalive)
+
+        緩衝區曾溢出時先回傳 resync 訊息
+        """
+        if not self.buffer:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self.buffer.clear()
+            return {"id": None, "topic": "resync", "station_id": None, "data": {"dropped": dropped}}
+
+        self.delivered += 1
+        return self.buffer.popleft()
+
+
+class EventBus:
+    """行程內的發布/訂閱"""
+
+    def __init__(self, buffer_size: int = 100, max_subscribers: int = 50, history_size: int = 500):
+        """
+        初始化事件匯流排
+
+        Args:
+            buffer_size: 每個訂閱者的緩衝訊息上限
+            max_subscribers: 同時連線上限，超過時 subscribe() 拋出 EventBusFull
+            history_size: 保留供重連補送的最近訊息數
+        """
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Dict[int, Subscription] = {}
+        self._history: deque = deque(maxlen=history_size)
+        self._ids = itertools.count(1)
+        self._sub_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "rejected": 0}
+
+    def attach_loop(self, loop: asyncio.AbstractEventLoop):
+        """綁定事件迴圈 (於啟動時呼叫)"""
+        self._loop = loop
+
+    def publish(self, topic: str, station_id: Optional[str] = None, **data) -> int:
+        """
+        發布訊息 (交易提交後呼叫)
+
+        Args:
+            topic: 主題 (TOPICS 之一)
+            station_id: 相關站點，None 表示全域
+            data: 訊息內容 (需可 JSON 序列化，保持精簡)
+
+        Returns:
+            訊息 ID
+        """
+        with self._lock:
+            event = {
+                "id": next(self._ids),
+                "topic": topic,
+                "station_id": station_id,
+                "data": data,
+                "ts": time.time()
+            }
+            self._history.append(event)
+            self.stats["published"] += 1
+
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return event["id"]
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(event)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        return event["id"]
+
+    def _dispatch(self, event: Dict):
+        for subscription in list(self._subscribers.values()):
+            if subscription.matches(event):
+                subscription.push(event)
+
+    def subscribe(
+        self,
+        stations: Optional[Iterable[str]] = None,
+        topics: Optional[Iterable[str]] = None,
+        last_event_id: Optional[int] = None
+    ) -> Subscription:
+        """
+        建立訂閱 (於事件迴圈中呼叫)
+
+        Args:
+            stations: 只接收這些站點的訊息，None 表示全部
+            topics: 只接收這些主題，None 表示全部
+            last_event_id: 重連時最後收到的訊息 ID，補送其後的訊息；
+                           已超出保留範圍時改送 resync
+
+        Returns:
+            Subscription
+        """
+        if len(self._subscribers) >= self.max_subscribers:
+            self.stats["rejected"] += 1
+            raise EventBusFull(f"即時推播連線數已達上限 ({self.max_subscribers})")
+
+        subscription = Subscription(
+            next(self._sub_ids),
+            set(stations) if stations else None,
+            set(topics) if topics else None,
+            self.buffer_size
+        )
+
+        if last_event_id is not None:
+            with self._lock:
+                history = list(self._history)
+            if history and history[0]["id"] > last_event_id + 1:
+                subscription.dropped = history[0]["id"] - last_event_id - 1
+            for event in history:
+                if event["id"] > last_event_id and subscription.matches(event):
+                    subscription.push(event)
+
+        self._subscribers[subscription.id] = subscription
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if self._subscribers.pop(subscription.id, None) is not None:
+            self.stats["delivered"] += subscription.delivered
+            self.stats["dropped"] += subscription.dropped
+
+    @staticmethod
+    def format_sse(event: Dict) -> str:
+        """轉為 SSE 文字格式"""
+        payload = {"topic": event["topic"], "station_id": event["station_id"], **event["data"]}
+        lines = []
+        if event["id"] is not None:
+            lines.append(f"id: {event['id']}")
+        lines.append(f"event: {event['topic']}")
+        lines.append("data: " + json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str))
+        return "\n".join(lines) + "\n\n"
+
+    def get_status(self) -> Dict:
+        """訂閱者與訊息統計"""
+        subscribers: List[Dict] = [
+            {
+                "id": s.id,
+                "stations": sorted(s.stations) if s.stations else None,
+                "topics": sorted(s.topics) if s.topics else None,
+                "buffered": len(s.buffer),
+                "delivered": s.delivered,
+                "dropped": s.dropped,
+                "connected_seconds": round(time.time() - s.connected_at, 1)
+            }
+            for s in list(self._subscribers.values())
+        ]
+        return {
+            **self.stats,
+            "subscribers": len(subscribers),
+            "max_subscribers": self.max_subscribers,
+            "buffer_size": self.buffer_size,
+            "clients": subscribers
+        }
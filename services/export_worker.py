@@ -0,0 +1,371 @@
+"""
+匯出工作行程池
+CSV 匯出、備份包、QR Code、同步封包等耗 CPU 的工作移到子行程執行，
+主行程 (uvicorn) 的事件迴圈與 GIL 留給領藥、庫存等即時操作。
+
+- 同時執行數上限 = 子行程數，超過時排隊；排隊數超過上限直接拒絕
+- 子行程只在啟動時 (start()) 以 fork 建立一次並調低排程優先權 (nice)，繼承主行程已載入的模組與設定；
+  之後不再從請求執行緒 fork (多執行緒行程 fork 後鎖與 SQLite 連線狀態不可靠)，
+  行程池異常終止後改在執行緒中執行，重新啟動服務後恢復
+- 不支援 fork 的平台 (Windows)、子行程數設為 0 或尚未 start() 時，在執行緒中執行 (同樣計數)
+- 串流工作 (stream()) 由子行程寫入暫存 spool 檔、主行程邊產生邊讀取送出；
+  子行程產生完即釋放，不會因客戶端下載緩慢而長時間佔用
+- 子行程可經由通道 (Manager 佇列) 將進度送回主行程 (progress)
+- 子行程寫入的資料表回報主行程，遞增主行程的讀取快取版本
+"""
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class ExportJobError(RuntimeError):
+    """匯出工作失敗 (子行程中的例外轉為此型別傳回)"""
+
+    def __init__(self, detail: str, status_code: int = 500):
+        super().__init__(detail, status_code)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class ExportQueueFull(RuntimeError):
+    """排隊中的工作已達上限"""
+    pass
+
+
+# 子行程中的資料表版本 (fork 繼承的副本，用來找出工作寫入的資料表)
+_worker_versions = None
+
+# 串流每寫入此大小通知主行程一次 (減少跨行程往返)，亦為主行程每次讀取的大小
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def _init_worker(nice: int, initializer: Optional[Callable], versions):
+    """子行程初始化：降低優先權，再執行呼叫端的初始化"""
+    global _worker_versions
+    _worker_versions = versions
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+    if initializer:
+        initializer()
+
+
+def _invoke(fn: Callable, args: tuple, kwargs: dict) -> tuple:
+    """
+    在子行程中執行工作
+
+    例外不一定能 pickle (例如 HTTPException)，統一轉為 (False, status_code, 訊息) 傳回；
+    最後一項為工作期間寫入的資料表 (僅子行程中記錄)
+    """
+    before = _worker_versions.get_status() if _worker_versions is not None else None
+    try:
+        outcome = (True, fn(*args, **kwargs))
+    except Exception as e:
+        outcome = (False, getattr(e, "status_code", 500), str(getattr(e, "detail", None) or e))
+
+    written: List[str] = []
+    if before is not None:
+        after = _worker_versions.get_status()
+        written = [table for table, version in after.items() if before.get(table) != version]
+    return outcome + (written,)
+
+
+def _spool(fn: Callable, path: str, notify, cancel, args: tuple, kwargs: dict) -> int:
+    """
+    將 fn 產生的位元組寫入 spool 檔 (於子行程中執行)
+
+    每寫入 STREAM_CHUNK_BYTES 即 flush 並將目前大小送入通知佇列；接收端取消時停止
+
+    Returns:
+        寫入的總位元組數
+    """
+    written = notified = 0
+    with open(path, "wb") as f:
+        for chunk in fn(*args, **kwargs):
+            f.write(chunk)
+            written += len(chunk)
+            if written - notified >= STREAM_CHUNK_BYTES:
+                f.flush()
+                notify.put(written)
+                notified = written
+                if cancel.is_set():
+                    break
+    return written
+
+
+class _ChannelSender:
+    """可 pickle 的回呼：將進度送入通道"""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def __call__(self, item):
+        self.channel.put(item)
+
+
+def _noop():
+    return os.getpid()
+
+
+class ExportWorkerPool:
+    """匯出工作行程池"""
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_queue: int = 16,
+        nice: int = 10,
+        initializer: Optional[Callable] = None,
+        versions=None,
+        spool_dir: Optional[str] = None
+    ):
+        """
+        初始化行程池 (子行程於 start() 建立)
+
+        Args:
+            max_workers: 子行程數 (同時執行的工作上限)，0 表示在執行緒中執行
+            max_queue: 排隊工作上限，超過時 run() 拋出 ExportQueueFull
+            nice: 子行程 nice 值增量
+            initializer: 子行程啟動時呼叫 (需為可 pickle 的模組層函數)
+            versions: 主行程的資料表版本 (TableVersions)，子行程寫入的資料表於工作完成後遞增
+            spool_dir: 串流工作暫存檔目錄，預設系統暫存目錄
+        """
+        self.use_processes = max_workers > 0 and "fork" in multiprocessing.get_all_start_methods()
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max_queue
+        self.nice = nice
+        self.initializer = initializer
+        self.versions = versions
+        self.spool_dir = spool_dir
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self.degraded = False
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.stats = {"completed": 0, "failed": 0, "rejected": 0, "restarts": 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._jobs: Dict[str, int] = {}
+
+    def start(self):
+        """建立子行程與通道管理行程 (於啟動時呼叫一次，趁主行程執行緒尚少時 fork)"""
+        if self.use_processes and self._executor is None and not self.degraded:
+            context = multiprocessing.get_context("fork")
+            self._manager = context.Manager()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.nice, self.initializer, self.versions)
+            )
+            # fork 模式下第一次提交即建立全部子行程
+            self._executor.submit(_noop).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def channel(self, maxsize: int = 0):
+        """子行程可寫入、主行程可讀取的佇列 (執行緒模式為一般佇列)"""
+        if self._manager is not None:
+            return self._manager.Queue(maxsize)
+        return queue.Queue(maxsize)
+
+    def _event(self):
+        if self._manager is not None:
+            return self._manager.Event()
+        return threading.Event()
+
+    def call(
+        self,
+        fn: Callable,
+        *args,
+        job: str = "",
+        progress: Optional[Callable[[Any], None]] = None,
+        **kwargs
+    ) -> Any:
+        """
+        同步執行工作 (阻塞呼叫端執行緒直到完成)
+
+        Args:
+            fn: 模組層函數 (需可 pickle)
+            job: 工作名稱 (統計用)
+            progress: 在主行程接收進度的回呼；指定時 fn 以 progress 關鍵字參數取得傳送進度的函數
+
+        Returns:
+            fn 的回傳值
+        """
+        if progress is None:
+            return self._call(fn, args, kwargs, job)
+
+        channel = self.channel()
+
+        def relay():
+            while True:
+                item = channel.get()
+                if isinstance(item, str) and item == "__done__":
+                    return
+                try:
+                    progress(item)
+                except Exception:
+                    pass
+
+        relay_thread = threading.Thread(target=relay, name="export-progress", daemon=True)
+        relay_thread.start()
+        try:
+            return self._call(fn, args, {**kwargs, "progress": _ChannelSender(channel)}, job)
+        finally:
+            channel.put("__done__")
+            relay_thread.join()
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict, job: str) -> Any:
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise ExportQueueFull(f"匯出工作排隊已達上限 ({self.max_queue})，請稍後再試")
+            self.queued += 1
+        enqueued = time.monotonic()
+
+        self._slots.acquire()
+        started = time.monotonic()
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._wait_total += started - enqueued
+            if job:
+                self._jobs[job] = self._jobs.get(job, 0) + 1
+
+        ok = False
+        try:
+            if self._executor is not None:
+                result = self._submit(fn, args, kwargs)
+                if result[-1] and self.versions is not None:
+                    self.versions.bump(result[-1])
+            else:
+                result = _invoke(fn, args, kwargs)
+
+            if not result[0]:
+                raise ExportJobError(result[2], result[1])
+            ok = True
+            return result[1]
+        finally:
+            with self._lock:
+                self.running -= 1
+                self._run_total += time.monotonic() - started
+                self.stats["completed" if ok else "failed"] += 1
+            self._slots.release()
+
+    def _submit(self, fn: Callable, args: tuple, kwargs: dict) -> tuple:
+        executor = self._executor
+        try:
+            return executor.submit(_invoke, fn, args, kwargs).result()
+        except BrokenProcessPool:
+            # 子行程被系統終止 (例如記憶體不足)：不在請求執行緒中重新 fork，
+            # 之後的工作改在執行緒中執行 (通道管理行程仍可使用)
+            with self._lock:
+                if self._executor is executor:
+                    self.stats["restarts"] += 1
+                    self.degraded = True
+                    self._executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+            raise ExportJobError("匯出子行程異常終止，請重試", 503)
+
+    def stream(self, fn: Callable, *args, job: str = "", **kwargs) -> Iterator[bytes]:
+        """
+        執行產生位元組的工作並逐段取回 (同步產生器，於執行緒中迭代)
+
+        子行程將內容寫入 spool 檔並通知目前大小，主行程讀取已寫入的部分送出；
+        子行程不等待接收端，產生完即釋放 (客戶端下載緩慢不會佔用子行程)，
+        記憶體用量固定，spool 檔於產生器結束時刪除。
+        產生器關閉 (例如客戶端中斷) 時通知子行程停止
+
+        Args:
+            fn: 回傳位元組迭代器的模組層函數
+            job: 工作名稱 (統計用)
+
+        Raises:
+            ExportQueueFull / ExportJobError: 於取得第一段之前或串流中途
+        """
+        fd, path = tempfile.mkstemp(prefix=f"export_{job.replace(':', '_')}_", suffix=".spool", dir=self.spool_dir)
+        os.close(fd)
+        notify = self.channel()
+        cancel = self._event()
+        failure: List[BaseException] = []
+
+        def run():
+            try:
+                self._call(_spool, (fn, path, notify, cancel, args, kwargs), {}, job)
+            except BaseException as e:
+                failure.append(e)
+            finally:
+                notify.put(None)
+
+        worker = threading.Thread(target=run, name=f"export-stream-{job}", daemon=True)
+        worker.start()
+        try:
+            with open(path, "rb") as reader:
+                available, done = 0, False
+                while not done:
+                    item = notify.get()
+                    if item is None:
+                        done = True
+                    else:
+                        available = max(available, item)
+
+                    while done or reader.tell() < available:
+                        chunk = reader.read(STREAM_CHUNK_BYTES if done else min(STREAM_CHUNK_BYTES, available - reader.tell()))
+                        if not chunk:
+                            break
+                        yield chunk
+
+            worker.join()
+            if failure:
+                raise failure[0]
+        finally:
+            if worker.is_alive():
+                cancel.set()
+                worker.join()
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    async def run(self, fn: Callable, *args, job: str = "", **kwargs) -> Any:
+        """非同步執行工作 (等待期間不佔用事件迴圈)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self.call(fn, *args, job=job, **kwargs))
+
+    def get_status(self) -> Dict:
+        """行程池狀態與排隊指標"""
+        with self._lock:
+            finished = self.stats["completed"] + self.stats["failed"]
+            return {
+                "mode": "process" if self._executor is not None else "thread",
+                "degraded": self.degraded,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self.running,
+                "queue_depth": self.queued,
+                **self.stats,
+                "avg_wait_seconds": round(self._wait_total / finished, 3) if finished else 0.0,
+                "avg_run_seconds": round(self._run_total / finished, 3) if finished else 0.0,
+                "jobs": dict(self._jobs)
+            }
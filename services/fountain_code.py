@@ -0,0 +1,352 @@
+"""
+噴泉碼 (LT Code) 編碼/解碼
+用於離線 QR Code 同步通道：將同步封包切成區塊，產生無上限數量的編碼幀，
+接收端以任意順序收到足夠數量的幀 (允許遺漏) 即可還原封包
+"""
+
+import base64
+import math
+import struct
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+
+# 幀標頭: magic(2) 版本(1) 傳輸ID(4) 原始長度(4) 區塊大小(2) 校驗(4) 種子(4)
+FRAME_MAGIC = b"MF"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct(">2sBIIHII")
+
+# Peeling 解碼平均需要的額外幀比例 (區塊數數十至數百時約 25~30%，以 scripts/benchmark_fountain_code.py 實測)
+DEFAULT_DECODE_OVERHEAD = 0.3
+
+# 區塊大小範圍 (編碼端與解碼端一致)
+MIN_BLOCK_SIZE = 16
+MAX_BLOCK_SIZE = 2048
+
+# 解碼端預設接受的原始資料上限；幀標頭的長度由傳送端決定，需先檢查才能配置解碼狀態
+DEFAULT_MAX_DATA_LENGTH = 4 * 1024 * 1024
+
+
+class FountainError(ValueError):
+    """噴泉碼幀格式錯誤"""
+    pass
+
+
+class _Prng:
+    """
+    確定性亂數產生器 (xorshift32)
+
+    不使用 random 模組，確保不同 Python 版本的編碼端與解碼端產生相同序列
+    """
+
+    def __init__(self, seed: int):
+        # murmur3 fmix32：打散相鄰種子，避免連號種子產生相近的序列
+        x = seed & 0xFFFFFFFF
+        x ^= x >> 16
+        x = (x * 0x85EBCA6B) & 0xFFFFFFFF
+        x ^= x >> 13
+        x = (x * 0xC2B2AE35) & 0xFFFFFFFF
+        x ^= x >> 16
+        self.state = x or 0x9E3779B9
+
+    def next_u32(self) -> int:
+        x = self.state
+        x ^= (x << 13) & 0xFFFFFFFF
+        x ^= x >> 17
+        x ^= (x << 5) & 0xFFFFFFFF
+        self.state = x
+        return x
+
+    def next_float(self) -> float:
+        return self.next_u32() / 4294967296.0
+
+
+def _robust_soliton_cdf(k: int, c: float = 0.03, delta: float = 0.5) -> List[float]:
+    """
+    計算 Robust Soliton 分佈的累積機率
+
+    Args:
+        k: 原始區塊數
+        c: 分佈參數
+        delta: 解碼失敗機率上限
+
+    Returns:
+        長度為 k 的累積機率 (index i 對應度數 i+1)
+    """
+    if k == 1:
+        return [1.0]
+
+    rho = [1.0 / k] + [1.0 / (d * (d - 1)) for d in range(2, k + 1)]
+
+    s = c * math.log(k / delta) * math.sqrt(k)
+    pivot = max(1, min(k, int(round(k / s)))) if s > 0 else k
+    tau = [0.0] * k
+    for d in range(1, pivot):
+        tau[d - 1] = s / (k * d)
+    tau[pivot - 1] = s * math.log(s / delta) / k if s > delta else 0.0
+
+    weights = [r + t for r, t in zip(rho, tau)]
+    total = sum(weights)
+
+    cdf = []
+    acc = 0.0
+    for w in weights:
+        acc += w / total
+        cdf.append(acc)
+    cdf[-1] = 1.0
+    return cdf
+
+
+def _block_indices(seed: int, k: int, cdf: List[float]) -> List[int]:
+    """由種子決定此幀包含的區塊索引 (編碼端與解碼端共用)"""
+    prng = _Prng(seed)
+
+    u = prng.next_float()
+    degree = 1
+    for i, p in enumerate(cdf):
+        if u <= p:
+            degree = i + 1
+            break
+
+    indices: Set[int] = set()
+    while len(indices) < degree:
+        indices.add(prng.next_u32() % k)
+    return sorted(indices)
+
+
+def _xor_into(target: bytearray, source: bytes):
+    """target ^= source (以整數運算一次完成)"""
+    n = len(target)
+    value = int.from_bytes(target, 'big') ^ int.from_bytes(source, 'big')
+    target[:] = value.to_bytes(n, 'big')
+
+
+class FountainEncoder:
+    """噴泉碼編碼器"""
+
+    def __init__(self, data: bytes, block_size: int = 400, transfer_id: int = 0):
+        """
+        初始化編碼器
+
+        Args:
+            data: 要傳送的原始資料
+            block_size: 每個區塊大小 (bytes)，決定單一 QR 幀的承載量
+            transfer_id: 傳輸ID，接收端用來區分不同封包的幀
+        """
+        if not data:
+            raise FountainError("資料不可為空")
+        if not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            raise FountainError(f"區塊大小必須介於 {MIN_BLOCK_SIZE} 與 {MAX_BLOCK_SIZE} bytes")
+
+        self.data = data
+        self.block_size = block_size
+        self.transfer_id = transfer_id & 0xFFFFFFFF
+        self.checksum = zlib.crc32(data) & 0xFFFFFFFF
+
+        padded = data + b"\x00" * (-len(data) % block_size)
+        self.blocks = [padded[i:i + block_size] for i in range(0, len(padded), block_size)]
+        self.k = len(self.blocks)
+        self._cdf = _robust_soliton_cdf(self.k)
+
+    def frame(self, seed: int) -> bytes:
+        """產生指定種子的編碼幀 (二進位)"""
+        seed &= 0xFFFFFFFF
+        payload = bytearray(self.block_size)
+        for index in _block_indices(seed, self.k, self._cdf):
+            _xor_into(payload, self.blocks[index])
+
+        header = FRAME_HEADER.pack(
+            FRAME_MAGIC, FRAME_VERSION, self.transfer_id,
+            len(self.data), self.block_size, self.checksum, seed
+        )
+        return header + bytes(payload)
+
+    def frames(self, count: int, start_seed: int = 1) -> List[str]:
+        """
+        產生一串可放入 QR Code 的文字幀
+
+        Args:
+            count: 幀數量 (建議為區塊數的 1.5~2 倍以容忍漏掃)
+            start_seed: 起始種子
+
+        Returns:
+            Base64 編碼的幀清單
+        """
+        return [
+            base64.b64encode(self.frame(start_seed + i)).decode('ascii')
+            for i in range(count)
+        ]
+
+
+def parse_frame(frame: str) -> Tuple[int, int, int, int, int, bytes]:
+    """
+    解析文字幀
+
+    Returns:
+        (transfer_id, data_length, block_size, checksum, seed, payload)
+
+    Raises:
+        FountainError: 幀格式錯誤
+    """
+    try:
+        raw = base64.b64decode(frame.strip(), validate=True)
+    except (ValueError, TypeError) as e:
+        raise FountainError(f"幀不是有效的 Base64: {e}")
+
+    if len(raw) < FRAME_HEADER.size:
+        raise FountainError("幀長度不足")
+
+    magic, version, transfer_id, data_length, block_size, checksum, seed = FRAME_HEADER.unpack_from(raw)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise FountainError("不支援的幀格式")
+
+    payload = raw[FRAME_HEADER.size:]
+    if len(payload) != block_size:
+        raise FountainError("幀內容長度與區塊大小不符")
+
+    return transfer_id, data_length, block_size, checksum, seed, payload
+
+
+class FountainDecoder:
+    """噴泉碼解碼器 (Peeling / Belief Propagation)"""
+
+    def __init__(
+        self,
+        max_data_length: int = DEFAULT_MAX_DATA_LENGTH,
+        min_block_size: int = MIN_BLOCK_SIZE,
+        max_block_size: int = MAX_BLOCK_SIZE,
+        max_pending_ratio: float = 4.0
+    ):
+        """
+        初始化解碼器
+
+        Args:
+            max_data_length: 可接受的原始資料長度上限 (超過者拒絕，避免依幀標頭配置過大的解碼狀態)
+            min_block_size: 可接受的最小區塊大小
+            max_block_size: 可接受的最大區塊大小
+            max_pending_ratio: 暫存未解幀數相對區塊數的上限倍率 (另加 64 幀)
+        """
+        self.max_data_length = max_data_length
+        self.min_block_size = max(MIN_BLOCK_SIZE, min_block_size)
+        self.max_block_size = min(MAX_BLOCK_SIZE, max_block_size)
+        self.max_pending_ratio = max_pending_ratio
+        self.transfer_id: Optional[int] = None
+        self.data_length = 0
+        self.block_size = 0
+        self.checksum = 0
+        self.k = 0
+        self._cdf: List[float] = []
+        self._solved: Dict[int, bytes] = {}
+        self._pending: List[Tuple[Set[int], bytearray]] = []
+        self._seen_seeds: Set[int] = set()
+        self.frames_received = 0
+        self.frames_rejected = 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.k > 0 and len(self._solved) == self.k
+
+    @property
+    def progress(self) -> float:
+        return len(self._solved) / self.k if self.k else 0.0
+
+    def add_frame(self, frame: str) -> bool:
+        """
+        加入一個幀
+
+        Args:
+            frame: 文字幀
+
+        Returns:
+            加入後是否已可還原完整資料
+
+        Raises:
+            FountainError: 幀格式錯誤、超出上限或屬於其他傳輸
+        """
+        transfer_id, data_length, block_size, checksum, seed, payload = parse_frame(frame)
+
+        if self.transfer_id is None:
+            if not self.min_block_size <= block_size <= self.max_block_size:
+                raise FountainError(f"區塊大小必須介於 {self.min_block_size} 與 {self.max_block_size} bytes")
+            if not 0 < data_length <= self.max_data_length:
+                raise FountainError(f"資料長度超出上限 ({self.max_data_length} bytes)")
+            self.transfer_id = transfer_id
+            self.data_length = data_length
+            self.block_size = block_size
+            self.checksum = checksum
+            self.k = max(1, math.ceil(data_length / block_size))
+            self._cdf = _robust_soliton_cdf(self.k)
+        elif (transfer_id, data_length, block_size, checksum) != (
+                self.transfer_id, self.data_length, self.block_size, self.checksum):
+            self.frames_rejected += 1
+            raise FountainError("幀屬於不同的傳輸")
+
+        if seed in self._seen_seeds or self.is_complete:
+            return self.is_complete
+        if len(self._pending) >= self.k * self.max_pending_ratio + 64:
+            self.frames_rejected += 1
+            raise FountainError("未解幀數超出上限，請重新開始傳輸")
+        self._seen_seeds.add(seed)
+        self.frames_received += 1
+
+        indices = set(_block_indices(seed, self.k, self._cdf))
+        value = bytearray(payload)
+        for index in list(indices):
+            if index in self._solved:
+                _xor_into(value, self._solved[index])
+                indices.discard(index)
+
+        if indices:
+            self._pending.append((indices, value))
+            self._peel()
+        return self.is_complete
+
+    def _peel(self):
+        """反覆找出只剩一個未知區塊的幀並解出該區塊"""
+        progress = True
+        while progress:
+            progress = False
+            remaining = []
+            for indices, value in self._pending:
+                for index in list(indices):
+                    if index in self._solved:
+                        _xor_into(value, self._solved[index])
+                        indices.discard(index)
+                if len(indices) == 1:
+                    index = indices.pop()
+                    if index not in self._solved:
+                        self._solved[index] = bytes(value)
+                        progress = True
+                elif indices:
+                    remaining.append((indices, value))
+            self._pending = remaining
+
+    def result(self) -> bytes:
+        """
+        取得還原後的資料
+
+        Raises:
+            FountainError: 尚未收齊或校驗失敗
+        """
+        if not self.is_complete:
+            raise FountainError(f"尚未收齊: {len(self._solved)}/{self.k} 區塊")
+
+        data = b"".join(self._solved[i] for i in range(self.k))[:self.data_length]
+        if zlib.crc32(data) & 0xFFFFFFFF != self.checksum:
+            raise FountainError("資料校驗失敗")
+        return data
+
+
+def estimate_throughput(block_size: int, fps: float, overhead: float = DEFAULT_DECODE_OVERHEAD) -> float:
+    """
+    估算 QR 幀傳輸的有效吞吐量
+
+    Args:
+        block_size: 每幀承載的區塊大小 (bytes)
+        fps: 每秒顯示幀數
+        overhead: 噴泉碼解碼所需的額外幀比例
+
+    Returns:
+        有效吞吐量 (bytes/second)
+    """
+    return block_size * fps / (1.0 + overhead)
@@ -0,0 +1,322 @@
+"""
+冪等鍵 (Idempotency-Key)
+寫入請求帶 Idempotency-Key 標頭時，第一次執行的回應存入 idempotency_keys 表；
+同一鍵重送時直接回傳原回應 (標頭 Idempotent-Replayed: true)，不再執行寫入，
+用戶端因此可以短逾時、積極重試而不會重複扣庫存。
+
+- 同一鍵用於不同的請求內容 (方法、路徑、參數或本文不同) 回傳 422；
+  JSON 本文依正規化後的內容比對 (鍵順序、空白不影響)，/api/batch 中的單一操作可用同一鍵比對
+- 同一鍵的請求仍在執行中時，重送者等待其完成後取得相同回應
+- 執行中標記超過 lock_timeout 仍未完成 (執行中斷電、行程中斷或執行過久) 時，
+  寫入可能已提交也可能未提交，不重新執行，回傳 409「執行結果不明」待人工確認
+- 5xx 回應不保存 (釋放鍵，允許重試)；回應本文以 zlib 壓縮保存，超過上限者不保存
+- 超過保存期限的鍵由 prune() 清除
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+
+MAX_KEY_LENGTH = 200
+
+# reserve() 結果
+NEW = 'new'
+REPLAY = 'replay'
+IN_PROGRESS = 'in_progress'
+MISMATCH = 'mismatch'
+UNKNOWN = 'unknown'
+
+
+def request_fingerprint(method: str, path: str, query: bytes, body: bytes) -> str:
+    """
+    請求內容的指紋
+
+    JSON 本文先正規化 (排序鍵、去除空白)，同一份資料由不同用戶端或經批次端點重送時指紋相同
+    """
+    try:
+        body = json.dumps(
+            json.loads(body), sort_keys=True, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+    except ValueError:
+        pass
+    return hashlib.sha256(b"\0".join([method.encode(), path.encode(), query, body])).hexdigest()
+
+
+class IdempotencyStore:
+    """idempotency_keys 表的存取"""
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], ttl_seconds: float, lock_timeout: float = 120):
+        """
+        Args:
+            connect: 取得資料庫連線 (呼叫端負責建立 idempotency_keys 表)
+            ttl_seconds: 鍵的保存期限
+            lock_timeout: 執行中標記超過此時間視為執行結果不明 (不會重新執行)
+        """
+        self.connect = connect
+        self.ttl_seconds = ttl_seconds
+        self.lock_timeout = lock_timeout
+
+    def reserve(self, key: str, fingerprint: str) -> Tuple[str, Optional[Dict]]:
+        """
+        保留鍵
+
+        Returns:
+            (NEW, None): 首次請求，呼叫端執行後呼叫 complete() 或 release()
+            (REPLAY, 記錄): 已完成，回傳保存的回應
+            (IN_PROGRESS, None): 同一鍵的請求仍在執行
+            (UNKNOWN, None): 執行中標記已逾時，寫入是否已提交不明，不可重新執行
+            (MISMATCH, None): 鍵已用於不同的請求
+        """
+        now = time.time()
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT OR IGNORE INTO idempotency_keys (idempotency_key, fingerprint, status, created_at)
+                VALUES (?, ?, 'IN_PROGRESS', ?)
+            """, (key, fingerprint, now))
+            if cursor.rowcount == 1:
+                conn.commit()
+                return NEW, None
+
+            cursor.execute("SELECT * FROM idempotency_keys WHERE idempotency_key = ?", (key,))
+            row = cursor.fetchone()
+            expired = row['created_at'] < now - self.ttl_seconds
+
+            if expired:
+                cursor.execute("""
+                    UPDATE idempotency_keys
+                    SET fingerprint = ?, status = 'IN_PROGRESS', status_code = NULL,
+                        content_type = NULL, body = NULL, created_at = ?
+                    WHERE idempotency_key = ?
+                """, (fingerprint, now, key))
+                conn.commit()
+                return NEW, None
+
+            if row['fingerprint'] != fingerprint:
+                return MISMATCH, None
+            if row['status'] == 'IN_PROGRESS':
+                # 完成記錄與寫入不在同一交易：逾時的標記可能是寫入已提交但尚未記錄回應
+                if row['created_at'] < now - self.lock_timeout:
+                    return UNKNOWN, None
+                return IN_PROGRESS, None
+            return REPLAY, {
+                "status_code": row['status_code'],
+                "content_type": row['content_type'],
+                "body": zlib.decompress(row['body']) if row['body'] is not None else b""
+            }
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, key: str, status_code: int, content_type: Optional[str], body: bytes, cursor=None):
+        """
+        保存回應
+
+        Args:
+            cursor: 寫入所用交易的 cursor；提供時於該交易中保存 (由呼叫端提交)，與寫入同時生效
+        """
+        sql = """
+            UPDATE idempotency_keys
+            SET status = 'COMPLETED', status_code = ?, content_type = ?, body = ?
+            WHERE idempotency_key = ?
+        """
+        params = (status_code, content_type, zlib.compress(body), key)
+        if cursor is not None:
+            cursor.execute(sql, params)
+            return
+
+        conn = self.connect()
+        try:
+            conn.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release(self, key: str):
+        """釋放執行中的鍵 (執行失敗，允許以同一鍵重試)"""
+        conn = self.connect()
+        try:
+            conn.execute(
+                "DELETE FROM idempotency_keys WHERE idempotency_key = ? AND status = 'IN_PROGRESS'",
+                (key,)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def prune(self) -> int:
+        """刪除超過保存期限的鍵，回傳刪除筆數"""
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM idempotency_keys WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,)
+            )
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+
+class IdempotencyMiddleware:
+    """ASGI 中介層：處理帶 Idempotency-Key 標頭的寫入請求"""
+
+    def __init__(
+        self,
+        app,
+        store: IdempotencyStore,
+        methods: Tuple[str, ...] = ('POST', 'PUT', 'PATCH', 'DELETE'),
+        path_prefix: str = '/api/',
+        max_body_bytes: int = 256 * 1024,
+        wait_seconds: float = 30
+    ):
+        """
+        Args:
+            store: 鍵的存取
+            methods: 適用的 HTTP 方法
+            path_prefix: 適用的路徑前綴
+            max_body_bytes: 可保存的回應本文上限 (未壓縮)
+            wait_seconds: 重送者等待同一鍵執行中請求的上限
+        """
+        self.app = app
+        self.store = store
+        self.methods = methods
+        self.path_prefix = path_prefix
+        self.max_body_bytes = max_body_bytes
+        self.wait_seconds = wait_seconds
+        self._inflight: Dict[str, asyncio.Event] = {}
+        self.stats = {"stored": 0, "replayed": 0, "conflicts": 0, "mismatches": 0, "unknown": 0}
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in self.methods
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        for name, value in scope["headers"]:
+            if name == b"idempotency-key":
+                key = value.decode("latin-1").strip()
+                break
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        if not key or len(key) > MAX_KEY_LENGTH:
+            await self._send_json(send, 400, f"Idempotency-Key 長度需為 1-{MAX_KEY_LENGTH} 字元")
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = request_fingerprint(scope["method"], scope["path"], scope.get("query_string", b""), body)
+
+        state, record = self.store.reserve(key, fingerprint)
+        if state == IN_PROGRESS:
+            event = self._inflight.get(key)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), self.wait_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                state, record = self.store.reserve(key, fingerprint)
+
+        if state == MISMATCH:
+            self.stats["mismatches"] += 1
+            await self._send_json(send, 422, "此 Idempotency-Key 已用於不同的請求")
+            return
+        if state == UNKNOWN:
+            self.stats["unknown"] += 1
+            await self._send_json(
+                send, 409, "此 Idempotency-Key 的請求執行中斷，結果不明 (寫入可能已生效)；請人工確認後再以新的鍵送出"
+            )
+            return
+        if state == IN_PROGRESS:
+            self.stats["conflicts"] += 1
+            await self._send_json(send, 409, "相同 Idempotency-Key 的請求仍在處理中，請稍後重試", retry_after=1)
+            return
+        if state == REPLAY:
+            self.stats["replayed"] += 1
+            await self._replay(send, record)
+            return
+
+        await self._execute(scope, body, receive, send, key)
+
+    async def _execute(self, scope, body: bytes, receive, send, key: str):
+        """首次執行：轉交應用程式並擷取回應"""
+        event = self._inflight[key] = asyncio.Event()
+        response = {"status": None, "content_type": None, "chunks": [], "size": 0}
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                for name, value in message.get("headers", []):
+                    if name.lower() == b"content-type":
+                        response["content_type"] = value.decode("latin-1")
+            elif message["type"] == "http.response.body" and response["size"] <= self.max_body_bytes:
+                chunk = message.get("body", b"")
+                response["chunks"].append(chunk)
+                response["size"] += len(chunk)
+            await send(message)
+
+        stored = False
+        try:
+            await self.app(scope, replay_receive, capture_send)
+            status = response["status"]
+            if status is not None and status < 500 and response["size"] <= self.max_body_bytes:
+                self.store.complete(key, status, response["content_type"], b"".join(response["chunks"]))
+                self.stats["stored"] += 1
+                stored = True
+        finally:
+            if not stored:
+                self.store.release(key)
+            self._inflight.pop(key, None)
+            event.set()
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                break
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _replay(send, record: Dict):
+        headers = [
+            (b"content-length", str(len(record["body"])).encode("ascii")),
+            (b"idempotent-replayed", b"true")
+        ]
+        if record["content_type"]:
+            headers.append((b"content-type", record["content_type"].encode("latin-1")))
+        await send({"type": "http.response.start", "status": record["status_code"], "headers": headers})
+        await send({"type": "http.response.body", "body": record["body"]})
+
+    @staticmethod
+    async def _send_json(send, status_code: int, detail: str, retry_after: Optional[int] = None):
+        body = json.dumps({"detail": detail}, ensure_ascii=False).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("ascii"))]
+        if retry_after is not None:
+            headers.append((b"retry-after", str(retry_after).encode("ascii")))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,186 @@
+"""
+版本化讀取快取
+每張資料表維護一個記憶體中的版本號，寫入提交時遞增；
+快取項目記錄建立時所依賴資料表的版本，版本未變即可重用，不需逐一失效。
+
+寫入追蹤集中在連線層：TrackingConnection 以 SQLite authorizer 記錄連線寫過的資料表
+(含觸發器間接寫入)，commit 時遞增這些表的版本，個別寫入路徑不需另外標記。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+
+_WRITE_ACTIONS = {
+    sqlite3.SQLITE_INSERT: "INSERT",
+    sqlite3.SQLITE_UPDATE: "UPDATE",
+    sqlite3.SQLITE_DELETE: "DELETE",
+}
+
+
+class TableVersions:
+    """
+    各資料表的資料版本 (僅存在於本行程)
+
+    版本號在重新啟動後歸零，epoch 用來區分不同次啟動的版本 (例如 ETag)
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.epoch = f"{int(time.time()):x}{os.getpid():x}"
+
+    def bump(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[int, ...]:
+        """依給定順序取得各表版本"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def get_status(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._versions.items()))
+
+
+class TrackingConnection(sqlite3.Connection):
+    """
+    記錄寫入資料表的連線
+
+    已編譯的語句會被連線快取重用且不再經過 authorizer，
+    因此寫過的表在連線存續期間累積保留，每次 commit 都遞增 (寧可多失效)
+    """
+
+    def track(self, versions: TableVersions) -> "TrackingConnection":
+        self._versions = versions
+        self._written = set()
+        self.set_authorizer(self._authorize)
+        return self
+
+    def _authorize(self, action, arg1, arg2, db_name, source):
+        if action in _WRITE_ACTIONS and arg1 and not arg1.startswith("sqlite_"):
+            self._written.add(arg1)
+        return sqlite3.SQLITE_OK
+
+    def commit(self):
+        super().commit()
+        if getattr(self, "_written", None):
+            self._versions.bump(self._written)
+
+
+class ReadCache:
+    """
+    以 (端點, 參數) 為鍵的回應快取
+
+    值以序列化後的 JSON 位元組保存 (大小可精確計算、取用時不需再序列化)，
+    超過記憶體上限時依 LRU 淘汰
+    """
+
+    def __init__(self, versions: TableVersions, max_bytes: int = 8 * 1024 * 1024):
+        """
+        初始化快取
+
+        Args:
+            versions: 資料表版本
+            max_bytes: 快取內容總大小上限
+        """
+        self.versions = versions
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "not_modified": 0}
+
+    def etag(self, endpoint: str, params: Tuple, tables: Tuple[str, ...], tags: Optional[Tuple] = None) -> str:
+        """
+        由啟動 epoch 與資料表版本產生強 ETag (不需查詢資料庫)
+
+        Args:
+            tags: 資料表版本，預設取目前版本
+        """
+        if tags is None:
+            tags = self.versions.snapshot(tables)
+        scope = hashlib.sha1(repr((endpoint, params, tables)).encode("utf-8")).hexdigest()[:8]
+        return f'"{self.versions.epoch}-{scope}-{".".join(map(str, tags))}"'
+
+    def record_not_modified(self):
+        with self._lock:
+            self.stats["not_modified"] += 1
+
+    def get_or_build(
+        self,
+        endpoint: str,
+        params: Tuple,
+        tables: Tuple[str, ...],
+        builder: Callable[[], Any]
+    ) -> Tuple[bytes, str]:
+        """
+        取得快取的 JSON 位元組，依賴資料表版本變更時重新建置
+
+        Args:
+            endpoint: 端點名稱
+            params: 影響結果的參數 (需可雜湊)
+            tables: 結果所依賴的資料表
+            builder: 產生回應內容 (可 JSON 序列化的物件)
+
+        Returns:
+            (JSON 位元組, 對應此內容的 ETag)
+        """
+        key = (endpoint, params)
+        # 先取版本再建置：建置期間若有寫入，下次讀取會看到較新的版本而重建
+        tags = self.versions.snapshot(tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry["tags"] == tags:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry["body"], entry["etag"]
+                self.stats["stale"] += 1
+            self.stats["misses"] += 1
+
+        body = json.dumps(builder(), ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        etag = self.etag(endpoint, params, tables, tags)
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous["size"]
+            if len(body) <= self.max_bytes:
+                self._entries[key] = {
+                    "tags": tags, "body": body, "etag": etag, "size": len(body), "built_at": time.time()
+                }
+                self._bytes += len(body)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= evicted["size"]
+                    self.stats["evictions"] += 1
+        return body, etag
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_status(self) -> Dict:
+        """命中率與記憶體用量"""
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "table_versions": self.versions.get_status()
+            }
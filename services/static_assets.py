@@ -0,0 +1,305 @@
+"""
+靜態資源預先壓縮與指紋網址
+Index.html、設定精靈與 /static 圖檔在啟動時一次讀入並壓縮，請求時不再讀檔或壓縮：
+
+- 依 Accept-Encoding 回傳預先壓縮的版本 (gzip 使用標準函式庫最高壓縮等級；
+  安裝 brotli 套件時另提供 br)，已壓縮格式 (PNG 等) 不再壓縮
+- /static 下的檔案另有含內容雜湊的指紋網址 (/static/guling_logo.3f2a9c01b7d4.png)，
+  回應帶一年期 immutable 快取；HTML 中引用的 /static 網址建置時改寫為指紋網址
+- 入口頁面 (Index.html) 網址固定，回應 no-cache 並以 ETag 驗證 (未變更時回 304)
+- 超過門檻的大檔以 mmap 映射，不整檔讀入記憶體
+- 來源檔案變更 (修改時間、大小或目錄內容) 時自動重新建置
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import mmap
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# 值得壓縮的內容類型 (圖檔、字型多半已壓縮)
+_COMPRESSIBLE_PREFIXES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+_DIGEST_LENGTH = 12
+_STREAM_CHUNK = 64 * 1024
+
+
+class StaticAsset:
+    """單一資源：原始內容、預先壓縮版本與指紋"""
+
+    def __init__(self, url: str, path: Path, content, media_type: str, fingerprinted: bool):
+        self.url = url
+        self.path = path
+        # bytes，或大檔的 mmap
+        self.content = content
+        self.size = len(content)
+        self.media_type = media_type
+        self.digest = hashlib.sha256(content).hexdigest()[:_DIGEST_LENGTH]
+        self.fingerprinted_url = _fingerprint(url, self.digest) if fingerprinted else None
+        # {編碼: 壓縮後內容}
+        self.encodings: Dict[str, bytes] = {}
+
+    @property
+    def mapped(self) -> bool:
+        return isinstance(self.content, mmap.mmap)
+
+    def etag(self, encoding: Optional[str]) -> str:
+        """各編碼版本使用不同的 ETag"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def select_encoding(self, accept_encoding: str) -> Optional[str]:
+        """依 Accept-Encoding 選擇最小的可用版本，None 表示原始內容"""
+        if not self.encodings:
+            return None
+        accepted = _parse_accept_encoding(accept_encoding)
+        candidates = [
+            encoding for encoding in self.encodings
+            if accepted.get(encoding, accepted.get('*', 0)) > 0
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda encoding: len(self.encodings[encoding]))
+
+    def iter_content(self) -> Iterator[bytes]:
+        """分段讀取原始內容 (大檔串流用)"""
+        for offset in range(0, self.size, _STREAM_CHUNK):
+            yield self.content[offset:offset + _STREAM_CHUNK]
+
+
+class StaticAssetStore:
+    """已註冊資源的建置與查詢"""
+
+    def __init__(
+        self,
+        mmap_threshold: int = 1024 * 1024,
+        min_compress_size: int = 512,
+        max_compress_size: int = 16 * 1024 * 1024,
+        check_interval: float = 2.0
+    ):
+        """
+        初始化資源庫
+
+        Args:
+            mmap_threshold: 超過此大小的檔案以 mmap 映射 (需改寫內容的 HTML 除外)
+            min_compress_size: 小於此大小不壓縮
+            max_compress_size: 超過此大小不預先壓縮 (避免大檔壓縮結果佔用記憶體)
+            check_interval: 檢查來源檔案是否變更的最短間隔 (秒)，0 表示每次請求都檢查
+        """
+        self.mmap_threshold = mmap_threshold
+        self.min_compress_size = min_compress_size
+        self.max_compress_size = max_compress_size
+        self.check_interval = check_interval
+
+        # (網址或網址前綴, 路徑, 是否為目錄, 是否使用指紋網址, 是否改寫引用)
+        self._sources: List[Tuple[str, Path, bool, bool, bool]] = []
+        self._assets: Dict[str, StaticAsset] = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"builds": 0, "served": 0, "not_modified": 0, "compressed_hits": 0}
+
+    def add_file(self, url: str, path, fingerprint: bool = False, rewrite: bool = False):
+        """
+        註冊單一檔案
+
+        Args:
+            url: 固定網址
+            path: 檔案路徑 (不存在時略過，查詢回傳 None)
+            fingerprint: 是否提供指紋網址
+            rewrite: 是否將內容中引用的其他資源網址改寫為指紋網址 (HTML)
+        """
+        self._sources.append((url, Path(path), False, fingerprint, rewrite))
+
+    def add_directory(self, url_prefix: str, directory, fingerprint: bool = True):
+        """註冊目錄下的所有檔案 (不含子目錄)，網址為 url_prefix + 檔名"""
+        self._sources.append((url_prefix.rstrip('/') + '/', Path(directory), True, fingerprint, False))
+
+    def build(self):
+        """讀取並壓縮所有資源 (啟動時呼叫，來源變更時由 refresh() 觸發)"""
+        with self._lock:
+            self._build()
+
+    def refresh(self):
+        """來源檔案變更時重新建置 (依 check_interval 節流)"""
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self._signature is None or self._scan_signature() != self._signature:
+                self._build()
+
+    def lookup(self, url: str) -> Tuple[Optional[StaticAsset], bool]:
+        """
+        依網址查詢資源
+
+        Returns:
+            (資源, 是否可永久快取)；指紋與目前內容不符 (舊版頁面引用) 時仍回傳目前內容，但不可永久快取
+        """
+        self.refresh()
+        assets = self._assets
+        asset = assets.get(url)
+        if asset is not None:
+            return asset, False
+
+        match = _FINGERPRINT_RE.match(url)
+        if match is None:
+            return None, False
+        asset = assets.get(match.group('base') + match.group('ext'))
+        if asset is None or asset.fingerprinted_url is None:
+            return None, False
+        return asset, match.group('digest') == asset.digest
+
+    def url_for(self, url: str) -> str:
+        """固定網址對應的指紋網址 (無指紋時回傳原網址)"""
+        self.refresh()
+        asset = self._assets.get(url)
+        return asset.fingerprinted_url if asset is not None and asset.fingerprinted_url else url
+
+    def _scan_signature(self) -> Tuple:
+        entries = []
+        for _, path, is_directory, _, _ in self._sources:
+            for file_path in (_list_files(path) if is_directory else [path]):
+                try:
+                    st = file_path.stat()
+                    entries.append((str(file_path), st.st_mtime_ns, st.st_size))
+                except OSError:
+                    entries.append((str(file_path), None, None))
+        return tuple(entries)
+
+    def _build(self):
+        signature = self._scan_signature()
+        assets: Dict[str, StaticAsset] = {}
+        rewrites = []
+
+        for url, path, is_directory, fingerprint, rewrite in self._sources:
+            if is_directory:
+                for file_path in _list_files(path):
+                    assets[url + file_path.name] = self._load(url + file_path.name, file_path, fingerprint)
+            elif rewrite:
+                rewrites.append((url, path, fingerprint))
+            elif path.is_file():
+                assets[url] = self._load(url, path, fingerprint)
+
+        # 改寫引用需在被引用的資源建置完成後進行
+        mapping = {url: asset.fingerprinted_url for url, asset in assets.items() if asset.fingerprinted_url}
+        for url, path, fingerprint in rewrites:
+            if path.is_file():
+                assets[url] = self._load(url, path, fingerprint, mapping)
+
+        self._assets = assets
+        self._signature = signature
+        self.stats["builds"] += 1
+
+    def _load(self, url: str, path: Path, fingerprint: bool, rewrite: Optional[Dict[str, str]] = None) -> StaticAsset:
+        media_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if media_type.startswith('text/'):
+            media_type += '; charset=utf-8'
+
+        size = path.stat().st_size
+        if rewrite is None and size > self.mmap_threshold:
+            with open(path, 'rb') as f:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            content = path.read_bytes()
+            if rewrite:
+                content = _rewrite_references(content, rewrite)
+
+        asset = StaticAsset(url, path, content, media_type, fingerprint)
+        if (
+            media_type.startswith(_COMPRESSIBLE_PREFIXES)
+            and self.min_compress_size <= asset.size <= self.max_compress_size
+        ):
+            self._compress(asset)
+        return asset
+
+    @staticmethod
+    def _compress(asset: StaticAsset):
+        """壓縮後至少小 5% 才保留該版本"""
+        variants = {'gzip': gzip.compress(asset.content, compresslevel=9, mtime=0)}
+        if BROTLI_AVAILABLE:
+            variants['br'] = brotli.compress(bytes(asset.content), quality=11)
+        for encoding, data in variants.items():
+            if len(data) < asset.size * 0.95:
+                asset.encodings[encoding] = data
+
+    def get_status(self) -> Dict:
+        """資源清單與壓縮統計"""
+        assets = self._assets
+        return {
+            **self.stats,
+            "brotli_available": BROTLI_AVAILABLE,
+            "assets": [
+                {
+                    "url": asset.url,
+                    "fingerprinted_url": asset.fingerprinted_url,
+                    "size": asset.size,
+                    "mapped": asset.mapped,
+                    "encodings": {encoding: len(data) for encoding, data in asset.encodings.items()}
+                }
+                for asset in assets.values()
+            ]
+        }
+
+
+_FINGERPRINT_RE = re.compile(r'^(?P<base>.+)\.(?P<digest>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % _DIGEST_LENGTH)
+
+
+def _fingerprint(url: str, digest: str) -> str:
+    """/static/logo.png -> /static/logo.<digest>.png"""
+    stem, dot, ext = url.rpartition('.')
+    if not dot or '/' in ext:
+        return f"{url}.{digest}"
+    return f"{stem}.{digest}.{ext}"
+
+
+def _list_files(directory: Path) -> List[Path]:
+    try:
+        return sorted(p for p in directory.iterdir() if p.is_file() and not p.name.startswith('.'))
+    except OSError:
+        return []
+
+
+def _rewrite_references(content: bytes, mapping: Dict[str, str]) -> bytes:
+    """將引號或 url() 內的固定網址替換為指紋網址"""
+    if not mapping:
+        return content
+    pattern = re.compile(
+        rb'(?<=["\'(])(' + b'|'.join(re.escape(url.encode('utf-8')) for url in mapping) + rb')(?=["\')?#])'
+    )
+    return pattern.sub(lambda m: mapping[m.group(1).decode('utf-8')].encode('utf-8'), content)
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {編碼: q 值}"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
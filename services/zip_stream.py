@@ -0,0 +1,239 @@
+"""
+串流 ZIP 產生器
+邊產生成員內容邊輸出 ZIP 位元組，不需先寫入暫存檔；
+大型成員切塊後交由執行緒池平行壓縮 (zlib 壓縮時會釋放 GIL)；
+每個成員在輸出同時計算原始內容的 SHA-256，供 manifest 記錄
+"""
+
+import hashlib
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Executor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+
+# 壓縮切塊大小；切塊之間以前一塊末端 32KB 作為字典，壓縮率與單執行緒相近
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# raw deflate 回溯視窗大小
+_WINDOW_SIZE = 32 * 1024
+# 超過 ZIP (非 ZIP64) 欄位上限
+_ZIP32_LIMIT = 0xFFFFFFFF
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<IHHHHIIH")
+
+# 旗標: bit 3 = 大小與 CRC 寫在資料描述區, bit 11 = 檔名為 UTF-8
+_FLAG_DATA_DESCRIPTOR = 0x0008
+_FLAG_UTF8 = 0x0800
+
+MemberSource = Union[bytes, Callable[[], Iterable[bytes]]]
+
+
+def _dos_datetime(timestamp: float):
+    t = time.localtime(timestamp)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _rechunk(source: Iterable[bytes], size: int) -> Iterator[bytes]:
+    """將任意大小的輸入重新切成固定大小的塊"""
+    buffer = bytearray()
+    for piece in source:
+        buffer += piece
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _deflate_chunk(data: bytes, dictionary: Optional[bytes], last: bool, level: int) -> bytes:
+    """
+    壓縮單一切塊為 raw deflate 片段
+
+    非最後一塊以 Z_SYNC_FLUSH 收尾 (位元組對齊且不設結束旗標)，
+    各片段直接串接即為合法的單一 deflate 串流
+    """
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+class ZipStreamError(ValueError):
+    """ZIP 串流產生錯誤"""
+    pass
+
+
+class ZipStreamWriter:
+    """串流 ZIP 寫入器"""
+
+    def __init__(
+        self,
+        executor: Optional[Executor] = None,
+        compresslevel: int = 6,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_inflight: int = 4
+    ):
+        """
+        初始化寫入器
+
+        Args:
+            executor: 平行壓縮用的執行緒池，None 時單執行緒壓縮
+            compresslevel: zlib 壓縮等級
+            chunk_size: 平行壓縮的切塊大小
+            max_inflight: 同時壓縮中的切塊上限 (限制記憶體用量)
+        """
+        self.executor = executor
+        self.compresslevel = compresslevel
+        self.chunk_size = chunk_size
+        self.max_inflight = max(1, max_inflight)
+
+        self._members: List[tuple] = []
+        self.entries: List[Dict] = []
+        self._offset = 0
+
+    def add(self, name: str, source: MemberSource, mtime: Optional[float] = None):
+        """
+        加入成員 (延遲產生)
+
+        Args:
+            name: ZIP 內路徑
+            source: bytes，或呼叫後回傳位元組迭代器的函數 (輪到此成員時才呼叫)
+            mtime: 修改時間，預設為產生時間
+        """
+        self._members.append((name, source, mtime))
+
+    def stream(self) -> Iterator[bytes]:
+        """依序產生 ZIP 位元組"""
+        for name, source, mtime in self._members:
+            if isinstance(source, (bytes, bytearray)):
+                yield from self._write_buffered(name, bytes(source), mtime)
+            else:
+                yield from self._write_streamed(name, source(), mtime)
+
+        yield from self._write_central_directory()
+
+    # ========== 成員 ==========
+
+    def _emit(self, data: bytes) -> bytes:
+        self._offset += len(data)
+        if self._offset > _ZIP32_LIMIT:
+            raise ZipStreamError("ZIP 大小超過 4GB，不支援 ZIP64")
+        return data
+
+    def _write_buffered(self, name: str, data: bytes, mtime: Optional[float]) -> Iterator[bytes]:
+        """小型成員：先壓縮完成，大小與 CRC 直接寫在本地標頭"""
+        encoded_name = name.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(mtime or time.time())
+        crc = zlib.crc32(data) & 0xFFFFFFFF
+        compressed = _deflate_chunk(data, None, True, self.compresslevel)
+
+        entry = {
+            "name": name, "offset": self._offset, "flags": _FLAG_UTF8,
+            "crc": crc, "compressed_size": len(compressed), "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "dos_time": dos_time, "dos_date": dos_date
+        }
+        yield self._emit(_LOCAL_HEADER.pack(
+            0x04034B50, 20, entry["flags"], 8, dos_time, dos_date,
+            crc, len(compressed), len(data), len(encoded_name), 0
+        ) + encoded_name)
+        yield self._emit(compressed)
+        self.entries.append(entry)
+
+    def _write_streamed(self, name: str, source: Iterable[bytes], mtime: Optional[float]) -> Iterator[bytes]:
+        """串流成員：邊讀邊壓縮，結尾以資料描述區補上大小與 CRC"""
+        encoded_name = name.encode('utf-8')
+        dos_time, dos_date = _dos_datetime(mtime or time.time())
+        flags = _FLAG_UTF8 | _FLAG_DATA_DESCRIPTOR
+
+        entry = {
+            "name": name, "offset": self._offset, "flags": flags,
+            "dos_time": dos_time, "dos_date": dos_date
+        }
+        yield self._emit(_LOCAL_HEADER.pack(
+            0x04034B50, 20, flags, 8, dos_time, dos_date,
+            0, 0, 0, len(encoded_name), 0
+        ) + encoded_name)
+
+        crc = 0
+        size = 0
+        compressed_size = 0
+        digest = hashlib.sha256()
+        for raw, compressed in self._compress_chunks(_rechunk(source, self.chunk_size)):
+            crc = zlib.crc32(raw, crc)
+            digest.update(raw)
+            size += len(raw)
+            compressed_size += len(compressed)
+            if compressed:
+                yield self._emit(compressed)
+
+        entry.update(crc=crc & 0xFFFFFFFF, size=size, compressed_size=compressed_size, sha256=digest.hexdigest())
+        if size > _ZIP32_LIMIT:
+            raise ZipStreamError(f"成員 {name} 超過 4GB，不支援 ZIP64")
+
+        yield self._emit(_DATA_DESCRIPTOR.pack(0x08074B50, entry["crc"], compressed_size, size))
+        self.entries.append(entry)
+
+    def _compress_chunks(self, chunks: Iterator[bytes]) -> Iterator[tuple]:
+        """
+        依序回傳 (原始切塊, 壓縮片段)
+
+        有執行緒池時，最多 max_inflight 塊同時壓縮，輸出順序與輸入相同
+        """
+        inflight = deque()
+        previous_tail = None
+        pending = next(chunks, None)
+
+        if pending is None:
+            yield b"", _deflate_chunk(b"", None, True, self.compresslevel)
+            return
+
+        while pending is not None:
+            following = next(chunks, None)
+            last = following is None
+
+            if self.executor:
+                future = self.executor.submit(_deflate_chunk, pending, previous_tail, last, self.compresslevel)
+                inflight.append((pending, future))
+                if len(inflight) >= self.max_inflight:
+                    raw, done = inflight.popleft()
+                    yield raw, done.result()
+            else:
+                yield pending, _deflate_chunk(pending, previous_tail, last, self.compresslevel)
+
+            previous_tail = pending[-_WINDOW_SIZE:]
+            pending = following
+
+        while inflight:
+            raw, done = inflight.popleft()
+            yield raw, done.result()
+
+    # ========== 中央目錄 ==========
+
+    def _write_central_directory(self) -> Iterator[bytes]:
+        start = self._offset
+        records = []
+        for entry in self.entries:
+            encoded_name = entry["name"].encode('utf-8')
+            records.append(_CENTRAL_HEADER.pack(
+                0x02014B50, (3 << 8) | 20, 20, entry["flags"], 8,
+                entry["dos_time"], entry["dos_date"],
+                entry["crc"], entry["compressed_size"], entry["size"],
+                len(encoded_name), 0, 0, 0, 0,
+                (0o100644 << 16), entry["offset"]
+            ) + encoded_name)
+
+        directory = b"".join(records)
+        yield self._emit(directory)
+        yield self._emit(_END_RECORD.pack(
+            0x06054B50, 0, 0, len(self.entries), len(self.entries),
+            len(directory), start, 0
+        ))
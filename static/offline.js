@@ -0,0 +1,329 @@
+// 醫療站庫存管理系統 - 離線鏡像與待送佇列
+//
+// - 鏡像: 物品、血品、設備存於 IndexedDB，以 /api/sync/changes 差異同步；頁面先由鏡像立即顯示
+// - 待送佇列: 區網中斷時的寫入存入 outbox (IndexedDB，重新整理或重開機後仍保留)，
+//   連線恢復後依序以 /api/batch 分批重送
+// - 每筆寫入在第一次送出時即產生 Idempotency-Key，重送沿用同一鍵；
+//   伺服器已收到 (只是回應遺失) 的寫入不會重複執行
+// - 尚未送出的寫入以疊加方式反映在鏡像讀取結果 (snapshot)，伺服器資料同步後仍保留
+(function () {
+    'use strict';
+
+    const DB_NAME = 'mirs-offline';
+    const DB_VERSION = 1;
+    const BATCH_SIZE = 50;
+
+    // 操作類型 -> 單一端點 (與伺服器 BATCH_OPERATION_ENDPOINTS 相同，{參數} 自資料移至路徑)
+    const ENDPOINTS = {
+        receive: '/receive',
+        consume: '/consume',
+        blood_receive: '/blood/receive',
+        blood_consume: '/blood/consume',
+        equipment_check: '/equipment/check/{equipmentId}',
+        dispense_emergency: '/pharmacy/dispense/emergency',
+        dispense_normal: '/pharmacy/dispense/normal',
+        surgery_record: '/surgery/record'
+    };
+
+    let dbPromise = null;
+    let flushing = null;
+
+    function openDb() {
+        if (!dbPromise) {
+            dbPromise = new Promise((resolve, reject) => {
+                const request = indexedDB.open(DB_NAME, DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('items', { keyPath: 'code' });
+                    db.createObjectStore('blood', { keyPath: 'key' });
+                    db.createObjectStore('equipment', { keyPath: 'id' });
+                    db.createObjectStore('meta', { keyPath: 'name' });
+                    db.createObjectStore('outbox', { keyPath: 'seq', autoIncrement: true });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return dbPromise;
+    }
+
+    function promisify(request) {
+        return new Promise((resolve, reject) => {
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    function completed(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = () => resolve();
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    async function getAll(storeName) {
+        const db = await openDb();
+        return promisify(db.transaction(storeName).objectStore(storeName).getAll());
+    }
+
+    function newKey() {
+        if (self.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}-${Math.random().toString(36).slice(2)}`;
+    }
+
+    // 依操作類型組成單一端點的路徑與本文
+    function directRequest(op, data) {
+        const body = { ...data };
+        const path = ENDPOINTS[op].replace(/\{(\w+)\}/g, (_, name) => {
+            const value = body[name];
+            delete body[name];
+            return encodeURIComponent(value);
+        });
+        return { path, body };
+    }
+
+    // ========== 鏡像 ==========
+
+    // 取得 since_version 之後的變更並寫入鏡像 (同一 IndexedDB 交易)；切換站點時重新取得完整資料
+    async function sync(apiUrl, stationId) {
+        const db = await openDb();
+        const meta = await promisify(db.transaction('meta').objectStore('meta').get('mirror'));
+        const since = meta && meta.stationId === stationId ? meta.version : 0;
+
+        const url = `${apiUrl}/sync/changes?since_version=${since}&station_id=${encodeURIComponent(stationId)}`;
+        const response = await fetch(url, { cache: 'no-store' });
+        if (!response.ok) throw new Error(`同步失敗 (HTTP ${response.status})`);
+        const data = await response.json();
+
+        const tx = db.transaction(['items', 'blood', 'equipment', 'meta'], 'readwrite');
+        const items = tx.objectStore('items');
+        const blood = tx.objectStore('blood');
+        const equipment = tx.objectStore('equipment');
+        if (data.reset) {
+            items.clear();
+            blood.clear();
+            equipment.clear();
+        }
+        data.items.forEach((row) => items.put(row));
+        data.bloodInventory.forEach((row) => blood.put({ ...row, key: `${row.blood_type}|${row.station_id}` }));
+        data.equipment.forEach((row) => equipment.put(row));
+        data.deleted.items.forEach((key) => items.delete(key));
+        data.deleted.blood.forEach((key) => blood.delete(key));
+        data.deleted.equipment.forEach((key) => equipment.delete(key));
+        tx.objectStore('meta').put({ name: 'mirror', stationId, version: data.version, syncedAt: Date.now() });
+        await completed(tx);
+        return data;
+    }
+
+    // 鏡像內容加上尚未送出的寫入
+    async function snapshot() {
+        const [items, blood, equipment, outbox] = await Promise.all([
+            getAll('items'), getAll('blood'), getAll('equipment'), getAll('outbox')
+        ]);
+
+        // 與伺服器清單相同的順序: 一般物品 (分類、名稱) 在前，藥品在後
+        const medicineLast = (row) => (row.category === '藥品' ? 1 : 0);
+        items.sort((a, b) => medicineLast(a) - medicineLast(b)
+            || (a.category || '').localeCompare(b.category || '')
+            || (a.name || '').localeCompare(b.name || ''));
+        equipment.sort((a, b) => (a.name || '').localeCompare(b.name || ''));
+
+        const state = {
+            items: new Map(items.map((row) => [row.code, row])),
+            blood: new Map(blood.map((row) => [row.key, row])),
+            equipment: new Map(equipment.map((row) => [row.id, row]))
+        };
+        outbox.filter((entry) => entry.status === 'PENDING').forEach((entry) => overlay(state, entry));
+
+        return {
+            items: [...state.items.values()],
+            blood: [...state.blood.values()],
+            equipment: [...state.equipment.values()],
+            pending: outbox.filter((entry) => entry.status === 'PENDING').length
+        };
+    }
+
+    function overlay(state, entry) {
+        const data = entry.data;
+        const adjustStock = (code, delta) => {
+            const row = state.items.get(code);
+            if (row) state.items.set(code, { ...row, current_stock: (row.current_stock || 0) + delta, pending: true });
+        };
+        const adjustBlood = (delta) => {
+            const key = `${data.bloodType}|${data.stationId}`;
+            const row = state.blood.get(key) || { key, blood_type: data.bloodType, station_id: data.stationId, quantity: 0 };
+            state.blood.set(key, { ...row, quantity: (row.quantity || 0) + delta, pending: true });
+        };
+
+        switch (entry.op) {
+            case 'receive': adjustStock(data.itemCode, data.quantity); break;
+            case 'consume': adjustStock(data.itemCode, -data.quantity); break;
+            case 'dispense_emergency': adjustStock(data.medicineCode, -data.quantity); break;
+            case 'blood_receive': adjustBlood(data.quantity); break;
+            case 'blood_consume': adjustBlood(-data.quantity); break;
+            case 'equipment_check': {
+                const row = state.equipment.get(data.equipmentId);
+                if (row) {
+                    state.equipment.set(data.equipmentId, {
+                        ...row,
+                        status: data.status,
+                        power_level: data.powerLevel,
+                        last_check: new Date(entry.createdAt).toISOString(),
+                        pending: true
+                    });
+                }
+                break;
+            }
+        }
+    }
+
+    // ========== 待送佇列 ==========
+
+    async function enqueue(op, data, key, label) {
+        const db = await openDb();
+        const tx = db.transaction('outbox', 'readwrite');
+        tx.objectStore('outbox').add({
+            op, data, key, label,
+            status: 'PENDING',
+            createdAt: Date.now(),
+            attempts: 0,
+            error: null
+        });
+        await completed(tx);
+    }
+
+    async function outboxStatus() {
+        const entries = await getAll('outbox');
+        return {
+            pending: entries.filter((entry) => entry.status === 'PENDING').length,
+            failed: entries.filter((entry) => entry.status === 'FAILED')
+        };
+    }
+
+    /**
+     * 送出寫入；區網中斷 (或伺服器忙碌 503) 時存入佇列
+     *
+     * 佇列中仍有待送資料時新的寫入也排入佇列，維持操作順序
+     * @returns {Promise<{queued: boolean, response?: Response, data?: object}>}
+     */
+    async function send(apiUrl, op, data, label) {
+        const key = newKey();
+        if (navigator.onLine === false || (await outboxStatus()).pending > 0) {
+            await enqueue(op, data, key, label);
+            return { queued: true };
+        }
+
+        const { path, body } = directRequest(op, data);
+        let response;
+        try {
+            response = await fetch(`${apiUrl}${path}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': key },
+                body: JSON.stringify(body)
+            });
+        } catch (error) {
+            // 無法確定伺服器是否已收到：以同一鍵排入佇列，重送時由伺服器去除重複
+            await enqueue(op, data, key, label);
+            return { queued: true };
+        }
+        if (response.status === 503) {
+            await enqueue(op, data, key, label);
+            return { queued: true };
+        }
+        const result = await response.json().catch(() => ({}));
+        return { queued: false, response, data: result };
+    }
+
+    async function updateEntries(changes) {
+        const db = await openDb();
+        const tx = db.transaction('outbox', 'readwrite');
+        const store = tx.objectStore('outbox');
+        changes.forEach(({ entry, remove }) => (remove ? store.delete(entry.seq) : store.put(entry)));
+        await completed(tx);
+    }
+
+    /**
+     * 依序分批重送佇列 (同時只有一個重送流程)
+     *
+     * 成功或伺服器判定重複的寫入自佇列移除；資料錯誤 (4xx) 標記為 FAILED 保留供檢視；
+     * 網路中斷、409 (處理中) 或 5xx 保留在佇列稍後重試
+     * @returns {Promise<{sent: number, failed: Array, remaining: number, error?: string}>}
+     */
+    function flush(apiUrl) {
+        if (flushing) return flushing;
+
+        flushing = (async () => {
+            const summary = { sent: 0, failed: [], remaining: 0 };
+            try {
+                while (true) {
+                    const entries = (await getAll('outbox'))
+                        .filter((entry) => entry.status === 'PENDING')
+                        .slice(0, BATCH_SIZE);
+                    if (!entries.length) break;
+
+                    const response = await fetch(`${apiUrl}/batch`, {
+                        method: 'POST',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: JSON.stringify({
+                            atomic: false,
+                            operations: entries.map((entry) => ({ op: entry.op, data: entry.data, idempotencyKey: entry.key }))
+                        })
+                    });
+
+                    // 驗證失敗時整批未執行：標記有問題的項目，其餘下一輪重送
+                    if (response.status === 422) {
+                        const detail = (await response.json()).detail;
+                        const invalid = Array.isArray(detail) ? detail : [];
+                        const changes = invalid.filter((e) => entries[e.index]).map((e) => {
+                            const entry = { ...entries[e.index], status: 'FAILED', error: JSON.stringify(e.error) };
+                            summary.failed.push(entry);
+                            return { entry };
+                        });
+                        if (!changes.length) throw new Error('批次驗證失敗');
+                        await updateEntries(changes);
+                        continue;
+                    }
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+                    const body = await response.json();
+                    let progressed = false;
+                    const changes = body.results.map((result) => {
+                        const entry = { ...entries[result.index], attempts: entries[result.index].attempts + 1 };
+                        if (result.success) {
+                            summary.sent += 1;
+                            progressed = true;
+                            return { entry, remove: true };
+                        }
+                        if (result.status_code && result.status_code < 500 && result.status_code !== 409) {
+                            entry.status = 'FAILED';
+                            entry.error = typeof result.error === 'string' ? result.error : JSON.stringify(result.error);
+                            summary.failed.push(entry);
+                            progressed = true;
+                        } else {
+                            entry.error = result.error || null;
+                        }
+                        return { entry };
+                    });
+                    await updateEntries(changes);
+                    if (!progressed) break;
+                }
+            } catch (error) {
+                summary.error = error.message;
+            }
+            summary.remaining = (await outboxStatus()).pending;
+            return summary;
+        })().finally(() => {
+            flushing = null;
+        });
+        return flushing;
+    }
+
+    // 移除已檢視的失敗項目
+    async function clearFailed() {
+        const entries = (await getAll('outbox')).filter((entry) => entry.status === 'FAILED');
+        await updateEntries(entries.map((entry) => ({ entry, remove: true })));
+    }
+
+    window.MirsOffline = { sync, snapshot, send, flush, outboxStatus, clearFailed };
+})();
@@ -0,0 +1,77 @@
+// 醫療站庫存管理系統 - Service Worker
+// 快取頁面外殼 (Index.html、離線模組、Logo 與 CDN 腳本)，區網中斷時仍可開啟頁面；
+// 資料由頁面的 IndexedDB 鏡像提供 (static/offline.js)，API 請求不經快取。
+// 下列 /static 網址由伺服器改寫為含內容雜湊的指紋網址，資源更新時本檔內容隨之改變而觸發更新。
+
+const SHELL_CACHE = 'mirs-shell';
+const CDN_CACHE = 'mirs-cdn';
+const SHELL_URLS = [
+    '/Index.html',
+    '/static/offline.js',
+    '/static/guling_logo.png',
+    '/static/iRehab_logo.png'
+];
+const CDN_HOSTS = ['cdn.tailwindcss.com', 'cdn.jsdelivr.net'];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then((cache) => cache.addAll(SHELL_URLS.map((url) => new Request(url, { cache: 'reload' }))))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    // 移除舊版指紋網址的快取
+    const current = new Set(SHELL_URLS.map((url) => new URL(url, self.location.origin).href));
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then((cache) => cache.keys().then((requests) => Promise.all(
+                requests.filter((request) => !current.has(request.url)).map((request) => cache.delete(request))
+            )))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+
+    const url = new URL(request.url);
+    if (url.origin === self.location.origin) {
+        if (url.pathname === '/' || url.pathname === '/Index.html') {
+            event.respondWith(networkFirst(request, '/Index.html'));
+        } else if (url.pathname.startsWith('/static/')) {
+            event.respondWith(cacheFirst(request, SHELL_CACHE));
+        }
+        return;
+    }
+    if (CDN_HOSTS.includes(url.hostname)) {
+        event.respondWith(cacheFirst(request, CDN_CACHE));
+    }
+});
+
+// 頁面：優先取得最新版，失敗時使用快取 (/ 為轉址，只在離線時以快取的頁面回應)
+async function networkFirst(request, fallbackUrl) {
+    const cache = await caches.open(SHELL_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.ok && new URL(request.url).pathname === fallbackUrl) await cache.put(fallbackUrl, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(fallbackUrl);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+// 指紋網址與 CDN 版本內容不變：有快取即使用
+async function cacheFirst(request, cacheName) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (response.ok || response.type === 'opaque') await cache.put(request, response.clone());
+    return response;
+}
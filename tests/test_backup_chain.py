@@ -0,0 +1,155 @@
+"""
+增量備份鏈：原地修改與刪除的資料列需出現在差異中，還原後與線上資料庫一致
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.backup_chain import BackupChain
+
+
+def _create_database(path: Path):
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE dispense_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            medicine_code TEXT NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMP
+        );
+        CREATE TABLE emergency_blood_bags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            blood_type TEXT NOT NULL,
+            status TEXT NOT NULL
+        );
+        CREATE TABLE inventory_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_code TEXT NOT NULL,
+            quantity INTEGER NOT NULL
+        );
+        CREATE TABLE medicines (
+            medicine_code TEXT PRIMARY KEY,
+            generic_name TEXT NOT NULL,
+            current_stock INTEGER DEFAULT 0,
+            updated_at TIMESTAMP
+        );
+        CREATE TABLE items (
+            item_code TEXT PRIMARY KEY,
+            item_name TEXT NOT NULL
+        );
+        CREATE TABLE stations (
+            station_code TEXT NOT NULL,
+            last_sync_at TIMESTAMP
+        );
+        INSERT INTO medicines (medicine_code, generic_name, current_stock, updated_at)
+        VALUES ('MED-1', 'Acetaminophen', 100, '2026-01-01 08:00:00');
+        INSERT INTO items (item_code, item_name) VALUES ('ITEM-1', '紗布'), ('ITEM-2', '繃帶');
+        INSERT INTO stations (station_code, last_sync_at) VALUES ('BORP-01', NULL);
+        INSERT INTO dispense_records (medicine_code, status, updated_at)
+        VALUES ('MED-1', 'PENDING', '2026-01-01 08:00:00');
+        INSERT INTO emergency_blood_bags (blood_type, status) VALUES ('O+', 'AVAILABLE');
+        INSERT INTO inventory_events (item_code, quantity) VALUES ('ITEM-1', 5);
+    """)
+    conn.commit()
+    conn.close()
+
+
+def _restore(chain: BackupChain, tmp_path: Path, name: str) -> sqlite3.Connection:
+    target = tmp_path / name
+    chain.restore(str(target))
+    return sqlite3.connect(str(target))
+
+
+def test_delta_captures_rows_changed_in_place(tmp_path):
+    db_path = tmp_path / "source.db"
+    _create_database(db_path)
+    chain = BackupChain(str(tmp_path / "chain"), str(db_path))
+    assert chain.create()["link"]["type"] == "BASE"
+
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("""
+        UPDATE dispense_records SET status = 'APPROVED', updated_at = '2026-01-01 09:00:00' WHERE id = 1
+    """)
+    conn.execute("UPDATE emergency_blood_bags SET status = 'USED' WHERE id = 1")
+    conn.execute("INSERT INTO inventory_events (item_code, quantity) VALUES ('ITEM-1', 3)")
+    conn.commit()
+    conn.close()
+
+    result = chain.create()
+    assert result["skipped"] is False
+    assert result["link"]["type"] == "DELTA"
+
+    restored = _restore(chain, tmp_path, "restored.db")
+    try:
+        assert restored.execute("SELECT status FROM dispense_records WHERE id = 1").fetchone()[0] == 'APPROVED'
+        assert restored.execute("SELECT status FROM emergency_blood_bags WHERE id = 1").fetchone()[0] == 'USED'
+        assert restored.execute("SELECT COUNT(*) FROM inventory_events").fetchone()[0] == 2
+    finally:
+        restored.close()
+
+
+def test_restore_includes_dispense_and_delete_between_links(tmp_path):
+    db_path = tmp_path / "source.db"
+    _create_database(db_path)
+    chain = BackupChain(str(tmp_path / "chain"), str(db_path))
+    chain.create()
+
+    # 與 main.py 相同的寫法：扣庫存與更新同步時間都不更新 updated_at
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("UPDATE medicines SET current_stock = current_stock - ? WHERE medicine_code = ?", (5, 'MED-1'))
+    conn.execute("UPDATE stations SET last_sync_at = '2026-01-01 10:00:00' WHERE station_code = 'BORP-01'")
+    conn.execute("DELETE FROM items WHERE item_code = ?", ('ITEM-2',))
+    conn.execute("INSERT INTO items (item_code, item_name) VALUES ('ITEM-3', '口罩')")
+    conn.commit()
+    conn.close()
+    assert chain.create()["link"]["type"] == "DELTA"
+
+    # 下一個環節刪除前一環節新增的資料列
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("DELETE FROM items WHERE item_code = ?", ('ITEM-3',))
+    conn.execute("DELETE FROM inventory_events WHERE id = 1")
+    conn.commit()
+    conn.close()
+    assert chain.create()["link"]["type"] == "DELTA"
+
+    restored = _restore(chain, tmp_path, "restored.db")
+    try:
+        assert restored.execute("SELECT current_stock FROM medicines").fetchone()[0] == 95
+        assert restored.execute("SELECT last_sync_at FROM stations").fetchone()[0] == '2026-01-01 10:00:00'
+        assert [r[0] for r in restored.execute("SELECT item_code FROM items ORDER BY item_code")] == ['ITEM-1']
+        assert restored.execute("SELECT COUNT(*) FROM inventory_events").fetchone()[0] == 0
+    finally:
+        restored.close()
+
+
+def test_unchanged_database_skips_delta(tmp_path):
+    db_path = tmp_path / "source.db"
+    _create_database(db_path)
+    chain = BackupChain(str(tmp_path / "chain"), str(db_path))
+    chain.create()
+
+    assert chain.create()["skipped"] is True
+
+
+def test_restore_to_earlier_link_keeps_previous_state(tmp_path):
+    db_path = tmp_path / "source.db"
+    _create_database(db_path)
+    chain = BackupChain(str(tmp_path / "chain"), str(db_path))
+    base = chain.create()["link"]
+
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("UPDATE emergency_blood_bags SET status = 'USED' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    chain.create()
+
+    target = tmp_path / "earlier.db"
+    chain.restore(str(target), upto_seq=base["seq"])
+    restored = sqlite3.connect(str(target))
+    try:
+        assert restored.execute("SELECT status FROM emergency_blood_bags WHERE id = 1").fetchone()[0] == 'AVAILABLE'
+    finally:
+        restored.close()
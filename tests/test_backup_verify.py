@@ -0,0 +1,82 @@
+"""
+備份包驗證：雜湊不符、夾帶檔案、manifest 被移除雜湊值時皆不可判定為有效
+"""
+
+import hashlib
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.backup_verify import MANIFEST_NAME, verify_archive
+
+MEMBERS = {
+    "database/medical_inventory.db": b"SQLite format 3\0" + b"\1" * 4096,
+    "exports/inventory.csv": "代碼,名稱,數量\nITEM-1,紗布,10\n".encode("utf-8"),
+}
+
+
+def _write_archive(path: Path, manifest_files: dict, extra: dict = None):
+    manifest = {"manifest_version": 2, "station_id": "TC-01", "files": manifest_files}
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in {**MEMBERS, **(extra or {})}.items():
+            archive.writestr(name, data)
+        archive.writestr(MANIFEST_NAME, json.dumps(manifest))
+
+
+def _hashed_files() -> dict:
+    return {
+        name: {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+        for name, data in MEMBERS.items()
+    }
+
+
+def test_intact_archive_is_valid(tmp_path):
+    path = tmp_path / "backup.zip"
+    _write_archive(path, _hashed_files())
+
+    result = verify_archive(str(path), workers=2)
+
+    assert result["valid"] is True
+    assert result["verified"] is True
+    assert result["checked"] == 2
+
+
+def test_stripped_manifest_is_not_valid(tmp_path):
+    path = tmp_path / "backup.zip"
+    files = _hashed_files()
+    files["database/medical_inventory.db"] = {"size": files["database/medical_inventory.db"]["size"]}
+    _write_archive(path, files)
+
+    result = verify_archive(str(path), workers=2)
+
+    assert result["valid"] is False
+    assert result["verified"] is False
+    assert result["failed"] == 0
+    assert result["unverified"] == ["database/medical_inventory.db"]
+
+
+def test_tampered_and_unlisted_members_fail(tmp_path):
+    path = tmp_path / "backup.zip"
+    files = _hashed_files()
+    files["exports/inventory.csv"]["sha256"] = "0" * 64
+    _write_archive(path, files, extra={"exports/extra.csv": b"x"})
+
+    result = verify_archive(str(path), workers=2)
+
+    assert result["valid"] is False
+    assert result["failed"] == 1
+    assert result["unlisted"] == ["exports/extra.csv"]
+
+
+def test_empty_manifest_is_not_verified(tmp_path):
+    path = tmp_path / "backup.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr(MANIFEST_NAME, json.dumps({"files": {}}))
+
+    result = verify_archive(str(path))
+
+    assert result["valid"] is False
+    assert result["verified"] is False
@@ -0,0 +1,55 @@
+"""
+匯出行程池串流：子行程產生完即釋放，不等待讀取緩慢的接收端；spool 檔於結束時刪除
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.export_worker import STREAM_CHUNK_BYTES, ExportWorkerPool
+
+
+def _produce(count: int):
+    for index in range(count):
+        yield (f"{index:08d}," + "x" * 1000 + "\n").encode("ascii")
+
+
+def _wait_idle(pool: ExportWorkerPool, timeout: float = 10) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pool.get_status()["running"] == 0:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_stream_releases_worker_before_reader_finishes(tmp_path):
+    pool = ExportWorkerPool(max_workers=1, spool_dir=str(tmp_path))
+    pool.start()
+    try:
+        expected = b"".join(_produce(2000))
+        chunks = pool.stream(_produce, 2000, job="csv:test")
+        received = [next(chunks)]
+
+        # 接收端只讀了第一段，子行程仍可寫完並釋放
+        assert _wait_idle(pool)
+        assert pool.call(len, "abc", job="other") == 3
+
+        received.extend(chunks)
+        assert b"".join(received) == expected
+        assert all(len(chunk) <= STREAM_CHUNK_BYTES for chunk in received)
+        assert list(tmp_path.iterdir()) == []
+    finally:
+        pool.shutdown()
+
+
+def test_closed_stream_removes_spool(tmp_path):
+    pool = ExportWorkerPool(max_workers=0, spool_dir=str(tmp_path))
+    chunks = pool.stream(_produce, 200000, job="csv:test")
+    next(chunks)
+    chunks.close()
+
+    assert _wait_idle(pool)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,54 @@
+"""
+exports/ 保留政策：只清理指定樣式的暫存檔，不刪除範例與版控檔案
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.backup_service import apply_retention
+
+RETENTION_TARGETS = (("temp", "verify_*.zip"), ("temp", "restore_*.db"), ("temp", "*.csv"))
+
+
+def _touch(path: Path, age_days: float = 0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x")
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+
+
+def test_retention_only_removes_generated_files(tmp_path):
+    kept = [
+        tmp_path / ".gitkeep",
+        tmp_path / "gitkeep.txt",
+        tmp_path / "test_station_a_export.json",
+        tmp_path / "emergency_backup_TC-01_20251110_220026.zip",
+        tmp_path / "temp" / "notes.txt",
+    ]
+    generated = [
+        tmp_path / "temp" / "verify_20260101_080000_000001.zip",
+        tmp_path / "temp" / "restore_20260101_080000_000001.db",
+        tmp_path / "temp" / "inventory_20260101_080000.csv",
+    ]
+    for path in kept + generated:
+        _touch(path, age_days=30)
+
+    removed = []
+    for directory, pattern in RETENTION_TARGETS:
+        removed += apply_retention(str(tmp_path / directory), pattern, max_files=20, max_age_days=7)
+
+    assert sorted(removed) == sorted(str(p) for p in generated)
+    assert all(p.exists() for p in kept)
+
+
+def test_retention_keeps_newest_files_by_count(tmp_path):
+    for index in range(5):
+        _touch(tmp_path / f"restore_{index}.db", age_days=5 - index)
+
+    removed = apply_retention(str(tmp_path), "restore_*.db", max_files=2, max_age_days=7)
+
+    assert sorted(Path(p).name for p in removed) == ["restore_0.db", "restore_1.db", "restore_2.db"]
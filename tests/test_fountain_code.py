@@ -0,0 +1,47 @@
+"""
+噴泉碼：漏幀、亂序仍可還原；實測額外幀比例；拒絕超出上限的幀標頭
+"""
+
+import base64
+import random
+import sys
+import zlib
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.fountain_code import FRAME_HEADER, FountainDecoder, FountainEncoder, FountainError
+from scripts.benchmark_fountain_code import DEFAULT_PACKAGE, run_trial
+
+
+def _payload() -> bytes:
+    return zlib.compress(DEFAULT_PACKAGE.read_bytes(), 9)
+
+
+def test_decodes_real_package_with_dropped_frames():
+    payload = _payload()
+    rng = random.Random(7)
+    trials = [run_trial(payload, 64, 0.3, rng, transfer_id=i) for i in range(10)]
+
+    k = trials[0]["k"]
+    overhead = sum(t["frames_used"] for t in trials) / (k * len(trials)) - 1
+    # 區塊數數十時平均額外幀比例約 30%
+    assert 0 <= overhead < 0.8
+    assert all(t["frames_shown"] > t["frames_used"] for t in trials)
+
+
+def test_rejects_oversized_header_before_allocating():
+    frame = base64.b64encode(FRAME_HEADER.pack(b"MF", 1, 7, 256 * 1024 * 1024, 1024, 0, 1) + b"\0" * 1024)
+    decoder = FountainDecoder(max_data_length=1024 * 1024)
+    with pytest.raises(FountainError):
+        decoder.add_frame(frame.decode("ascii"))
+    assert decoder.k == 0
+
+
+def test_rejects_block_size_outside_range():
+    encoder = FountainEncoder(b"x" * 1000, block_size=16)
+    decoder = FountainDecoder(min_block_size=64)
+    with pytest.raises(FountainError):
+        decoder.add_frame(encoder.frames(1)[0])
@@ -0,0 +1,95 @@
+"""
+冪等鍵：逾時的執行中標記不可重新執行；回應與寫入同一交易保存
+"""
+
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.idempotency import IN_PROGRESS, NEW, REPLAY, UNKNOWN, IdempotencyStore
+
+
+def _store(tmp_path: Path, **kwargs) -> IdempotencyStore:
+    path = tmp_path / "keys.db"
+    conn = sqlite3.connect(str(path))
+    conn.executescript("""
+        CREATE TABLE idempotency_keys (
+            idempotency_key TEXT PRIMARY KEY,
+            fingerprint TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'IN_PROGRESS',
+            status_code INTEGER,
+            content_type TEXT,
+            body BLOB,
+            created_at REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE TABLE stock (code TEXT PRIMARY KEY, quantity INTEGER NOT NULL);
+        INSERT INTO stock VALUES ('MED-1', 100);
+    """)
+    conn.commit()
+    conn.close()
+
+    def connect():
+        conn = sqlite3.connect(str(path))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    return IdempotencyStore(connect, **kwargs)
+
+
+def _age_key(store: IdempotencyStore, key: str, seconds: float):
+    conn = store.connect()
+    conn.execute("UPDATE idempotency_keys SET created_at = created_at - ? WHERE idempotency_key = ?", (seconds, key))
+    conn.commit()
+    conn.close()
+
+
+def test_stale_in_progress_key_is_not_executed_again(tmp_path):
+    store = _store(tmp_path, ttl_seconds=86400, lock_timeout=120)
+    assert store.reserve("k1", "fp")[0] == NEW
+    assert store.reserve("k1", "fp")[0] == IN_PROGRESS
+
+    # 寫入已提交、記錄回應前斷電：標記遺留為執行中
+    _age_key(store, "k1", 600)
+    assert store.reserve("k1", "fp")[0] == UNKNOWN
+    assert store.reserve("k1", "fp")[0] == UNKNOWN
+
+    # 原請求最終完成時仍可重播
+    store.complete("k1", 201, "application/json", b'{"ok":true}')
+    state, record = store.reserve("k1", "fp")
+    assert state == REPLAY
+    assert record["body"] == b'{"ok":true}'
+
+
+def test_expired_key_can_be_reused(tmp_path):
+    store = _store(tmp_path, ttl_seconds=60, lock_timeout=120)
+    store.reserve("k1", "fp")
+    _age_key(store, "k1", 3600)
+
+    assert store.reserve("k1", "fp")[0] == NEW
+
+
+def test_complete_in_write_transaction_rolls_back_with_write(tmp_path):
+    store = _store(tmp_path, ttl_seconds=86400)
+    store.reserve("k1", "fp")
+
+    conn = store.connect()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("UPDATE stock SET quantity = quantity - 5 WHERE code = 'MED-1'")
+    store.complete("k1", 201, "application/json", b"{}", cursor=cursor)
+    conn.rollback()
+    conn.close()
+    assert store.reserve("k1", "fp")[0] == IN_PROGRESS
+
+    conn = store.connect()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("UPDATE stock SET quantity = quantity - 5 WHERE code = 'MED-1'")
+    store.complete("k1", 201, "application/json", b"{}", cursor=cursor)
+    conn.commit()
+    assert conn.execute("SELECT quantity FROM stock").fetchone()[0] == 95
+    conn.close()
+    assert store.reserve("k1", "fp")[0] == REPLAY